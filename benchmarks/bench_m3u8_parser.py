@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+M3U8主播放列表解析微基准
+
+对比当前按标签切分的解析器parse_m3u8_url与旧版逐行向前查找URL的实现,
+分别使用真实规模(Twitch usher返回的6档画质)、超大播放列表和相对URI播放列表。
+新实现按RFC 8216完整解析属性列表(引号内的逗号不会截断属性), 并额外解析了#EXT-X-MEDIA和VIDEO分组,
+相对URI按base_url补全, 结果中的耗时包含这部分工作, 在绝对URI的播放列表上比旧实现慢;
+旧实现遇到相对URI时退化为O(n^2)。两个实现交替计时, 取最小值。
+
+    python benchmarks/bench_m3u8_parser.py [--repeat 5] [--large 20000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from loguru import logger
+
+from twitch_recoder.common.m3u8_parser import parse_m3u8_url
+from twitch_recoder.types.typeinfo import StreamInfo
+
+
+def legacy_parse_m3u8_url(m3u8_url: str) -> list[StreamInfo]:
+    """重构前的parse_m3u8_url, 仅用于对比"""
+    streams = []
+    lines = m3u8_url.split("\n")
+
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF"):
+            bandwidth = None
+            resolution = None
+            frame_rate = None
+            codecs = None
+            url = None
+
+            if "BANDWIDTH=" in line:
+                bandwidth = int(line.split("BANDWIDTH=")[1].split(",")[0])
+
+            if "RESOLUTION=" in line:
+                resolution = line.split("RESOLUTION=")[1].split(",")[0]
+
+            if "FRAME-RATE=" in line:
+                frame_rate = float(line.split("FRAME-RATE=")[1].split(",")[0])
+
+            if "CODECS=" in line:
+                codecs = line.split('CODECS="')[1].split('"')[0]
+
+            for next_index in range(index + 1, len(lines)):
+                next_line = lines[next_index].strip()
+                if next_line.startswith("https://"):
+                    url = next_line
+                    break
+
+            if url:
+                stream_info = StreamInfo(
+                    url=url,
+                    resolution=resolution or "未知",
+                    bandwidth=bandwidth or 0,
+                    frame_rate=frame_rate or 0.0,
+                    codecs=codecs or "未知",
+                )
+                streams.append(stream_info)
+                logger.debug(f"找到流媒体: {stream_info}")
+
+    return streams
+
+
+TWITCH_VARIANTS = [
+    ("chunked", "1080p60 (source)", 8534030, "1920x1080", "avc1.64002A,mp4a.40.2", 60.0),
+    ("720p60", "720p60", 3422999, "1280x720", "avc1.4D401F,mp4a.40.2", 60.0),
+    ("720p30", "720p", 2373000, "1280x720", "avc1.4D401F,mp4a.40.2", 30.0),
+    ("480p30", "480p", 1427999, "852x480", "avc1.4D401F,mp4a.40.2", 30.0),
+    ("360p30", "360p", 630000, "640x360", "avc1.4D401F,mp4a.40.2", 30.0),
+    ("160p30", "160p", 230000, "284x160", "avc1.4D401F,mp4a.40.2", 30.0),
+]
+
+
+def build_master_playlist(variant_count: int, relative_uri: bool = False) -> str:
+    """生成Twitch风格的主播放列表, 每个流带#EXT-X-MEDIA和引号内含逗号的CODECS
+
+    relative_uri为True时使用相对URI(规范允许), 旧实现会为每个流向后扫描到文件末尾。
+    """
+    lines = [
+        "#EXTM3U",
+        '#EXT-X-TWITCH-INFO:NODE="video-edge-c2a0d4.pdx01",MANIFEST-NODE-TYPE="weaver_cluster",'
+        'SERVER-TIME="1760000000.00",TRANSCODESTACK="2023-Transcode-QS-V1",USER-IP="127.0.0.1"',
+    ]
+    for index in range(variant_count):
+        group, name, bandwidth, resolution, codecs, frame_rate = TWITCH_VARIANTS[index % len(TWITCH_VARIANTS)]
+        if index >= len(TWITCH_VARIANTS):
+            group = f"{group}-{index}"
+        lines.append(f'#EXT-X-MEDIA:TYPE=VIDEO,GROUP-ID="{group}",NAME="{name}",AUTOSELECT=YES,DEFAULT=YES')
+        lines.append(
+            f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution},CODECS="{codecs}",'
+            f'VIDEO="{group}",FRAME-RATE={frame_rate:.3f}'
+        )
+        prefix = "" if relative_uri else "https://video-weaver.pdx01.hls.ttvnw.net/"
+        lines.append(f"{prefix}v1/playlist/{'x' * 400}{index}.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def check_equivalent(playlist: str):
+    new = parse_m3u8_url(playlist)
+    old = legacy_parse_m3u8_url(playlist)
+    assert len(new) == len(old), (len(new), len(old))
+    for a, b in zip(new, old):
+        assert (a.url, a.resolution, a.bandwidth, a.frame_rate, a.codecs) == (
+            b.url,
+            b.resolution,
+            b.bandwidth,
+            b.frame_rate,
+            b.codecs,
+        )
+
+
+def bench(name: str, playlist: str, repeat: int):
+    number = max(1, 20000 // max(1, playlist.count("#EXT-X-STREAM-INF")))
+    funcs = {"legacy": legacy_parse_m3u8_url, "current": parse_m3u8_url}
+    # 两个实现交替计时, 避免机器负载变化只影响其中一个
+    results = {label: float("inf") for label in funcs}
+    for _ in range(repeat):
+        for label, func in funcs.items():
+            elapsed = timeit.timeit(lambda: func(playlist), number=number) / number
+            results[label] = min(results[label], elapsed)
+    speedup = results["legacy"] / results["current"]
+    print(
+        f"{name:<28} legacy: {results['legacy'] * 1e6:>12.1f} us   "
+        f"current: {results['current'] * 1e6:>12.1f} us   x{speedup:.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--large", type=int, default=20000, help="超大播放列表的流数量")
+    args = parser.parse_args()
+
+    # 与运行时一致: 默认不输出DEBUG日志, 但旧实现仍会格式化日志字符串
+    logger.remove()
+
+    cases = [
+        ("realistic (6 variants)", build_master_playlist(6)),
+        ("medium (600 variants)", build_master_playlist(600)),
+        (f"large ({args.large} variants)", build_master_playlist(args.large)),
+    ]
+    for _, playlist in cases:
+        check_equivalent(playlist)
+    for name, playlist in cases:
+        bench(name, playlist, args.repeat)
+
+    # 旧实现在相对URI下既找不到流又退化为O(n^2), 这里只比较耗时
+    worst_case = build_master_playlist(2000, relative_uri=True)
+    streams = parse_m3u8_url(worst_case, "https://usher.ttvnw.net/api/channel/hls/example.m3u8")
+    assert len(streams) == 2000 and streams[0].url.startswith("https://usher.ttvnw.net/api/channel/hls/v1/")
+    bench("relative URIs (2000)", worst_case, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+本地模拟的Twitch源站 (GQL + usher + HLS CDN)
+
+在一个HTTP服务中实现录制器用到的全部Twitch接口, 用于离线的端到端压测:
+
+- POST /gql: PlaybackAccessToken_Template 和 ChannelShell, 支持批量请求
+- GET /api/channel/hls/{uid}.m3u8: usher主播放列表, 校验令牌中的频道, 未开播时返回404
+- GET /hls/{uid}/{group}.m3u8: 滚动的媒体播放列表, 下播后带#EXT-X-ENDLIST
+- GET /hls/{uid}/{group}/{seq}.ts: 按画质码率生成的MPEG-TS分片(PAT/PMT加空包, 不含音视频,
+  只适用于native后端; ffmpeg后端需要真实的媒体流)
+
+频道名为 fake00000, fake00001, ...; 开播状态通过管理接口控制:
+
+- POST /admin/live {"uids": [...], "live": true}
+- GET /admin/stats: 请求计数、分片字节数和每个频道的开播/检测时间
+
+    python benchmarks/fake_twitch.py --channels 2000 --live 50 --port 8600
+
+然后在配置文件中设置:
+
+    "gql_url": "http://127.0.0.1:8600/gql",
+    "usher_url": "http://127.0.0.1:8600/api/channel/hls/{uid}.m3u8"
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# (GROUP-ID, NAME, BANDWIDTH, RESOLUTION, CODECS, FRAME-RATE), 与usher返回的画质档位一致
+VARIANTS = [
+    ("chunked", "1080p60 (source)", 8534030, "1920x1080", "avc1.64002A,mp4a.40.2", 60.0),
+    ("720p60", "720p60", 3422999, "1280x720", "avc1.4D401F,mp4a.40.2", 60.0),
+    ("720p30", "720p", 2373000, "1280x720", "avc1.4D401F,mp4a.40.2", 30.0),
+    ("480p30", "480p", 1427999, "852x480", "avc1.4D401F,mp4a.40.2", 30.0),
+    ("360p30", "360p", 630000, "640x360", "avc1.4D401F,mp4a.40.2", 30.0),
+    ("160p30", "160p", 230000, "284x160", "avc1.4D401F,mp4a.40.2", 30.0),
+    ("audio_only", "audio_only", 160000, "", "mp4a.40.2", 0.0),
+]
+
+TS_PACKET_SIZE = 188
+PMT_PID = 0x1000
+TOKEN_TTL = 1200
+
+_MEDIA_PATH_RE = re.compile(r"^/hls/([^/]+)/([^/]+)\.m3u8$")
+_SEGMENT_PATH_RE = re.compile(r"^/hls/([^/]+)/([^/]+)/(\d+)\.ts$")
+_USHER_PATH_RE = re.compile(r"^/api/channel/hls/([^/]+)\.m3u8$")
+
+
+def channel_name(index: int) -> str:
+    return f"fake{index:05d}"
+
+
+def _crc32_mpeg2(data: bytes) -> int:
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+            crc &= 0xFFFFFFFF
+    return crc
+
+
+def _psi_packet(pid: int, section: bytes) -> bytes:
+    section += _crc32_mpeg2(section).to_bytes(4, "big")
+    header = bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10, 0x00])
+    return (header + section).ljust(TS_PACKET_SIZE, b"\xff")
+
+
+def build_segment(size: int) -> bytes:
+    """生成约size字节的MPEG-TS分片: PAT、PMT(一路H.264的PID)和填充到目标大小的空包"""
+    pat = _psi_packet(
+        0,
+        bytes([0x00, 0xB0, 0x0D, 0x00, 0x01, 0xC1, 0x00, 0x00, 0x00, 0x01, 0xE0 | (PMT_PID >> 8), PMT_PID & 0xFF]),
+    )
+    pmt = _psi_packet(
+        PMT_PID,
+        bytes([0x02, 0xB0, 0x12, 0x00, 0x01, 0xC1, 0x00, 0x00, 0xE1, 0x00, 0xF0, 0x00, 0x1B, 0xE1, 0x00, 0xF0, 0x00]),
+    )
+    null = bytes([0x47, 0x1F, 0xFF, 0x10]).ljust(TS_PACKET_SIZE, b"\xff")
+    count = max(0, size // TS_PACKET_SIZE - 2)
+    return pat + pmt + null * count
+
+
+class FakeChannel:
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.display_name = uid.capitalize()
+        self.stream_id = 0
+        # 最近一场直播的开播时间, 下播后保留, 用于生成带#EXT-X-ENDLIST的最终播放列表
+        self.started_at: float | None = None
+        # 本场直播的开播/下播时间, 未开播时live_since为None
+        self.live_since: float | None = None
+        self.ended_at: float | None = None
+        # 开播后录制器第一次请求usher主播放列表和第一个分片的时间
+        self.first_usher: float | None = None
+        self.first_segment: float | None = None
+        self.segment_bytes = 0
+
+    @property
+    def live(self) -> bool:
+        return self.live_since is not None
+
+    def to_dict(self) -> dict:
+        return {
+            "uid": self.uid,
+            "started_at": self.started_at,
+            "live_since": self.live_since,
+            "ended_at": self.ended_at,
+            "first_usher": self.first_usher,
+            "first_segment": self.first_segment,
+            "segment_bytes": self.segment_bytes,
+        }
+
+
+class FakeTwitch:
+    """
+    模拟源站的状态, 与HTTP层无关, 可以在压测驱动中直接调用set_live和stats
+
+    每场直播的分片时间轴从开播前window个分片开始, 录制器检测到开播时播放列表中已有完整的窗口;
+    播放列表只列出已经"生成完"的分片, 新分片按segment_duration实时出现。
+    advertised的BANDWIDTH和实际分片大小都乘以bitrate_scale, 便于在一台机器上模拟大量频道。
+
+    录制器按主机名对gql和usher限速, cdn_url不为空时主播放列表中的媒体地址指向该地址,
+    与真实的Twitch一样让分片下载不占用API的限速预算。
+    """
+
+    def __init__(self, channel_count: int, segment_duration: float = 2.0, window: int = 6, bitrate_scale: float = 1.0):
+        self.segment_duration = segment_duration
+        self.window = window
+        self.variants = [
+            (group, name, max(1, int(bandwidth * bitrate_scale)), resolution, codecs, frame_rate)
+            for group, name, bandwidth, resolution, codecs, frame_rate in VARIANTS
+        ]
+        self.segments = {variant[0]: build_segment(int(variant[2] * segment_duration / 8)) for variant in self.variants}
+        self.channels = {channel_name(index): FakeChannel(channel_name(index)) for index in range(channel_count)}
+        self.start_time = time.time()
+        self.cdn_url = ""
+
+        self._lock = threading.Lock()
+        self.counters = {
+            "gql_requests": 0,
+            "gql_operations": 0,
+            "usher_requests": 0,
+            "usher_offline": 0,
+            "playlist_requests": 0,
+            "segment_requests": 0,
+            "segment_bytes": 0,
+            "not_found": 0,
+        }
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def set_live(self, uids: list[str], live: bool) -> int:
+        """设置频道的开播状态, 返回状态发生变化的频道数"""
+        changed = 0
+        now = time.time()
+        with self._lock:
+            for uid in uids:
+                channel = self.channels.get(uid)
+                if channel is None or channel.live == live:
+                    continue
+                if live:
+                    channel.stream_id += 1
+                    channel.started_at = channel.live_since = now
+                    channel.ended_at = None
+                    channel.first_usher = None
+                    channel.first_segment = None
+                else:
+                    channel.ended_at = now
+                    channel.live_since = None
+                changed += 1
+        return changed
+
+    # GQL
+
+    def _playback_access_token(self, variables: dict) -> dict:
+        login = variables.get("login", "")
+        if login not in self.channels:
+            return {"data": {"streamPlaybackAccessToken": None}}
+        value = json.dumps({"channel": login, "expires": int(time.time()) + TOKEN_TTL, "player_type": "site"})
+        return {
+            "data": {
+                "streamPlaybackAccessToken": {
+                    "value": value,
+                    "signature": hashlib.sha1(value.encode()).hexdigest(),
+                    "authorization": {"isForbidden": False, "forbiddenReasonCode": "NONE"},
+                    "__typename": "PlaybackAccessToken",
+                }
+            }
+        }
+
+    def _channel_shell(self, variables: dict) -> dict:
+        login = variables.get("login", "")
+        channel = self.channels.get(login)
+        if channel is None:
+            error = {"userDoesNotExist": login, "reason": "UNKNOWN", "__typename": "UserDoesNotExist"}
+            return {"data": {"userOrError": error}}
+        stream = None
+        if channel.live:
+            stream = {"id": f"{login}-{channel.stream_id}", "viewersCount": 0, "__typename": "Stream"}
+        return {
+            "data": {
+                "userOrError": {
+                    "id": login,
+                    "login": login,
+                    "displayName": channel.display_name,
+                    "stream": stream,
+                    "__typename": "User",
+                }
+            }
+        }
+
+    def handle_gql(self, body: dict | list) -> dict | list:
+        operations = body if isinstance(body, list) else [body]
+        self._count("gql_requests")
+        self._count("gql_operations", len(operations))
+        results = []
+        for operation in operations:
+            name = operation.get("operationName") if isinstance(operation, dict) else None
+            variables = (operation.get("variables") if isinstance(operation, dict) else None) or {}
+            if name == "PlaybackAccessToken_Template":
+                results.append(self._playback_access_token(variables))
+            elif name == "ChannelShell":
+                results.append(self._channel_shell(variables))
+            else:
+                results.append({"errors": [{"message": "PersistedQueryNotFound"}]})
+        return results if isinstance(body, list) else results[0]
+
+    # usher / CDN
+
+    def master_playlist(self, uid: str, token: str, base_url: str) -> str | None:
+        """令牌有效且频道开播时返回主播放列表"""
+        self._count("usher_requests")
+        try:
+            token_channel = json.loads(token).get("channel")
+        except (ValueError, AttributeError):
+            token_channel = None
+        channel = self.channels.get(uid)
+        if channel is None or token_channel != uid or not channel.live:
+            self._count("usher_offline")
+            return None
+        with self._lock:
+            if channel.first_usher is None:
+                channel.first_usher = time.time()
+
+        lines = [
+            "#EXTM3U",
+            f'#EXT-X-TWITCH-INFO:NODE="fake-origin",MANIFEST-NODE-TYPE="fake",SERVER-TIME="{time.time():.2f}",'
+            f'BROADCAST-ID="{uid}-{channel.stream_id}",STREAM-TIME="{time.time() - channel.live_since:.2f}"',
+        ]
+        for group, name, bandwidth, resolution, codecs, frame_rate in self.variants:
+            lines.append(f'#EXT-X-MEDIA:TYPE=VIDEO,GROUP-ID="{group}",NAME="{name}",AUTOSELECT=YES,DEFAULT=YES')
+            attributes = f'BANDWIDTH={bandwidth},CODECS="{codecs}",VIDEO="{group}"'
+            if resolution:
+                attributes += f",RESOLUTION={resolution},FRAME-RATE={frame_rate:.3f}"
+            lines.append(f"#EXT-X-STREAM-INF:{attributes}")
+            lines.append(f"{self.cdn_url or base_url}/hls/{uid}/{group}.m3u8")
+        return "\n".join(lines) + "\n"
+
+    def _timeline(self, channel: FakeChannel) -> tuple[float, float] | None:
+        """本场直播的分片时间轴起点和截止时间, 没有直播过时返回None"""
+        if channel.started_at is None:
+            return None
+        # 下播后播放列表停在下播时间
+        end = time.time() if channel.live else channel.ended_at
+        return channel.started_at - self.window * self.segment_duration, end
+
+    def media_playlist(self, uid: str, group: str) -> str | None:
+        self._count("playlist_requests")
+        channel = self.channels.get(uid)
+        if channel is None or group not in self.segments:
+            return None
+        with self._lock:
+            timeline = self._timeline(channel)
+            ended = not channel.live
+        if timeline is None:
+            return None
+        origin, now = timeline
+        completed = int((now - origin) / self.segment_duration)
+        first = max(0, completed - self.window)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{int(self.segment_duration + 0.999)}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+        ]
+        for sequence in range(first, completed):
+            lines.append(f"#EXTINF:{self.segment_duration:.3f},live")
+            lines.append(f"{group}/{sequence}.ts")
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def segment(self, uid: str, group: str) -> bytes | None:
+        self._count("segment_requests")
+        channel = self.channels.get(uid)
+        data = self.segments.get(group)
+        if channel is None or data is None or channel.stream_id == 0:
+            return None
+        with self._lock:
+            if channel.live and channel.first_segment is None:
+                channel.first_segment = time.time()
+            channel.segment_bytes += len(data)
+            self.counters["segment_bytes"] += len(data)
+        return data
+
+    def stats(self, channels: bool = True) -> dict:
+        with self._lock:
+            result = {
+                "time": time.time(),
+                "uptime": time.time() - self.start_time,
+                "channels_total": len(self.channels),
+                "channels_live": sum(1 for channel in self.channels.values() if channel.live),
+                **self.counters,
+            }
+            if channels:
+                result["channels"] = [
+                    channel.to_dict() for channel in self.channels.values() if channel.stream_id or channel.live
+                ]
+        return result
+
+
+class FakeTwitchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeTwitchServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data):
+        self._send(status, json.dumps(data).encode(), "application/json")
+
+    def _not_found(self):
+        self.server.twitch._count("not_found")
+        self._send_json(404, {"error": "Not Found", "status": 404})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def do_POST(self):
+        twitch = self.server.twitch
+        path = urlparse(self.path).path
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+        if path == "/gql":
+            self._send_json(200, twitch.handle_gql(body))
+        elif path == "/admin/live" and isinstance(body, dict):
+            changed = twitch.set_live(list(body.get("uids") or []), bool(body.get("live", True)))
+            self._send_json(200, {"changed": changed})
+        else:
+            self._not_found()
+
+    def do_GET(self):
+        twitch = self.server.twitch
+        url = urlparse(self.path)
+
+        match = _SEGMENT_PATH_RE.match(url.path)
+        if match:
+            data = twitch.segment(match.group(1), match.group(2))
+            if data is None:
+                self._not_found()
+            else:
+                self._send(200, data, "video/mp2t")
+            return
+
+        match = _MEDIA_PATH_RE.match(url.path)
+        if match:
+            playlist = twitch.media_playlist(match.group(1), match.group(2))
+            if playlist is None:
+                self._not_found()
+            else:
+                self._send(200, playlist.encode(), "application/vnd.apple.mpegurl")
+            return
+
+        match = _USHER_PATH_RE.match(url.path)
+        if match:
+            token = (parse_qs(url.query).get("token") or [""])[0]
+            base_url = f"http://{self.headers.get('Host') or '%s:%d' % self.server.server_address[:2]}"
+            playlist = twitch.master_playlist(match.group(1), token, base_url)
+            if playlist is None:
+                error = "transcode does not exist"
+                self._send_json(404, [{"url": self.path, "error": error, "error_code": "transcode_does_not_exist"}])
+            else:
+                self._send(200, playlist.encode(), "application/vnd.apple.mpegurl")
+            return
+
+        if url.path == "/admin/stats":
+            self._send_json(200, twitch.stats(channels="summary" not in parse_qs(url.query)))
+        else:
+            self._not_found()
+
+
+class FakeTwitchServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, twitch: FakeTwitch, host: str = "127.0.0.1", port: int = 0):
+        self.twitch = twitch
+        super().__init__((host, port), FakeTwitchHandler)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def gql_url(self) -> str:
+        return f"{self.base_url}/gql"
+
+    @property
+    def usher_url(self) -> str:
+        return f"{self.base_url}/api/channel/hls/{{uid}}.m3u8"
+
+    def start(self):
+        """在后台线程中提供服务"""
+        self._thread = threading.Thread(target=self.serve_forever, name="FakeTwitch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--cdn-host", default="", help="媒体播放列表和分片使用的地址(如127.0.0.3), 默认与--host相同")
+    parser.add_argument("--channels", type=int, default=1000, help="模拟的频道数")
+    parser.add_argument("--live", type=int, default=0, help="启动时已开播的频道数")
+    parser.add_argument("--segment-duration", type=float, default=2.0, help="分片时长(秒)")
+    parser.add_argument("--bitrate-scale", type=float, default=1.0, help="码率和分片大小的缩放比例")
+    args = parser.parse_args()
+
+    twitch = FakeTwitch(args.channels, args.segment_duration, bitrate_scale=args.bitrate_scale)
+    twitch.set_live([channel_name(index) for index in range(min(args.live, args.channels))], True)
+    server = FakeTwitchServer(twitch, args.host, args.port)
+    if args.cdn_host:
+        cdn_server = FakeTwitchServer(twitch, args.cdn_host, args.port)
+        cdn_server.start()
+        twitch.cdn_url = cdn_server.base_url
+    print(f"模拟Twitch源站已启动: {server.base_url}, 频道: {args.channels}, 开播: {args.live}")
+    print(f'    "gql_url": "{server.gql_url}",')
+    print(f'    "usher_url": "{server.usher_url}"')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
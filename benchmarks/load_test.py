@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+端到端压测驱动
+
+在进程内启动模拟的Twitch源站(fake_twitch.py), 生成指向它的配置文件, 以子进程运行完整的录制器,
+然后按计划让一部分频道开播, 统计:
+
+- 开播检测延迟: 频道开播到录制器请求usher主播放列表的时间, 以及到下载第一个分片的时间
+- 录制器进程的线程数、打开的文件描述符、RSS和CPU占用(读取/proc, 仅Linux; 不含ffmpeg子进程)
+- 接收吞吐: 源站发出的分片字节数/秒, 以及结束时录制目录中的文件大小
+
+分片不含音视频, 默认使用native后端; 其它配置项可以用--set覆盖, 值按JSON解析:
+
+    python benchmarks/load_test.py --channels 2000 --live 100 --ramp 30 --duration 120
+    python benchmarks/load_test.py --channels 5000 --live 200 --set poll_engine='"thread"' --set check_workers=32
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from fake_twitch import FakeTwitch, FakeTwitchServer, channel_name
+from twitch_recoder.common.control import send_command
+
+
+# gql、usher和CDN分别使用不同的回环地址, 录制器按主机名限速, 与真实环境一致
+LOOPBACK_HOSTS = ("127.0.0.1", "127.0.0.2", "127.0.0.3")
+
+
+def read_process_stats(pid: int) -> dict | None:
+    """从/proc读取进程的线程数、文件描述符数、RSS和累计CPU时间, 不支持时返回None"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        fds = len(os.listdir(f"/proc/{pid}/fd"))
+    except (OSError, ValueError):
+        return None
+    return {
+        "threads": int(status["Threads"]),
+        "fds": fds,
+        "rss": int(status["VmRSS"].split()[0]) * 1024,
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK"),
+    }
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))]
+
+
+class Sampler:
+    """后台线程按固定间隔采样录制器进程和源站的计数"""
+
+    def __init__(self, pid: int, twitch: FakeTwitch, interval: float = 1.0):
+        self.pid = pid
+        self.twitch = twitch
+        self.interval = interval
+        self.samples: list[dict] = []
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="Sampler", daemon=True)
+
+    def sample(self):
+        stats = self.twitch.stats(channels=False)
+        self.samples.append(
+            {
+                "time": stats["time"],
+                "channels_live": stats["channels_live"],
+                "segment_bytes": stats["segment_bytes"],
+                "gql_requests": stats["gql_requests"],
+                "usher_requests": stats["usher_requests"],
+                "process": read_process_stats(self.pid),
+            }
+        )
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        self.sample()
+
+
+def start_servers(twitch: FakeTwitch) -> list[FakeTwitchServer]:
+    """返回 [gql, usher, cdn] 三个服务, 不支持127.0.0.2等地址的平台上共用一个服务"""
+    servers = []
+    try:
+        for host in LOOPBACK_HOSTS:
+            servers.append(FakeTwitchServer(twitch, host))
+    except OSError:
+        for server in servers:
+            server.server_close()
+        print("无法监听多个回环地址, gql/usher/CDN共用一个地址, 分片下载也会计入rate_limit_usher")
+        servers = [FakeTwitchServer(twitch)] * len(LOOPBACK_HOSTS)
+    for server in set(servers):
+        server.start()
+    twitch.cdn_url = servers[2].base_url
+    return servers
+
+
+def build_config(args, servers: list[FakeTwitchServer], workdir: str, uids: list[str]) -> dict:
+    test_length = args.warmup + args.ramp + args.duration + args.drain_timeout
+    config = {
+        "uids": uids,
+        "data_path": os.path.join(workdir, "data"),
+        "max_time_limit": int(test_length) + 60,
+        "recorder_backend": "native",
+        "metrics_port": 0,
+        "config_reload_interval": 0,
+        "min_free_space": 0,
+        "gql_url": servers[0].gql_url,
+        "usher_url": servers[1].usher_url,
+    }
+    for item in args.set:
+        key, _, value = item.partition("=")
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def wait_until(deadline: float):
+    delay = deadline - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def running_recordings(socket_path: str) -> int | None:
+    try:
+        return send_command(socket_path, "status", timeout=5)["recordings"]
+    except (ConnectionError, RuntimeError):
+        return None
+
+
+def summarize(twitch: FakeTwitch, samples: list[dict], live_uids: list[str], ramp_start: float, data_path: str) -> dict:
+    channels = {item["uid"]: item for item in twitch.stats()["channels"]}
+    detect, first_segment = [], []
+    for uid in live_uids:
+        channel = channels.get(uid) or {}
+        if channel.get("first_usher"):
+            detect.append(channel["first_usher"] - channel["started_at"])
+        if channel.get("first_segment"):
+            first_segment.append(channel["first_segment"] - channel["started_at"])
+
+    process = [sample["process"] for sample in samples if sample["process"]]
+    rates = []
+    for previous, current in zip(samples, samples[1:]):
+        elapsed = current["time"] - previous["time"]
+        if elapsed > 0:
+            rates.append((current["segment_bytes"] - previous["segment_bytes"]) / elapsed)
+    ingest = [sample for sample in samples if sample["time"] >= ramp_start]
+    elapsed = ingest[-1]["time"] - ingest[0]["time"] if len(ingest) > 1 else 0
+    cpu = None
+    if len(process) > 1:
+        cpu = (process[-1]["cpu_seconds"] - process[0]["cpu_seconds"]) / (samples[-1]["time"] - samples[0]["time"])
+
+    def latency(values: list[float]) -> dict:
+        return {
+            "count": len(values),
+            "p50": percentile(values, 0.5),
+            "p90": percentile(values, 0.9),
+            "p99": percentile(values, 0.99),
+            "max": max(values) if values else None,
+        }
+
+    return {
+        "went_live": len(live_uids),
+        "detect_latency": latency(detect),
+        "first_segment_latency": latency(first_segment),
+        "threads_max": max((item["threads"] for item in process), default=None),
+        "fds_max": max((item["fds"] for item in process), default=None),
+        "rss_max": max((item["rss"] for item in process), default=None),
+        "cpu_avg": cpu,
+        "ingest_avg": (ingest[-1]["segment_bytes"] - ingest[0]["segment_bytes"]) / elapsed if elapsed else None,
+        "ingest_peak": max(rates, default=None),
+        "disk_bytes": directory_size(data_path),
+        "server": {key: value for key, value in twitch.stats(channels=False).items() if key not in ("time", "uptime")},
+    }
+
+
+def print_report(result: dict):
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}s"
+
+    def rate(value):
+        return "-" if value is None else f"{value / 1024 / 1024:.2f}MB/s"
+
+    print("\n==== 压测结果 ====")
+    print(f"开播频道: {result['went_live']}")
+    for label, key in (("检测延迟(usher)", "detect_latency"), ("首个分片延迟", "first_segment_latency")):
+        item = result[key]
+        print(
+            f"{label:<16} 已检测: {item['count']:>5}  p50: {seconds(item['p50']):>8}  p90: {seconds(item['p90']):>8}  "
+            f"p99: {seconds(item['p99']):>8}  max: {seconds(item['max']):>8}"
+        )
+    if result["threads_max"] is None:
+        print("进程统计: 当前平台没有/proc, 跳过")
+    else:
+        print(
+            f"录制器进程: 线程峰值 {result['threads_max']}, 文件描述符峰值 {result['fds_max']}, "
+            f"RSS峰值 {result['rss_max'] / 1024 / 1024:.1f}MB, 平均CPU {result['cpu_avg']:.0%}"
+        )
+    print(f"接收吞吐: 平均 {rate(result['ingest_avg'])}, 峰值 {rate(result['ingest_peak'])}")
+    print(f"录制文件: {result['disk_bytes'] / 1024 / 1024:.1f}MB")
+    server = result["server"]
+    print(
+        f"源站请求: gql {server['gql_requests']} ({server['gql_operations']} 个操作), usher {server['usher_requests']}, "
+        f"媒体播放列表 {server['playlist_requests']}, 分片 {server['segment_requests']}"
+    )
+    if result.get("shutdown_seconds") is not None:
+        print(f"关闭耗时: {result['shutdown_seconds']:.2f}s, 退出码: {result['exit_code']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=1000, help="模拟的频道数, 全部加入录制器的uids")
+    parser.add_argument("--live", type=int, default=50, help="压测期间开播的频道数")
+    parser.add_argument("--warmup", type=float, default=15, help="开始开播前等待录制器完成首轮检测的时间(秒)")
+    parser.add_argument("--ramp", type=float, default=30, help="开播的频道在这段时间内均匀开播(秒)")
+    parser.add_argument("--duration", type=float, default=60, help="全部开播后继续录制的时间(秒)")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="下播后等待录制结束的最长时间(秒)")
+    parser.add_argument("--segment-duration", type=float, default=2.0, help="分片时长(秒)")
+    parser.add_argument("--bitrate-scale", type=float, default=0.05, help="码率缩放比例, 1为真实码率")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="采样间隔(秒)")
+    parser.add_argument("--seed", type=int, default=0, help="选择开播频道的随机种子")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="覆盖录制器配置项")
+    parser.add_argument("--output", default="", help="把结果和采样保存为JSON")
+    parser.add_argument("--keep", action="store_true", help="保留工作目录(配置、日志和录制文件)")
+    parser.add_argument("--verbose", action="store_true", help="录制器输出DEBUG日志")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="twitch_load_")
+    twitch = FakeTwitch(args.channels, args.segment_duration, bitrate_scale=args.bitrate_scale)
+    servers = start_servers(twitch)
+
+    uids = [channel_name(index) for index in range(args.channels)]
+    live_uids = random.Random(args.seed).sample(uids, min(args.live, args.channels))
+    config = build_config(args, servers, workdir, uids)
+    config_path = os.path.join(workdir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f, indent=4)
+    data_path = config["data_path"] if isinstance(config["data_path"], str) else config["data_path"][0]
+    socket_path = config.get("control_socket") or os.path.join(data_path, "control.sock")
+
+    python_path = os.pathsep.join(filter(None, [os.path.join(ROOT, "src"), os.environ.get("PYTHONPATH")]))
+    env = dict(os.environ, PYTHONPATH=python_path)
+    command = [sys.executable, "-m", "twitch_recoder.cli", "-c", config_path]
+    if args.verbose:
+        command.append("-v")
+    log_path = os.path.join(workdir, "recorder.log")
+    print(
+        f"工作目录: {workdir}, 源站: {', '.join(server.base_url for server in servers)}, "
+        f"频道: {args.channels}, 开播: {len(live_uids)}"
+    )
+
+    result = {}
+    with open(log_path, "w") as log:
+        recorder = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        sampler = Sampler(recorder.pid, twitch, args.sample_interval)
+        sampler.start()
+        ramp_start = time.time()
+        try:
+            wait_until(time.time() + args.warmup)
+            ramp_start = time.time()
+            for index, uid in enumerate(live_uids):
+                wait_until(ramp_start + args.ramp * index / max(1, len(live_uids)))
+                twitch.set_live([uid], True)
+            print(f"{len(live_uids)} 个频道已开播, 继续录制 {args.duration:.0f}s")
+            wait_until(time.time() + args.duration)
+
+            # 下播后等待录制器读到#EXT-X-ENDLIST并结束录制
+            twitch.set_live(live_uids, False)
+            drain_deadline = time.time() + args.drain_timeout
+            while time.time() < drain_deadline and recorder.poll() is None:
+                if running_recordings(socket_path) == 0:
+                    break
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("压测被中断, 正在停止录制器")
+        finally:
+            sampler.stop()
+            shutdown_start = time.time()
+            if recorder.poll() is None:
+                recorder.send_signal(signal.SIGINT)
+                try:
+                    recorder.wait(timeout=60)
+                except subprocess.TimeoutExpired:
+                    recorder.kill()
+                    recorder.wait()
+            result = summarize(twitch, sampler.samples, live_uids, ramp_start, data_path)
+            result["shutdown_seconds"] = time.time() - shutdown_start
+            result["exit_code"] = recorder.returncode
+            for server in set(servers):
+                server.stop()
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "config": config, "result": result, "samples": sampler.samples}, f, indent=2)
+        print(f"结果已保存到 {args.output}")
+    if args.keep:
+        print(f"工作目录已保留: {workdir}, 录制器日志: {log_path}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
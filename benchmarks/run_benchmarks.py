@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+热点路径微基准套件
+
+覆盖主播放列表解析(parse_m3u8_url)、流排序和最佳流选择(sort_streams / get_best_stream / select_stream /
+extract_resolution_width)以及持有1万个任务的TaskManager查询。每项输出:
+
+- ops/s: 多轮计时中最快一轮的每秒调用次数
+- alloc: 单次调用结束时仍存活的新分配(tracemalloc统计的块数和字节数, 包含返回值)
+- peak: 单次调用期间tracemalloc记录的内存峰值增量
+
+结果可以保存为JSON, 并与之前保存的基线比较; ops/s下降或峰值内存增长超过阈值时
+标记为回归并以非零状态退出。基线与机器相关, 应在同一台机器上生成和比较。
+
+    python benchmarks/run_benchmarks.py [--filter sort] [--save results.json]
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json [--threshold 0.15]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from loguru import logger
+
+from bench_m3u8_parser import TWITCH_VARIANTS, build_master_playlist
+from twitch_recoder.common.m3u8_parser import parse_m3u8_url
+from twitch_recoder.common.stream_sorter import QualityPolicy, get_best_stream, select_stream, sort_streams
+from twitch_recoder.common.taskManager import Task, TaskManager, TaskStatus, TaskType
+from twitch_recoder.common.utils import extract_resolution_width
+from twitch_recoder.types.typeinfo import StreamInfo
+
+
+# 每项基准的最短计时时长(秒)
+MIN_TIME = 0.2
+
+
+def make_streams(count: int, seed: int = 0, complete: bool = True) -> list[StreamInfo]:
+    """生成随机顺序的StreamInfo, complete为False时部分流缺少帧率, 触发按带宽排序的分支"""
+    rng = random.Random(seed)
+    streams = []
+    for index in range(count):
+        _, name, bandwidth, resolution, codecs, frame_rate = TWITCH_VARIANTS[rng.randrange(len(TWITCH_VARIANTS))]
+        stream = StreamInfo(
+            url=f"https://video-weaver.pdx01.hls.ttvnw.net/v1/playlist/{index}.m3u8",
+            resolution=resolution,
+            bandwidth=bandwidth + rng.randrange(1000),
+            frame_rate=frame_rate if complete or index % 7 else 0.0,
+            codecs=codecs,
+            uid=f"channel{index % 100}",
+        )
+        stream.name = name
+        streams.append(stream)
+    return streams
+
+
+def make_task_manager(count: int) -> TaskManager:
+    """生成持有count个任务的TaskManager, 状态按典型比例分布, 任务线程不启动"""
+    manager = TaskManager()
+    statuses = [TaskStatus.RUNNING] * 2 + [TaskStatus.QUEUED] * 5 + [TaskStatus.COMPLETED] * 2 + [TaskStatus.FAILED]
+    for index in range(count):
+        task = Task(f"recode_channel{index}_{index}", f"channel{index}", TaskType.RECODE, lambda: None)
+        manager.add_task(task)
+        task.status = statuses[index % len(statuses)]
+    return manager
+
+
+def build_cases() -> dict[str, Callable[[], object]]:
+    small_playlist = build_master_playlist(6)
+    large_playlist = build_master_playlist(600)
+    six_streams = parse_m3u8_url(small_playlist)
+    many_streams = make_streams(5000)
+    incomplete_streams = make_streams(5000, complete=False)
+    resolutions = [stream.resolution for stream in many_streams] + ["", "未知", "audio_only"]
+    policy = QualityPolicy(max_height=720, max_fps=30, codecs=["av1", "h264"])
+    manager = make_task_manager(10_000)
+    uids = [f"channel{index}" for index in range(0, 10_000, 97)] + ["missing"]
+
+    def find_by_uid():
+        for uid in uids:
+            manager.find_task_by_uid(uid)
+
+    def add_remove_task():
+        task = Task("recode_bench", "bench", TaskType.RECODE, lambda: None)
+        manager.add_task(task)
+        manager.remove_task(task)
+
+    return {
+        "parse_m3u8_url[6]": lambda: parse_m3u8_url(small_playlist),
+        "parse_m3u8_url[600]": lambda: parse_m3u8_url(large_playlist),
+        "sort_streams[6]": lambda: sort_streams(six_streams),
+        "sort_streams[5000]": lambda: sort_streams(many_streams),
+        "sort_streams[5000,bandwidth]": lambda: sort_streams(incomplete_streams),
+        "get_best_stream[6]": lambda: get_best_stream(six_streams),
+        "get_best_stream[5000]": lambda: get_best_stream(many_streams),
+        "get_best_stream[5000,policy]": lambda: get_best_stream(many_streams, policy),
+        "select_stream[6]": lambda: select_stream(six_streams),
+        "select_stream[5000,policy]": lambda: select_stream(many_streams, policy),
+        "extract_resolution_width[5003]": lambda: [extract_resolution_width(value) for value in resolutions],
+        "task_manager.find_task_by_uid[10k,x%d]" % len(uids): find_by_uid,
+        "task_manager.get_running_tasks[10k]": manager.get_running_tasks,
+        "task_manager.get_all_tasks[10k]": manager.get_all_tasks,
+        "task_manager.count_by_status[10k]": manager.count_by_status,
+        "task_manager.add_remove_task[10k]": add_remove_task,
+    }
+
+
+def measure_time(func: Callable[[], object], repeat: int) -> float:
+    """返回最快一轮的单次调用耗时(秒)"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * MIN_TIME / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def measure_memory(func: Callable[[], object]) -> dict:
+    """用tracemalloc统计单次调用的存活分配和峰值"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    diff = [stat for stat in after.compare_to(before, "filename") if stat.count_diff > 0 or stat.size_diff > 0]
+    del result
+    return {
+        "alloc_blocks": sum(max(0, stat.count_diff) for stat in diff),
+        "alloc_bytes": sum(max(0, stat.size_diff) for stat in diff),
+        "peak_bytes": max(0, peak - base),
+    }
+
+
+def run(name_filter: str, repeat: int) -> dict:
+    results = {}
+    for name, func in build_cases().items():
+        if name_filter and name_filter not in name:
+            continue
+        seconds = measure_time(func, repeat)
+        results[name] = {"ops_per_sec": 1 / seconds, "mean_us": seconds * 1e6, **measure_memory(func)}
+        item = results[name]
+        print(
+            f"{name:<40} {item['ops_per_sec']:>14,.0f} ops/s {item['mean_us']:>12.2f} us  "
+            f"alloc: {item['alloc_blocks']:>7} blocks {item['alloc_bytes'] / 1024:>9.1f} KiB  "
+            f"peak: {item['peak_bytes'] / 1024:>9.1f} KiB"
+        )
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """与基线比较, 返回回归的基准名称"""
+    regressions = []
+    print(f"\n与基线比较 (阈值 {threshold:.0%}):")
+    for name, item in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<40} 基线中没有该项")
+            continue
+        speed = item["ops_per_sec"] / base["ops_per_sec"] - 1
+        memory = (item["peak_bytes"] - base["peak_bytes"]) / max(base["peak_bytes"], 1)
+        regressed = speed < -threshold or (memory > threshold and item["peak_bytes"] - base["peak_bytes"] > 4096)
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<40} ops/s {speed:>+8.1%}  peak {memory:>+8.1%}  {'REGRESSION' if regressed else 'ok'}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="计时轮数, 取最快一轮")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的基准")
+    parser.add_argument("--save", default="", help="把结果保存为JSON")
+    parser.add_argument("--save-baseline", default="", help="把结果保存为基线")
+    parser.add_argument("--baseline", default="", help="与该基线比较, 出现回归时返回1")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定回归的相对变化")
+    args = parser.parse_args()
+
+    # 与运行时一致: 默认不输出DEBUG日志
+    logger.remove()
+
+    results = run(args.filter, args.repeat)
+    output = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    for path in (args.save, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(output, f, indent=2)
+            print(f"结果已保存到 {path}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("python") != output["meta"]["python"]:
+            print(f"注意: 基线的Python版本为 {baseline['meta'].get('python')}, 结果可能不可比")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项回归: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,7 @@ Twitch录制器模块
 提供Twitch流媒体解析、排序和录制功能
 """
 
-from .api.twitch_api import get_token_and_sign, get_m3u8_url
-from .common.stream_sorter import sort_streams, get_best_stream
-from .core.process import process
+import importlib
 
 __version__ = "1.0.0"
 __all__ = [
@@ -16,3 +14,19 @@ __all__ = [
     "get_best_stream",
     "process",
 ]
+
+# 首次访问时才导入, 命令行客户端等只用到少数子模块时不会加载requests和整个API模块
+_LAZY_ATTRS = {
+    "get_token_and_sign": "twitch_recoder.api.twitch_api",
+    "get_m3u8_url": "twitch_recoder.api.twitch_api",
+    "sort_streams": "twitch_recoder.common.stream_sorter",
+    "get_best_stream": "twitch_recoder.common.stream_sorter",
+    "process": "twitch_recoder.core.process",
+}
+
+
+def __getattr__(name: str):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module), name)
@@ -0,0 +1,242 @@
+"""
+Twitch API共享HTTP会话模块
+
+按代理维护长连接的requests.Session, 并提供DNS结果缓存和连接复用统计
+"""
+
+import socket
+import threading
+import time
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from twitch_recoder.api.rate_limiter import RateLimiter
+from twitch_recoder.common.metrics import api_throttled
+from twitch_recoder.common.utils import get_proxy_pool
+from twitch_recoder.config.my_config import config
+
+
+class ConnectionStats:
+    """按主机统计请求数和新建连接数, 两者之差即复用的连接数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: dict[str, int] = {}
+        self._new_connections: dict[str, int] = {}
+
+    def record_request(self, host: str):
+        with self._lock:
+            self._requests[host] = self._requests.get(host, 0) + 1
+
+    def record_new_connection(self, host: str):
+        with self._lock:
+            self._new_connections[host] = self._new_connections.get(host, 0) + 1
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        """获取统计快照
+
+        Returns:
+            dict[str, dict[str, int]]: host -> {"requests", "new", "reused"}
+        """
+        with self._lock:
+            result = {}
+            for host, count in self._requests.items():
+                new = self._new_connections.get(host, 0)
+                result[host] = {"requests": count, "new": new, "reused": max(0, count - new)}
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._new_connections.clear()
+
+
+connection_stats = ConnectionStats()
+
+
+class DNSCache:
+    """socket.getaddrinfo的TTL缓存
+
+    安装后对整个进程生效, 轮询时反复解析gql.twitch.tv和usher.ttvnw.net的结果会被复用。
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache: dict[tuple, tuple[float, list]] = {}
+        self._original_getaddrinfo = None
+
+    def getaddrinfo(self, *args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        result = self._original_getaddrinfo(*args, **kwargs)
+        with self._lock:
+            self._cache[key] = (now + self.ttl, result)
+        return result
+
+    def install(self):
+        if self._original_getaddrinfo is None:
+            self._original_getaddrinfo = socket.getaddrinfo
+            socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        if self._original_getaddrinfo is not None:
+            socket.getaddrinfo = self._original_getaddrinfo
+            self._original_getaddrinfo = None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        connection_stats.record_new_connection(self.host)
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        connection_stats.record_new_connection(self.host)
+        return super()._new_conn()
+
+
+_COUNTING_POOL_CLASSES = {"http": _CountingHTTPConnectionPool, "https": _CountingHTTPSConnectionPool}
+
+# 表示被限流的状态码, 按Retry-After或退避等待后重试
+THROTTLED_STATUS = (429, 503)
+
+
+class PooledAdapter(HTTPAdapter):
+    """记录新建连接数的HTTPAdapter, 直连和HTTP代理都使用计数连接池"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _COUNTING_POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if hasattr(manager, "pool_classes_by_scheme"):
+            manager.pool_classes_by_scheme = _COUNTING_POOL_CLASSES
+        return manager
+
+    def send(self, request, **kwargs):
+        host = requests.utils.urlparse(request.url).hostname or ""
+        proxies = kwargs.get("proxies") or {}
+        proxy = proxies.get("https") or proxies.get("http") or ""
+        limiter = get_rate_limiter()
+        attempt = 0
+        while True:
+            limiter.acquire(host, proxy)
+            connection_stats.record_request(host)
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.exceptions.ProxyError, requests.exceptions.ConnectTimeout):
+                # 连接阶段失败计入代理的连续失败次数, 达到上限后移出代理池轮换
+                if proxy and (pool := get_proxy_pool()) is not None:
+                    pool.report_failure(proxy)
+                raise
+            if proxy and (pool := get_proxy_pool()) is not None:
+                pool.report_success(proxy)
+            if (
+                response.status_code not in THROTTLED_STATUS
+                or not limiter.is_limited(host)
+                or attempt >= limiter.max_retries
+            ):
+                return response
+            delay = limiter.backoff(host, proxy, attempt, response.headers.get("Retry-After"))
+            api_throttled.inc(host=host)
+            logger.warning(f"请求 {host} 被限流({response.status_code}), {delay:.1f}s后重试({attempt + 1}/{limiter.max_retries})")
+            response.close()
+            attempt += 1
+
+
+class SessionPool:
+    """按代理地址缓存requests.Session, 每个Session内部按主机维护连接池"""
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 32, dns_cache_ttl: float = 300):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.dns_cache = DNSCache(dns_cache_ttl)
+        self._lock = threading.Lock()
+        self._sessions: dict[str, requests.Session] = {}
+
+    def get(self, proxies: dict | None = None) -> requests.Session:
+        """获取代理对应的会话
+
+        Args:
+            proxies (dict | None): get_proxies()返回的代理配置
+
+        Returns:
+            requests.Session: 共享会话
+        """
+        key = (proxies or {}).get("https") or (proxies or {}).get("http") or ""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                if self.dns_cache.ttl > 0:
+                    self.dns_cache.install()
+                session = requests.Session()
+                adapter = PooledAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                if proxies:
+                    session.proxies.update(proxies)
+                self._sessions[key] = session
+                logger.debug(f"创建HTTP会话, 代理: {key or '无'}, 连接池: {self.pool_connections}x{self.pool_maxsize}")
+            return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+        self.dns_cache.uninstall()
+
+
+_session_pool: SessionPool | None = None
+_session_pool_lock = threading.Lock()
+_rate_limiter: RateLimiter | None = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取全局共享的限速器, 首次调用时按配置创建, gql和usher分别使用各自的预算"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _session_pool_lock:
+            if _rate_limiter is None:
+                endpoint_rates = {
+                    requests.utils.urlparse(config.gql_url).hostname: config.rate_limit_gql,
+                    requests.utils.urlparse(config.usher_url).hostname: config.rate_limit_usher,
+                }
+                _rate_limiter = RateLimiter(
+                    config.rate_limit_global,
+                    endpoint_rates,
+                    config.rate_limit_per_proxy,
+                    config.rate_limit_max_retries,
+                    config.rate_limit_backoff,
+                )
+    return _rate_limiter
+
+
+def get_session(proxies: dict | None = None) -> requests.Session:
+    """获取全局共享的HTTP会话, 首次调用时按配置创建会话池"""
+    global _session_pool
+    if _session_pool is None:
+        with _session_pool_lock:
+            if _session_pool is None:
+                _session_pool = SessionPool(config.http_pool_connections, config.http_pool_maxsize, config.dns_cache_ttl)
+    return _session_pool.get(proxies)
+
+
+def get_connection_stats() -> dict[str, dict[str, int]]:
+    """获取各主机的请求数、新建连接数和复用连接数"""
+    return connection_stats.snapshot()
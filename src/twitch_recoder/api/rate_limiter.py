@@ -0,0 +1,134 @@
+"""
+Twitch API请求速率限制模块
+
+全局、按接口主机和按代理分别使用令牌桶限速, 请求前在令牌桶上等待而不是失败;
+收到429/503时遵循Retry-After, 没有时按带随机抖动的指数退避暂停该主机的请求
+"""
+
+import email.utils
+import random
+import threading
+import time
+
+from loguru import logger
+
+
+class TokenBucket:
+    """线程安全的令牌桶, rate<=0表示不限速"""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预留一个令牌, 返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """解析Retry-After, 支持秒数和HTTP日期两种格式"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """进程内共享的请求限速器
+
+    只对配置了预算的主机限速(gql和usher), 视频分片等其它请求不受影响。
+    每个请求依次在全局、主机和代理的令牌桶上等待; 某个主机被限流后,
+    在暂停期内该主机(同一代理)的所有请求都会等待。
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 20,
+        endpoint_rates: dict[str, float] | None = None,
+        proxy_rate: float = 0,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        max_backoff: float = 60,
+    ):
+        self.global_bucket = TokenBucket(global_rate)
+        self.endpoint_buckets = {host: TokenBucket(rate) for host, rate in (endpoint_rates or {}).items()}
+        self.proxy_rate = proxy_rate
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._proxy_buckets: dict[str, TokenBucket] = {}
+        # (host, proxy) -> 暂停截止时间(monotonic)
+        self._blocked_until: dict[tuple[str, str], float] = {}
+
+    def is_limited(self, host: str) -> bool:
+        return host in self.endpoint_buckets
+
+    def _proxy_bucket(self, proxy: str) -> TokenBucket | None:
+        if not proxy or self.proxy_rate <= 0:
+            return None
+        with self._lock:
+            bucket = self._proxy_buckets.get(proxy)
+            if bucket is None:
+                bucket = self._proxy_buckets[proxy] = TokenBucket(self.proxy_rate)
+            return bucket
+
+    def acquire(self, host: str, proxy: str = "") -> float:
+        """
+        等待直到可以向host发送请求
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        if not self.is_limited(host):
+            return 0.0
+        buckets = [self.global_bucket, self.endpoint_buckets[host], self._proxy_bucket(proxy)]
+        # 同时预留各层令牌, 按最长的等待时间睡眠
+        wait = max(bucket.reserve() for bucket in buckets if bucket is not None)
+        with self._lock:
+            blocked = self._blocked_until.get((host, proxy), 0) - time.monotonic()
+        wait = max(wait, blocked)
+        if wait > 0:
+            logger.debug(f"请求 {host} 限速等待 {wait:.2f}s, 代理: {proxy or '无'}")
+            time.sleep(wait)
+        return max(0.0, wait)
+
+    def backoff(self, host: str, proxy: str, attempt: int, retry_after: str | None = None) -> float:
+        """
+        记录一次限流响应, 暂停该主机的请求
+
+        Args:
+            attempt (int): 第几次重试, 从0开始
+            retry_after (str | None): 响应中的Retry-After
+
+        Returns:
+            float: 暂停的秒数
+        """
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = min(self.max_backoff, self.backoff_base * (2**attempt)) * random.uniform(0.5, 1.5)
+        until = time.monotonic() + delay
+        with self._lock:
+            key = (host, proxy)
+            self._blocked_until[key] = max(self._blocked_until.get(key, 0), until)
+        return delay
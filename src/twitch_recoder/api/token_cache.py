@@ -0,0 +1,126 @@
+"""
+Twitch播放访问令牌缓存模块
+
+streamPlaybackAccessToken.value是一段包含expires字段的JSON, 在过期前可以重复使用
+"""
+
+import json
+import threading
+import time
+from typing import Callable, Iterable
+
+from loguru import logger
+
+
+def parse_token_expires(token: str) -> float | None:
+    """从访问令牌中解析过期时间
+
+    Args:
+        token (str): streamPlaybackAccessToken.value
+
+    Returns:
+        float | None: 过期时间戳(秒), 解析失败返回None
+    """
+    try:
+        expires = json.loads(token).get("expires")
+        return float(expires) if expires else None
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+class CachedToken:
+    def __init__(self, token: str, sign: str, expires: float):
+        self.token = token
+        self.sign = sign
+        self.expires = expires
+        self.fetch_time = time.time()
+
+    def __str__(self):
+        return f"CachedToken(expires={self.expires}, fetch_time={self.fetch_time})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class TokenCache:
+    """线程安全的按频道令牌缓存
+
+    令牌在过期前refresh_margin秒之前直接复用; 进入refresh_window后仍返回缓存的令牌,
+    同时在后台线程中刷新, 调用方不必等待GQL请求。
+    """
+
+    def __init__(
+        self,
+        fetch_func: Callable[[str], tuple[str | None, str | None]],
+        refresh_margin: float = 60,
+        refresh_window: float = 300,
+    ):
+        self.fetch_func = fetch_func
+        self.refresh_margin = refresh_margin
+        self.refresh_window = max(refresh_window, refresh_margin)
+        self._lock = threading.Lock()
+        self._tokens: dict[str, CachedToken] = {}
+        self._refreshing: set[str] = set()
+
+    def get(self, uid: str) -> tuple[str | None, str | None]:
+        """获取频道的令牌和签名, 缓存不可用时同步请求
+
+        Returns:
+            tuple: (token, sign)
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._tokens.get(uid)
+
+        if entry and now < entry.expires - self.refresh_margin:
+            if now >= entry.expires - self.refresh_window:
+                self._refresh_in_background(uid)
+            logger.debug(f"{uid} 复用缓存的访问令牌, 剩余有效期: {int(entry.expires - now)}s")
+            return entry.token, entry.sign
+
+        return self.refresh(uid)
+
+    def refresh(self, uid: str) -> tuple[str | None, str | None]:
+        """立即请求新的令牌并写入缓存"""
+        token, sign = self.fetch_func(uid)
+        if token and sign:
+            expires = parse_token_expires(token)
+            if expires:
+                with self._lock:
+                    self._tokens[uid] = CachedToken(token, sign, expires)
+            else:
+                logger.debug(f"{uid} 访问令牌中没有过期时间, 不缓存")
+        return token, sign
+
+    def _refresh_in_background(self, uid: str):
+        with self._lock:
+            if uid in self._refreshing:
+                return
+            self._refreshing.add(uid)
+
+        def worker():
+            try:
+                self.refresh(uid)
+            except Exception as e:
+                logger.error(f"{uid} 后台刷新访问令牌失败: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(uid)
+
+        threading.Thread(target=worker, name=f"TokenRefresh-{uid}", daemon=True).start()
+
+    def invalidate(self, uid: str):
+        """丢弃频道的缓存令牌, 例如usher拒绝了该令牌时"""
+        with self._lock:
+            self._tokens.pop(uid, None)
+
+    def prune(self, uids: Iterable[str]):
+        """移除不在uids中的频道"""
+        keep = set(uids)
+        with self._lock:
+            for uid in [uid for uid in self._tokens if uid not in keep]:
+                del self._tokens[uid]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tokens)
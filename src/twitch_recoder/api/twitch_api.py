@@ -1,19 +1,26 @@
-import requests
+import asyncio
+from concurrent.futures import Executor
+
 from loguru import logger
+from twitch_recoder.api.http_session import get_session
+from twitch_recoder.api.token_cache import TokenCache
 from twitch_recoder.config.my_config import (
     AUTHED_HEADERS,
-    TWITCH_GQL_URL,
+    CHANNEL_SHELL_QUERY_HASH,
     DEFAULT_HEADERS,
     PLAYBACK_ACCESS_TOKEN_QUERY,
     DEFAULT_VARIABLES,
+    config,
 )
 from twitch_recoder.common.m3u8_parser import parse_m3u8_url
-from twitch_recoder.common.stream_sorter import get_best_stream
+from twitch_recoder.common.metrics import api_request_errors, timed_call
+from twitch_recoder.common.stream_sorter import get_quality_policy, select_stream
 from twitch_recoder.common.utils import get_proxies
 from twitch_recoder.types.errors import NetWorkErr, OfflineErr
 from twitch_recoder.types.typeinfo import StreamInfo
 
 
+@timed_call("get_token_and_sign")
 def get_token_and_sign(uid: str):
     """
     获取Twitch流媒体的访问令牌和签名
@@ -24,7 +31,7 @@ def get_token_and_sign(uid: str):
     Returns:
         tuple: (token, sign)
     """
-    url = TWITCH_GQL_URL
+    url = config.gql_url
 
     headers = DEFAULT_HEADERS.copy()
 
@@ -40,7 +47,7 @@ def get_token_and_sign(uid: str):
     try:
         logger.debug(f"正在获取 {uid} 的访问令牌...")
         proxies = get_proxies()
-        response = requests.post(url, headers=headers, json=data, timeout=10, proxies=proxies)
+        response = get_session(proxies).post(url, headers=headers, json=data, timeout=10, proxies=proxies)
 
         if response.status_code == 200:
             response_data = response.json()
@@ -53,13 +60,17 @@ def get_token_and_sign(uid: str):
             logger.debug(f"response: {response.text}")
             logger.debug(f"headers: {response.request.headers}")
             logger.debug(f"data: {response.request.body}")
+            api_request_errors.inc(call="get_token_and_sign")
             return None, None
 
     except Exception as e:
+        # 异常不再抛出, timed_call统计不到, 在这里计数
         logger.error(f"获取令牌异常: {e}")
+        api_request_errors.inc(call="get_token_and_sign")
         return None, None
 
 
+@timed_call("get_m3u8_url")
 def get_m3u8_url(uid: str, token: str, sign: str):
     """
     获取M3U8播放列表URL
@@ -72,9 +83,9 @@ def get_m3u8_url(uid: str, token: str, sign: str):
     Returns:
         str: M3U8播放列表内容
     """
-    from twitch_recoder.config.my_config import TWITCH_USHER_URL, DEFAULT_PARAMS, DEFAULT_USER_AGENT
+    from twitch_recoder.config.my_config import DEFAULT_PARAMS, DEFAULT_USER_AGENT
 
-    url = TWITCH_USHER_URL.format(uid=uid)
+    url = config.usher_url.format(uid=uid)
     headers = {
         "User-Agent": DEFAULT_USER_AGENT,
         "Accept": "application/x-mpegURL, application/vnd.apple.mpegurl, application/json, text/plain",
@@ -87,7 +98,7 @@ def get_m3u8_url(uid: str, token: str, sign: str):
     }
 
     proxies = get_proxies()
-    response = requests.get(url, headers=headers, params=params, timeout=10, proxies=proxies)
+    response = get_session(proxies).get(url, headers=headers, params=params, timeout=10, proxies=proxies)
     logger.debug(
         f"uid:{uid}, url:{url}, status_code: {response.status_code}, headers: {response.request.headers}, params: {response.request.body}"
     )
@@ -95,69 +106,215 @@ def get_m3u8_url(uid: str, token: str, sign: str):
     return result
 
 
-def get_room_info(uid: str, token: str):
-    url = TWITCH_GQL_URL
-    headers = AUTHED_HEADERS.copy()
-    headers["Client-Integrity"] = token
-    data = [
-        {
-            "operationName": "ChannelShell",
-            "variables": {"login": uid},
-            "extensions": {
-                "persistedQuery": {
-                    "version": 1,
-                    "sha256Hash": "580ab410bcd0c1ad194224957ae2241e5d252b2c5173d8e0cce9d32d5bb14efe",
-                }
-            },
+# 按频道缓存的播放访问令牌, 过期前复用
+playback_token_cache = TokenCache(get_token_and_sign)
+
+
+def _channel_shell_operation(uid: str) -> dict:
+    return {
+        "operationName": "ChannelShell",
+        "variables": {"login": uid},
+        "extensions": {
+            "persistedQuery": {
+                "version": 1,
+                "sha256Hash": CHANNEL_SHELL_QUERY_HASH,
+            }
         },
-    ]
+    }
+
+
+# ChannelShell对不存在或已封禁的频道返回的类型, 是确定的结果而不是请求失败
+MISSING_USER_TYPES = ("UserDoesNotExist", "UserError")
+# 已提示过不存在的频道, 之后只输出DEBUG日志
+_missing_uids: set[str] = set()
+
+
+def _parse_channel_shell(item: dict, uid: str = "") -> tuple[str, bool] | None:
+    """从单个ChannelShell响应中解析昵称和开播状态, 响应出错时返回None
+
+    频道不存在(UserDoesNotExist/UserError)时按未开播处理, 调度器照常退避, 不会每轮都重试和报警。
+    """
+    user_data = ((item or {}).get("data") or {}).get("userOrError") or {}
+    if user_data.get("__typename") in MISSING_USER_TYPES:
+        if uid not in _missing_uids:
+            _missing_uids.add(uid)
+            logger.warning(f"频道 {uid} 不存在或已被封禁, 按未开播处理: {item}")
+        else:
+            logger.debug(f"频道 {uid} 不存在或已被封禁")
+        return uid, False
+    if "login" not in user_data:
+        return None
+    _missing_uids.discard(uid)
+    login_name = str(user_data["login"]) if user_data["login"] else ""
+    display_name = str(user_data['displayName']) if user_data.get('displayName') else login_name
+    nickname = f"{display_name}-{login_name}"
+    status = True if user_data.get('stream') else False
+    return nickname, status
+
+
+@timed_call("get_rooms_info")
+def get_rooms_info(uids: list[str], token: str = "") -> dict[str, tuple[str, bool]]:
+    """在一个GQL请求中批量查询多个频道的房间信息
+
+    Args:
+        uids (list[str]): Twitch频道用户名列表
+        token (str): 可选的Client-Integrity, 为空时不发送该请求头
+
+    Returns:
+        dict[str, tuple[str, bool]]: uid -> (nickname, status), 请求失败或查询出错的频道不在结果中
+    """
+    if not uids:
+        return {}
+
+    url = config.gql_url
+    headers = AUTHED_HEADERS.copy()
+    if token:
+        headers["Client-Integrity"] = token
+    else:
+        headers.pop("Client-Integrity", None)
+    data = [_channel_shell_operation(uid) for uid in uids]
 
     proxies = get_proxies()
-    response = requests.post(url, headers=headers, json=data, timeout=10, proxies=proxies)
+    response = get_session(proxies).post(url, headers=headers, json=data, timeout=10, proxies=proxies)
     if response.status_code != 200:
-        logger.error(f"获取uid:{uid}, url:{url}房间信息失败: {response.status_code}")
+        logger.error(f"批量获取{len(uids)}个频道, url:{url}房间信息失败: {response.status_code}")
         logger.debug(f"response: {response.text}")
         logger.debug(f"headers: {response.request.headers}")
         logger.debug(f"data: {response.request.body}")
-        return None, False
+        api_request_errors.inc(call="get_rooms_info")
+        return {}
 
     json_data = response.json()
-    user_data = json_data[0]['data']['userOrError']
-    login_name = str(user_data["login"]) if user_data["login"] else ""
-    display_name = str(user_data['displayName']) if user_data['displayName'] else login_name
-    nickname = f"{display_name}-{login_name}"
-    status = True if user_data['stream'] else False
-    return nickname, status
+    if not isinstance(json_data, list):
+        json_data = [json_data]
+
+    # GQL批量响应与请求中的操作顺序一一对应
+    rooms = {}
+    for uid, item in zip(uids, json_data):
+        room = _parse_channel_shell(item, uid)
+        if room is None:
+            logger.warning(f"获取uid:{uid}房间信息失败: {item}")
+            continue
+        rooms[uid] = room
+    return rooms
+
+
+def get_room_info(uid: str, token: str):
+    room = get_rooms_info([uid], token).get(uid)
+    if room is None:
+        return None, False
+    return room
+
+
+def check_liveness(uids: list[str], batch_size: int = 30) -> dict[str, tuple[str, bool]]:
+    """按batch_size分批检测频道开播状态, 不需要先获取访问令牌
+
+    Args:
+        uids (list[str]): Twitch频道用户名列表
+        batch_size (int): 每个GQL请求包含的ChannelShell操作数
+
+    Returns:
+        dict[str, tuple[str, bool]]: uid -> (nickname, status), 检测失败的频道不在结果中
+    """
+    batch_size = max(1, batch_size)
+    rooms = {}
+    for index in range(0, len(uids), batch_size):
+        batch = uids[index : index + batch_size]
+        try:
+            rooms.update(get_rooms_info(batch))
+        except Exception as e:
+            logger.error(f"批量检测开播状态异常: {e}")
+    return rooms
+
 
+def select_best_stream(uid: str, nickname: str | None, playlist: str) -> StreamInfo | None:
+    """解析usher返回的播放列表并按画质策略选出要录制的流媒体
 
-def process_twitch_stream(uid: str) -> StreamInfo | None:
-    """处理Twitch流媒体的核心逻辑"""
+    Args:
+        uid (str): Twitch频道用户名
+        nickname (str | None): 频道昵称
+        playlist (str): M3U8播放列表内容
+
+    Returns:
+        StreamInfo | None: 最佳流媒体信息
+    """
+    logger.debug(f"uid:{uid}获取到M3U8播放列表长度: {len(playlist)}")
+
+    # 解析播放列表, 相对URI按usher地址补全
+    streams = parse_m3u8_url(playlist, config.usher_url.format(uid=uid))
+    logger.debug(f"uid:{uid}解析到 {len(streams)} 个流媒体源")
+
+    for stream in streams:
+        stream.uid = uid
+        if nickname:
+            stream.nickname = nickname
+        else:
+            stream.nickname = uid
+
+    # 按频道的画质策略选择流媒体, 录制中降级和切换也只在满足策略的流之间进行
+    best_stream, variants = select_stream(streams, get_quality_policy(uid))
+    if best_stream:
+        best_stream.variants = variants
+    return best_stream
+
+
+def process_twitch_stream(uid: str, nickname: str | None = None) -> StreamInfo | None:
+    """处理Twitch流媒体的核心逻辑
+
+    Args:
+        uid (str): Twitch频道用户名
+        nickname (str | None): 已通过批量检测确认开播时传入昵称, 跳过房间信息查询
+    """
 
     # 获取访问令牌
-    token, sign = get_token_and_sign(uid)
+    token, sign = playback_token_cache.get(uid)
 
     if token and sign:
-        nickname, status = get_room_info(uid, token)
-        if not status:
-            raise OfflineErr(f"频道 {uid} 未开播")
+        if nickname is None:
+            nickname, status = get_room_info(uid, token)
+            if not status:
+                raise OfflineErr(f"频道 {uid} 未开播")
 
         # 获取M3U8播放列表
         result = get_m3u8_url(uid, token, sign)
-        logger.debug(f"uid:{uid}获取到M3U8播放列表长度: {len(result)}")
+        best_stream = select_best_stream(uid, nickname, result)
+        if best_stream is None:
+            # usher没有返回可用的流, 令牌可能已失效, 下次重新获取
+            playback_token_cache.invalidate(uid)
+        return best_stream
+    else:
+        raise NetWorkErr("无法获取访问令牌，请检查网络连接或认证信息")
 
-        # 解析播放列表
-        streams = parse_m3u8_url(result)
-        logger.debug(f"uid:{uid}解析到 {len(streams)} 个流媒体源")
 
-        for stream in streams:
-            stream.uid = uid
-            if nickname:
-                stream.nickname = nickname
-            else:
-                stream.nickname = uid
+async def process_twitch_stream_async(
+    uid: str, executor: Executor | None = None, nickname: str | None = None
+) -> StreamInfo | None:
+    """process_twitch_stream的协程版本
 
-        # 获取最佳流媒体
-        best_stream = get_best_stream(streams)
-        return best_stream
-    else:
+    令牌 -> 房间信息 -> usher 三个阻塞请求依次在executor中执行,
+    调用方可以在一个事件循环里并发等待大量频道。
+
+    Args:
+        uid (str): Twitch频道用户名
+        executor (Executor | None): 执行阻塞请求的线程池, None时使用事件循环默认线程池
+        nickname (str | None): 已通过批量检测确认开播时传入昵称, 跳过房间信息查询
+
+    Returns:
+        StreamInfo | None: 最佳流媒体信息
+    """
+    loop = asyncio.get_running_loop()
+
+    token, sign = await loop.run_in_executor(executor, playback_token_cache.get, uid)
+    if not token or not sign:
         raise NetWorkErr("无法获取访问令牌，请检查网络连接或认证信息")
+
+    if nickname is None:
+        nickname, status = await loop.run_in_executor(executor, get_room_info, uid, token)
+        if not status:
+            raise OfflineErr(f"频道 {uid} 未开播")
+
+    result = await loop.run_in_executor(executor, get_m3u8_url, uid, token, sign)
+    best_stream = select_best_stream(uid, nickname, result)
+    if best_stream is None:
+        playback_token_cache.invalidate(uid)
+    return best_stream
@@ -2,16 +2,96 @@
 """
 Twitch录制器命令行入口点
 
-可以直接运行此脚本来使用命令行功能
+不带子命令时启动录制; status / stop / poll 子命令通过控制套接字与运行中的录制器通信,
+只导入标准库和click, 不加载requests和录制相关模块
 """
 
+import json
 import sys
 import os
+import time
+
+import click
 
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from twitch_recoder.main import cli
+from twitch_recoder.common.control import send_command, socket_path_from_config
+
+
+DEFAULT_CONFIG_PATH = "config/config.json"
+
+
+def _send(ctx: click.Context, command: str, **params):
+    socket_path = ctx.obj["socket"] or socket_path_from_config(ctx.obj["config"])
+    try:
+        return send_command(socket_path, command, **params)
+    except (ConnectionError, RuntimeError) as e:
+        raise click.ClickException(str(e))
+
+
+def _format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    return time.strftime("%H:%M:%S", time.gmtime(seconds))
+
+
+@click.group(invoke_without_command=True)
+@click.option("--config", "-c", type=click.Path(), default=DEFAULT_CONFIG_PATH, help="配置文件路径")
+@click.option("--verbose", "-v", is_flag=True, help="显示详细日志")
+@click.option("--quiet", "-q", is_flag=True, help="只显示错误信息")
+@click.option("--socket", "socket_path", default="", help="控制套接字路径, 默认从配置文件读取")
+@click.pass_context
+def cli(ctx: click.Context, config: str, verbose: bool, quiet: bool, socket_path: str):
+    """Twitch录制器 - 获取和解析Twitch流媒体信息"""
+    ctx.obj = {"config": config, "socket": socket_path}
+    if ctx.invoked_subcommand is None:
+        from twitch_recoder.main import main
+
+        main(config, verbose, quiet)
+
+
+@cli.command()
+@click.option("--json", "as_json", is_flag=True, help="输出JSON")
+@click.pass_context
+def status(ctx: click.Context, as_json: bool):
+    """查看运行中的录制器状态和正在进行的录制"""
+    data = _send(ctx, "status")
+    listing = _send(ctx, "list")
+    if as_json:
+        click.echo(json.dumps({"status": data, **listing}, ensure_ascii=False, indent=2))
+        return
+    click.echo(
+        f"PID: {data['pid']}, 已运行: {_format_duration(data['uptime'])}, 频道: {data['channels']}, "
+        f"轮询引擎: {data['poll_engine']}, 录制中: {data['recordings']}"
+    )
+    click.echo(f"后处理: {data['postprocess']}")
+    click.echo(f"归档: {data['archive']}")
+    for task in listing["tasks"]:
+        click.echo(f"  {task['uid']:<20} {task['status']:<10} {_format_duration(task['duration'])}  {task['task_id']}")
+    for item in listing["recordings"]:
+        click.echo(f"  {item['save_file_path']}: {item['total_size'] / 1024 / 1024:.1f}MB, {item['bitrate_kbps']:.0f}kbps")
+
+
+@cli.command()
+@click.argument("uid")
+@click.pass_context
+def stop(ctx: click.Context, uid: str):
+    """停止指定频道正在进行的录制"""
+    data = _send(ctx, "stop", uid=uid)
+    if not data["stopped"]:
+        click.echo(f"{uid} 没有正在进行的录制")
+        return
+    click.echo(f"已通知停止: {', '.join(data['stopped'])}")
+
+
+@cli.command()
+@click.argument("uids", nargs=-1)
+@click.pass_context
+def poll(ctx: click.Context, uids: tuple[str, ...]):
+    """立即检测指定频道, 不指定时检测全部未在录制的频道"""
+    data = _send(ctx, "poll", uids=list(uids))
+    click.echo(f"已安排检测 {data['scheduled']} 个频道")
 
 
 def entry_point():
@@ -0,0 +1,106 @@
+"""
+控制套接字的协议和客户端
+
+守护进程在Unix域套接字上监听, 每个连接发送一行JSON请求 {"command": ..., ...},
+收到一行JSON响应 {"ok": true, "data": ...} 或 {"ok": false, "error": ...}。
+默认的套接字路径取决于可以热加载的data_path, 守护进程启动时把实际监听的路径写入
+只由配置文件路径决定的记录文件, 命令行客户端优先使用记录的路径。
+这里只使用标准库, 命令行客户端导入本模块不会加载requests和录制相关模块。
+"""
+
+import hashlib
+import json
+import os
+import socket
+import tempfile
+
+
+DEFAULT_SOCKET_NAME = "control.sock"
+COMMANDS = ("status", "list", "stop", "poll")
+
+
+def resolve_socket_path(control_socket: str, data_path: str | list[str]) -> str:
+    """control_socket为空时使用第一个录制目录下的control.sock"""
+    if control_socket:
+        return control_socket
+    first = data_path if isinstance(data_path, str) else (data_path[0] if data_path else "data")
+    return os.path.join(first, DEFAULT_SOCKET_NAME)
+
+
+def socket_record_path(config_path: str) -> str:
+    """记录守护进程实际监听路径的文件, 位置只由配置文件的绝对路径决定"""
+    digest = hashlib.sha1(os.path.abspath(config_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"twitch_recoder-{digest}.socket")
+
+
+def read_socket_record(config_path: str) -> str:
+    """读取运行中的守护进程记录的套接字路径, 没有记录或记录属于其它用户时返回空字符串"""
+    record_path = socket_record_path(config_path)
+    try:
+        if hasattr(os, "getuid") and os.stat(record_path).st_uid != os.getuid():
+            return ""
+        with open(record_path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def socket_path_from_config(config_path: str) -> str:
+    """优先使用守护进程启动时记录的路径, 没有记录时从配置文件中读取, 不导入配置模块"""
+    recorded = read_socket_record(config_path)
+    if recorded:
+        return recorded
+    control_socket = ""
+    data_path: str | list[str] = "data"
+    if config_path and os.path.isfile(config_path):
+        with open(config_path, "r") as f:
+            data = json.load(f)
+        control_socket = data.get("control_socket") or ""
+        data_path = data.get("data_path") or "data"
+    return resolve_socket_path(control_socket, data_path)
+
+
+def encode_message(message: dict) -> bytes:
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def decode_message(line: bytes) -> dict:
+    message = json.loads(line.decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("消息必须是JSON对象")
+    return message
+
+
+def send_command(socket_path: str, command: str, timeout: float = 10, **params) -> dict:
+    """
+    向守护进程发送命令
+
+    Args:
+        socket_path (str): 控制套接字路径
+        command (str): status / list / stop / poll
+        timeout (float): 连接和等待响应的超时(秒)
+
+    Returns:
+        dict: 响应中的data
+
+    Raises:
+        ConnectionError: 无法连接守护进程
+        RuntimeError: 守护进程返回错误
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise ConnectionError("当前平台不支持Unix域套接字")
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(encode_message({"command": command, **params}))
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except OSError as e:
+        raise ConnectionError(f"无法连接 {socket_path}: {e}") from e
+    if not line:
+        raise ConnectionError(f"{socket_path} 没有返回响应")
+    response = decode_message(line)
+    if not response.get("ok"):
+        raise RuntimeError(response.get("error") or "未知错误")
+    return response.get("data")
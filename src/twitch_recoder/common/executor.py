@@ -0,0 +1,110 @@
+"""
+有界线程池模块
+
+线程数和排队任务数都有上限, 队列已满时直接拒绝而不是继续堆积,
+并统计排队深度和等待时间, 便于按主机调整线程池大小
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable
+
+from loguru import logger
+
+
+class BoundedExecutor:
+    """带背压的线程池
+
+    每个任务可以携带若干key(例如频道UID), key对应的任务排队或执行期间,
+    同一key的新任务会被跳过, 避免同一频道在队列中重复等待。
+    """
+
+    def __init__(self, max_workers: int = 8, max_queue: int = 256, name: str = "worker"):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(1, max_queue)
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._keys: set[str] = set()
+        self._queued = 0
+        self._running = 0
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def is_pending(self, key: str) -> bool:
+        """key对应的任务是否正在排队或执行"""
+        with self._lock:
+            return key in self._keys
+
+    def submit(self, func: Callable, *args, keys: Iterable[str] = (), force: bool = False, **kwargs) -> Future | None:
+        """
+        提交任务
+
+        Args:
+            func (Callable): 任务函数
+            keys (Iterable[str]): 任务对应的key, 任一key已在队列中时跳过
+            force (bool): 不受排队上限限制, 用于数量本身有限且不能丢弃的任务
+
+        Returns:
+            Future | None: 队列已满或key重复时返回None
+        """
+        keys = list(keys)
+        with self._lock:
+            if any(key in self._keys for key in keys):
+                return None
+            if self._queued >= self.max_queue and not force:
+                self.rejected += 1
+                return None
+            self._keys.update(keys)
+            self._queued += 1
+            self.submitted += 1
+        enqueue_time = time.monotonic()
+
+        def job():
+            wait = time.monotonic() - enqueue_time
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.completed += 1
+                    self._keys.difference_update(keys)
+
+        try:
+            return self._executor.submit(job)
+        except RuntimeError as e:
+            # 线程池已关闭
+            with self._lock:
+                self._queued -= 1
+                self._keys.difference_update(keys)
+            logger.debug(f"{self.name} 线程池已关闭, 任务未提交: {e}")
+            return None
+
+    def stats(self) -> dict:
+        """获取排队深度、执行数和等待时间统计"""
+        with self._lock:
+            started = self.completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "avg_wait": self.total_wait / started if started else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
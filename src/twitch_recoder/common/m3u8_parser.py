@@ -1,62 +1,131 @@
-from loguru import logger
-from twitch_recoder.common.utils import format_bandwidth
-from twitch_recoder.types.typeinfo import StreamInfo
+import re
+from urllib.parse import urljoin
 
+from twitch_recoder.types.typeinfo import MediaPlaylist, MediaSegment, StreamInfo
 
-def parse_m3u8_url(m3u8_url: str) -> list[StreamInfo]:
+
+# RFC 8216 4.2 属性列表: 名称=值, 值为带引号的字符串(可以包含逗号)或不含逗号的内容;
+# 从左向右依次匹配, 引号内的逗号和"BANDWIDTH="之类的文本不会被当成新的属性
+_ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attribute_list(value: str) -> dict[str, str]:
+    """
+    解析HLS标签的属性列表, 正确处理带引号且包含逗号的值, 如CODECS="avc1.64002A,mp4a.40.2"
+
+    Args:
+        value (str): 标签冒号之后的内容
+
+    Returns:
+        dict[str, str]: 属性名 -> 属性值(已去掉引号)
+    """
+    return {name: raw[1:-1] if raw[:1] == '"' else raw for name, raw in _ATTRIBUTE_RE.findall(value)}
+
+
+def _to_number(value: str | None, kind: type[int] | type[float]):
+    """属性值转换为数字, 缺失或格式不对时为0"""
+    if not value:
+        return kind(0)
+    try:
+        return kind(value)
+    except ValueError:
+        return kind(0)
+
+
+def _first_uri(text: str) -> str:
+    """标签之后的第一个URI行, 跳过空行和注释"""
+    for line in text.split("\n"):
+        line = line.strip()
+        if line and line[0] != "#":
+            return line
+    return ""
+
+
+def parse_m3u8_url(m3u8_url: str, base_url: str = "") -> list[StreamInfo]:
     """
-    解析M3U8播放列表,提取不同分辨率的流媒体URL
+    解析M3U8主播放列表,提取不同分辨率的流媒体URL
+
+    按行首的#EXT-X-STREAM-INF标签切分播放列表, 不逐行处理; 每段的第一行是属性列表, 之后第一个非注释行是URI。
+    #EXT-X-MEDIA提供的GROUP-ID和NAME按VIDEO属性关联到对应的流。
 
     Args:
         m3u8_url (str): M3U8播放列表内容
+        base_url (str): 播放列表URL, 用于补全相对URI
 
     Returns:
         list[StreamInfo]: 包含流媒体信息的StreamInfo对象列表
     """
+    # 标签必须位于行首, 前面补一个换行以便统一按"\n#TAG:"切分
+    m3u8_url = "\n" + m3u8_url
+
+    media_names: dict[str, str] = {}
+    if "\n#EXT-X-MEDIA:" in m3u8_url:
+        for chunk in m3u8_url.split("\n#EXT-X-MEDIA:")[1:]:
+            attributes = parse_attribute_list(chunk.partition("\n")[0].rstrip())
+            if attributes.get("TYPE") == "VIDEO" and "GROUP-ID" in attributes:
+                media_names[attributes["GROUP-ID"]] = attributes.get("NAME", "")
+
     streams = []
-    lines = m3u8_url.split("\n")
+    for chunk in m3u8_url.split("\n#EXT-X-STREAM-INF:")[1:]:
+        line, _, rest = chunk.partition("\n")
+        url = rest.partition("\n")[0].strip()
+        if not url or url[0] == "#":
+            url = _first_uri(rest)
+            if not url:
+                continue
+        if base_url and not url.startswith(("https://", "http://")):
+            url = urljoin(base_url, url)
 
-    for index, line in enumerate(lines):
-        line = line.strip()
-        if line.startswith("#EXT-X-STREAM-INF"):
-            # 解析流媒体信息
-            bandwidth = None
-            resolution = None
-            frame_rate = None
-            codecs = None
-            url = None
-
-            # 提取BANDWIDTH, RESOLUTION, FRAME-RATE等信息
-            if "BANDWIDTH=" in line:
-                bandwidth = int(line.split("BANDWIDTH=")[1].split(",")[0])
-
-            if "RESOLUTION=" in line:
-                resolution = line.split("RESOLUTION=")[1].split(",")[0]
-
-            if "FRAME-RATE=" in line:
-                frame_rate = float(line.split("FRAME-RATE=")[1].split(",")[0])
-
-            if "CODECS=" in line:
-                codecs = line.split('CODECS="')[1].split('"')[0]
-
-            # 查找下一个HTTPS行（流媒体URL）
-            for next_index in range(index + 1, len(lines)):
-                next_line = lines[next_index].strip()
-                if next_line.startswith("https://"):
-                    url = next_line
-                    break
-
-            if url:
-                # 创建StreamInfo对象
-                stream_info = StreamInfo(
-                    url=url,
-                    resolution=resolution or "未知",
-                    bandwidth=bandwidth or 0,
-                    frame_rate=frame_rate or 0.0,
-                    codecs=codecs or "未知",
-                )
-                streams.append(stream_info)
-                logger.debug(f"找到流媒体: {stream_info}")
+        attributes = parse_attribute_list(line.rstrip())
+        group_id = attributes.get("VIDEO", "")
+        stream_info = StreamInfo(
+            url=url,
+            resolution=attributes.get("RESOLUTION") or "未知",
+            bandwidth=_to_number(attributes.get("BANDWIDTH"), int),
+            frame_rate=_to_number(attributes.get("FRAME-RATE"), float),
+            codecs=attributes.get("CODECS") or "未知",
+        )
+        stream_info.group_id = group_id
+        stream_info.name = media_names.get(group_id, "")
+        streams.append(stream_info)
 
     return streams
 
+
+def parse_media_playlist(content: str, base_url: str = "") -> MediaPlaylist:
+    """
+    解析HLS媒体播放列表
+
+    Args:
+        content (str): 媒体播放列表内容
+        base_url (str): 播放列表URL, 用于补全相对分片地址
+
+    Returns:
+        MediaPlaylist: 按EXT-X-MEDIA-SEQUENCE编号的分片列表
+    """
+    playlist = MediaPlaylist()
+    sequence = 0
+    duration = 0.0
+    title = ""
+
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] != "#":
+            url = urljoin(base_url, line) if base_url else line
+            playlist.segments.append(MediaSegment(sequence, url, duration, title))
+            sequence += 1
+            duration = 0.0
+            title = ""
+        elif line.startswith("#EXTINF:"):
+            value, _, title = line[8:].partition(",")
+            duration = float(value)
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            playlist.media_sequence = sequence = int(line[22:])
+        elif line.startswith("#EXT-X-TARGETDURATION:"):
+            playlist.target_duration = float(line[22:])
+        elif line.startswith("#EXT-X-ENDLIST"):
+            playlist.ended = True
+
+    return playlist
@@ -0,0 +1,223 @@
+"""
+代理池模块
+
+后台线程定期探测每个代理的可用性和延迟; API请求按得分(延迟 x 负载)的倒数在健康代理间
+加权随机分配, 录制任务租用得分最低的代理并在结束时归还。
+连续失败的代理被移出轮换, 探测恢复后重新加入。
+"""
+
+import random
+import threading
+import time
+
+import requests
+from loguru import logger
+
+
+class ProxyState:
+    # 延迟的指数加权平均系数
+    LATENCY_ALPHA = 0.3
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.latency: float | None = None
+        self.failures = 0
+        # 正在使用该代理的录制任务数
+        self.active = 0
+        self.last_check: float | None = None
+
+    def score(self) -> float:
+        # 尚未探测的代理按1秒估计, 让它也有机会被选中
+        return (self.latency if self.latency is not None else 1.0) * (1 + self.active)
+
+    def record_latency(self, latency: float):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = self.LATENCY_ALPHA * latency + (1 - self.LATENCY_ALPHA) * self.latency
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "latency": self.latency,
+            "failures": self.failures,
+            "active": self.active,
+            "last_check": self.last_check,
+        }
+
+    def __str__(self):
+        return f"ProxyState(url={self.url}, healthy={self.healthy}, latency={self.latency}, active={self.active})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ProxyPool:
+    """带健康检查的代理池"""
+
+    def __init__(
+        self,
+        urls: list[str],
+        check_url: str = "https://www.twitch.tv/",
+        check_interval: float = 60,
+        max_failures: int = 3,
+        timeout: float = 10,
+    ):
+        self.check_url = check_url
+        self.check_interval = check_interval
+        self.max_failures = max(1, max_failures)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._proxies: dict[str, ProxyState] = {url: ProxyState(url) for url in dict.fromkeys(urls) if url}
+        # 录制任务(以保存路径区分) -> 租用的代理
+        self._leases: dict[str, str] = {}
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def update(self, urls: list[str], check_url: str, check_interval: float, max_failures: int):
+        """配置变化时更新代理列表, 保留仍在列表中的代理的状态; 已移除代理上的录制继续使用到结束"""
+        with self._lock:
+            self.check_url = check_url
+            self.check_interval = check_interval
+            self.max_failures = max(1, max_failures)
+            urls = [url for url in dict.fromkeys(urls) if url]
+            self._proxies = {url: self._proxies.get(url) or ProxyState(url) for url in urls}
+        logger.info(f"代理池已更新, 代理数: {len(urls)}")
+
+    def _candidates(self) -> list[ProxyState]:
+        healthy = [state for state in self._proxies.values() if state.healthy]
+        if healthy:
+            return healthy
+        # 全部不可用时仍选择失败最少的代理, 不直接连接, 以免暴露本机地址或违反网络限制
+        return sorted(self._proxies.values(), key=lambda state: state.failures)[:1]
+
+    def _choose(self, weighted: bool = False) -> ProxyState | None:
+        candidates = self._candidates()
+        if not candidates:
+            return None
+        if weighted:
+            # API请求按得分的倒数加权随机, 偏向快的代理但不会全部集中到同一个
+            return random.choices(candidates, weights=[1 / max(state.score(), 1e-3) for state in candidates])[0]
+        # 录制任务长期占用代理, 直接选延迟 x 负载最低的
+        return min(candidates, key=lambda state: state.score())
+
+    def select(self) -> str:
+        """为一次API请求选择代理, 不计入负载"""
+        with self._lock:
+            state = self._choose(weighted=True)
+            return state.url if state else ""
+
+    def acquire(self, owner: str) -> str:
+        """为录制任务租用代理, 计入该代理的负载, 结束时调用release"""
+        with self._lock:
+            self._release(owner)
+            state = self._choose()
+            if state is None:
+                return ""
+            state.active += 1
+            self._leases[owner] = state.url
+            return state.url
+
+    def _release(self, owner: str):
+        url = self._leases.pop(owner, None)
+        state = self._proxies.get(url) if url else None
+        if state and state.active > 0:
+            state.active -= 1
+
+    def release(self, owner: str):
+        with self._lock:
+            self._release(owner)
+
+    def reassign(self, owner: str) -> str:
+        """录制中当前代理失效时换一个代理, 没有其它可用代理时保持不变"""
+        with self._lock:
+            current = self._leases.get(owner, "")
+            state = self._choose()
+            if state is None or state.url == current:
+                return current
+            self._release(owner)
+            state.active += 1
+            self._leases[owner] = state.url
+            return state.url
+
+    def is_healthy(self, url: str) -> bool:
+        with self._lock:
+            state = self._proxies.get(url)
+            return state is None or state.healthy
+
+    def report_success(self, url: str):
+        with self._lock:
+            state = self._proxies.get(url)
+            if state:
+                state.failures = 0
+
+    def report_failure(self, url: str):
+        """记录一次连接失败, 连续失败达到上限后移出轮换"""
+        with self._lock:
+            state = self._proxies.get(url)
+            if not state:
+                return
+            state.failures += 1
+            if state.healthy and state.failures >= self.max_failures:
+                state.healthy = False
+                logger.warning(f"代理 {url} 连续失败 {state.failures} 次, 已移出轮换")
+
+    def check(self, url: str) -> bool:
+        """探测单个代理, 返回是否可用"""
+        start = time.monotonic()
+        try:
+            requests.head(self.check_url, proxies={"http": url, "https": url}, timeout=self.timeout)
+            ok = True
+        except requests.RequestException as e:
+            logger.debug(f"代理 {url} 探测失败: {e}")
+            ok = False
+        latency = time.monotonic() - start
+
+        with self._lock:
+            state = self._proxies.get(url)
+            if not state:
+                return ok
+            state.last_check = time.time()
+            if ok:
+                state.record_latency(latency)
+                state.failures = 0
+                if not state.healthy:
+                    logger.info(f"代理 {url} 已恢复, 延迟: {latency:.2f}s")
+                state.healthy = True
+            else:
+                # 与report_failure相同, 连续失败达到上限后才移出轮换
+                state.failures += 1
+                if state.healthy and state.failures >= self.max_failures:
+                    state.healthy = False
+                    logger.warning(f"代理 {url} 连续失败 {state.failures} 次, 已移出轮换")
+        return ok
+
+    def check_all(self):
+        threads = [threading.Thread(target=self.check, args=(url,), daemon=True) for url in list(self._proxies)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.check_all()
+            self._stop_event.wait(self.check_interval)
+
+    def start(self):
+        """启动后台健康检查"""
+        if not self._proxies or self.check_interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ProxyHealthCheck", daemon=True)
+        self._thread.start()
+        logger.info(f"代理池已启动, 代理数: {len(self._proxies)}, 检查间隔: {self.check_interval}s")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [state.to_dict() for state in self._proxies.values()]
@@ -1,46 +1,137 @@
+from functools import lru_cache
+
 from loguru import logger
-from twitch_recoder.common.utils import extract_resolution_width
+from twitch_recoder.common.utils import extract_resolution_height, extract_resolution_width
+from twitch_recoder.config.my_config import config
 from twitch_recoder.types.typeinfo import StreamInfo
 
 
-def sort_streams(streams: list[StreamInfo]):
+# CODECS中视频编码的前缀 -> 画质策略中使用的编码名称
+VIDEO_CODECS = {"av01": "av1", "avc1": "h264", "avc3": "h264", "hvc1": "h265", "hev1": "h265"}
+
+
+@lru_cache(maxsize=256)
+def _parse_resolution(resolution: str) -> tuple[int, int]:
+    """(宽度, 高度), 同一播放列表中只有少数几种分辨率, 缓存解析结果"""
+    return extract_resolution_width(resolution), extract_resolution_height(resolution)
+
+
+@lru_cache(maxsize=256)
+def get_video_codec(codecs: str) -> str:
+    """从CODECS属性中取出视频编码名称(av1 / h264 / h265), 纯音频或无法识别时返回空字符串"""
+    for codec in (codecs or "").split(","):
+        name = VIDEO_CODECS.get(codec.strip().split(".")[0].lower())
+        if name:
+            return name
+    return ""
+
+
+def is_audio_only(stream: StreamInfo) -> bool:
+    return stream.group_id == "audio_only" or (not get_video_codec(stream.codecs) and "mp4a" in stream.codecs)
+
+
+class QualityPolicy:
     """
-    排序流媒体：
-    1. 先按分辨率从大到小排序
-    2. 相同分辨率再按帧率从大到小排序
-    3. 如果缺少分辨率或帧率信息，则按带宽从大到小排序
+    画质策略, 在一次遍历中从usher返回的流中选出要录制的流
+
+    Attributes:
+        max_height (int): 最大高度(像素), 0表示不限制
+        max_fps (float): 最大帧率, 0表示不限制
+        codecs (list[str]): 视频编码偏好, 如["av1", "h264"]; 分辨率和帧率相同时靠前的编码优先, 未列出的编码排在最后
+        max_bandwidth (int): 最大码率(bps), 0表示不限制
+        audio_only (bool): 只录制音频
     """
 
-    def can_sort_by_resolution_and_framerate(streams):
-        """检查是否所有流媒体都有分辨率和帧率信息"""
-        for stream in streams:
-            if not stream.resolution or not stream.frame_rate:
-                return False
+    FIELDS = ("max_height", "max_fps", "codecs", "max_bandwidth", "audio_only")
+
+    def __init__(
+        self,
+        max_height: int = 0,
+        max_fps: float = 0,
+        codecs: list[str] | str | None = None,
+        max_bandwidth: int = 0,
+        audio_only: bool = False,
+    ):
+        if isinstance(codecs, str):
+            codecs = codecs.split(",")
+        self.max_height = int(max_height or 0)
+        self.max_fps = float(max_fps or 0)
+        self.codecs = [str(codec).strip().lower() for codec in codecs or [] if str(codec).strip()]
+        self.max_bandwidth = int(max_bandwidth or 0)
+        self.audio_only = bool(audio_only)
+        self._codec_rank = {codec: len(self.codecs) - index for index, codec in enumerate(self.codecs)}
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> "QualityPolicy":
+        unknown = set(data or {}) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"不支持的画质策略配置项: {', '.join(sorted(unknown))}")
+        return cls(**(data or {}))
+
+    def allows(self, stream: StreamInfo) -> bool:
+        """流是否满足策略的全部限制"""
+        if self.audio_only:
+            return is_audio_only(stream)
+        if self.max_height and _parse_resolution(stream.resolution)[1] > self.max_height:
+            return False
+        if self.max_fps and stream.frame_rate > self.max_fps:
+            return False
+        if self.max_bandwidth and stream.bandwidth > self.max_bandwidth:
+            return False
         return True
 
-    # 检查是否所有流媒体都有分辨率和帧率信息
-    if can_sort_by_resolution_and_framerate(streams):
-        # 按分辨率和帧率排序
-        return sorted(
-            streams,
-            key=lambda x: (
-                extract_resolution_width(x.resolution),
-                x.frame_rate,
-            ),
-            reverse=True,
+    def quality_key(self, stream: StreamInfo) -> tuple:
+        """依次比较分辨率宽度、帧率、编码偏好和带宽, 越大越好; 缺少的信息按0处理"""
+        return (
+            _parse_resolution(stream.resolution)[0],
+            stream.frame_rate or 0.0,
+            self._codec_rank.get(get_video_codec(stream.codecs), 0),
+            stream.bandwidth or 0,
         )
-    else:
-        # 按带宽排序
-        logger.debug("部分流媒体缺少分辨率或帧率信息，按带宽排序")
-        return sorted(streams, key=lambda x: x.bandwidth, reverse=True)
+
+    def __str__(self) -> str:
+        fields = {name: getattr(self, name) for name in self.FIELDS if getattr(self, name)}
+        return f"QualityPolicy({', '.join(f'{name}={value}' for name, value in fields.items())})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+# 不限制画质, 选择分辨率和帧率最高的流
+DEFAULT_POLICY = QualityPolicy()
+
+
+def get_quality_policy(uid: str) -> QualityPolicy:
+    """合并全局的quality_policy和channel_quality_policies中该频道的设置, 配置错误时不限制画质"""
+    data = {**(config.quality_policy or {}), **((config.channel_quality_policies or {}).get(uid) or {})}
+    if not data:
+        return DEFAULT_POLICY
+    try:
+        return QualityPolicy.from_dict(data)
+    except (TypeError, ValueError) as e:
+        logger.error(f"{uid}的画质策略配置错误, 不限制画质: {e}")
+        return DEFAULT_POLICY
+
+
+def sort_streams(streams: list[StreamInfo], policy: QualityPolicy | None = None):
+    """
+    排序流媒体：
+    1. 先按分辨率从大到小排序
+    2. 相同分辨率再按帧率从大到小排序
+    3. 再按策略的编码偏好和带宽排序, 缺少分辨率或帧率信息的流(如audio_only)排在最后
+    """
+    return sorted(streams, key=(policy or DEFAULT_POLICY).quality_key, reverse=True)
 
 
-def get_best_stream(streams: list[StreamInfo]):
+def get_best_stream(streams: list[StreamInfo], policy: QualityPolicy | None = None):
     """
-    获取最佳质量的流媒体
+    获取满足画质策略的最高质量的流媒体, 只遍历一次, 不排序
+
+    没有满足策略的流时选择质量最低(最接近限制)的视频流; audio_only策略下没有纯音频流时同样处理。
 
     Args:
         streams (list[StreamInfo]): 流媒体StreamInfo对象列表
+        policy (QualityPolicy | None): 画质策略, None时不限制
 
     Returns:
         StreamInfo: 最佳质量的流媒体信息，如果没有则返回None
@@ -48,11 +139,88 @@ def get_best_stream(streams: list[StreamInfo]):
     if not streams:
         return None
 
-    sorted_streams = sort_streams(streams)
-    best_stream = sorted_streams[0]
+    policy = policy or DEFAULT_POLICY
+    best_stream, best_key = None, None
+    fallback, fallback_key = None, None
+    for stream in streams:
+        # 纯音频流只在audio_only策略下选择
+        if not policy.audio_only and is_audio_only(stream):
+            continue
+        key = policy.quality_key(stream)
+        if policy.allows(stream):
+            if best_key is None or key > best_key:
+                best_stream, best_key = stream, key
+        elif fallback_key is None or key < fallback_key:
+            fallback, fallback_key = stream, key
+
+    if best_stream is None:
+        best_stream = _use_fallback(streams, fallback, policy)
+    _log_selected(best_stream)
+    return best_stream
+
+
+def select_stream(
+    streams: list[StreamInfo], policy: QualityPolicy | None = None
+) -> tuple[StreamInfo | None, list[StreamInfo]]:
+    """
+    按画质策略选出要录制的流, 同时得到录制中降级和切换可选的流, 只遍历一次
+
+    最佳流按quality_key(分辨率、帧率、编码偏好、带宽)选择; 可选的流第一个为最佳流, 之后是满足策略且带宽低于最佳流的流,
+    按带宽从高到低排列, 录制中降级和存储空间不足时依次向后选择, 每一步都确实降低码率。
+    例如av1 6Mbps、h264 8Mbps、720p 2Mbps中最佳流为av1, 码率更高的h264不会作为降级目标。
+    纯音频流只在audio_only策略下加入, 视频录制不会切换到纯音频。usher返回的主播放列表已经按带宽从高到低排列,
+    遍历时检查顺序, 顺序不符时才排序。没有满足策略的流时与get_best_stream相同, 只能使用最接近限制的流。
+
+    Args:
+        streams (list[StreamInfo]): 流媒体StreamInfo对象列表
+        policy (QualityPolicy | None): 画质策略, None时不限制
+
+    Returns:
+        tuple[StreamInfo | None, list[StreamInfo]]: (最佳流媒体, 最佳流和按带宽从高到低排列的降级流)
+    """
+    if not streams:
+        return None, []
+
+    policy = policy or DEFAULT_POLICY
+    allowed = []
+    ordered = True
+    best_stream, best_key = None, None
+    fallback, fallback_key = None, None
+    for stream in streams:
+        if not policy.audio_only and is_audio_only(stream):
+            continue
+        key = policy.quality_key(stream)
+        if policy.allows(stream):
+            if allowed and stream.bandwidth > allowed[-1].bandwidth:
+                ordered = False
+            allowed.append(stream)
+            if best_key is None or key > best_key:
+                best_stream, best_key = stream, key
+        elif fallback_key is None or key < fallback_key:
+            fallback, fallback_key = stream, key
+
+    if best_stream is None:
+        best_stream = _use_fallback(streams, fallback, policy)
+        _log_selected(best_stream)
+        return best_stream, [best_stream]
+
+    # 最佳流码率未知时无法比较, 保留其余全部流
+    limit = best_stream.bandwidth
+    lower = [stream for stream in allowed if stream is not best_stream and (not limit or stream.bandwidth < limit)]
+    if not ordered:
+        # 稳定排序, 带宽相同的流保持原有顺序
+        lower.sort(key=lambda stream: stream.bandwidth, reverse=True)
+    _log_selected(best_stream)
+    return best_stream, [best_stream, *lower]
 
+
+def _use_fallback(streams: list[StreamInfo], fallback: StreamInfo | None, policy: QualityPolicy) -> StreamInfo:
+    best_stream = fallback or streams[0]
+    logger.warning(f"{best_stream.uid}没有满足{policy}的流媒体, 使用最接近的 {best_stream.name or best_stream.resolution}")
+    return best_stream
+
+
+def _log_selected(best_stream: StreamInfo):
     logger.debug(
         f"{best_stream.uid}选择最佳流媒体: 分辨率: {best_stream.resolution}, 带宽: {best_stream.bandwidth} bps, 帧率: {best_stream.frame_rate} fps, 编码: {best_stream.codecs}"
     )
-
-    return best_stream
@@ -9,6 +9,7 @@ from loguru import logger
 class TaskType(Enum):
     PROCESS = "process"
     RECODE = "recode"
+    POSTPROCESS = "postprocess"
 
 
 class TaskStatus(Enum):
@@ -36,8 +37,12 @@ class Task(threading.Thread):
 
         self.kwargs = kwargs
 
-        # 任务状态
-        self.status = TaskStatus.QUEUED
+        # 任务状态; 加入TaskManager后状态写入和状态索引更新在管理器的锁内一起完成, 变化后再通知监听者
+        self._status = TaskStatus.QUEUED
+        self._status_lock = threading.Lock()
+        self._manager: Optional["TaskManager"] = None
+        self._status_listeners: list[Callable[["Task", TaskStatus, TaskStatus], None]] = []
+        self._done_listeners: list[Callable[["Task"], None]] = []
         self.result: Optional[bool] = None
         self.error_message: Optional[str] = None
 
@@ -49,6 +54,30 @@ class Task(threading.Thread):
         # 控制标志
         self._stop_event = threading.Event()
 
+    @property
+    def status(self) -> TaskStatus:
+        return self._status
+
+    @status.setter
+    def status(self, value: TaskStatus):
+        with self._status_lock:
+            manager = self._manager
+            if manager is None:
+                old = self._status
+                self._status = value
+        if manager is not None:
+            old = manager._set_status(self, value)
+        if old != value:
+            for listener in list(self._status_listeners):
+                listener(self, old, value)
+
+    def add_status_listener(self, listener: Callable[["Task", TaskStatus, TaskStatus], None]):
+        self._status_listeners.append(listener)
+
+    def add_done_listener(self, listener: Callable[["Task"], None]):
+        """线程结束后在任务线程中调用"""
+        self._done_listeners.append(listener)
+
     def run(self):
         """线程执行的主要方法"""
         try:
@@ -71,6 +100,16 @@ class Task(threading.Thread):
         finally:
             # 记录结束时间
             self.end_time = time.time()
+            for listener in list(self._done_listeners):
+                try:
+                    listener(self)
+                except Exception as e:
+                    logger.error(f"任务 {self.task_id} 结束回调出错: {e}")
+
+    @property
+    def stop_event(self) -> threading.Event:
+        """调用stop()时置位, 传给任务函数用于提前结束"""
+        return self._stop_event
 
     def stop(self):
         """停止任务"""
@@ -97,72 +136,189 @@ class Task(threading.Thread):
 
 
 class TaskManager:
-    def __init__(self):
-        self.tasks: list[Task] = []
+    """按task_id、uid和状态建立索引的线程安全任务管理器
+
+    任务状态的写入和状态索引的更新在同一把锁内完成, 查询都是O(1)或只遍历对应状态的任务。
+    任务线程结束后调用通过add_done_callback注册的回调; auto_remove为True时
+    任务结束即从管理器中移除, 不需要再定期调用clear_completed_tasks。
+    """
+
+    def __init__(self, auto_remove: bool = False):
+        self.auto_remove = auto_remove
+        self._lock = threading.RLock()
+        self._tasks: dict[str, Task] = {}
+        self._by_uid: dict[str, dict[str, Task]] = {}
+        self._by_status: dict[TaskStatus, dict[str, Task]] = {status: {} for status in TaskStatus}
+        self._callbacks: list[Callable[[Task], None]] = []
+        # shutdown()之后不再接受新任务
+        self._closed = False
+
+    @property
+    def tasks(self) -> list[Task]:
+        return self.get_all_tasks()
 
     def start_all(self):
-        for task in self.tasks:
+        for task in self.get_queued_tasks():
             task.start()
 
-    def shutdown(self):
-        for task in self.tasks:
-            task.stop()
+    def shutdown(self, timeout: float | None = None) -> list[Task]:
+        """
+        同时通知所有任务停止, timeout不为None时并行等待它们结束
 
-    def add_task(self, task: Task):
-        self.tasks.append(task)
+        Args:
+            timeout (float | None): 等待所有任务结束的总时长(秒)
+
+        Returns:
+            list[Task]: 超时后仍未结束的任务
+        """
+        with self._lock:
+            self._closed = True
+        tasks = self.get_all_tasks()
+        for task in tasks:
+            task.stop()
+        if timeout is None:
+            return []
+        deadline = time.monotonic() + timeout
+        for task in tasks:
+            if task.is_alive():
+                task.join(max(0.0, deadline - time.monotonic()))
+        return [task for task in tasks if task.is_alive()]
+
+    def add_task(self, task: Task) -> bool:
+        """
+        添加任务, shutdown()之后添加的任务会被立即停止
+
+        Returns:
+            bool: 是否已添加, 为False时调用方不应再启动该任务
+        """
+        with self._lock:
+            if self._closed:
+                task.stop()
+                logger.debug(f"任务管理器已关闭, 拒绝{task.task_type}任务: {task.task_id}")
+                return False
+            previous = self._tasks.get(task.task_id)
+            if previous is not None:
+                self._remove(previous)
+            # 持有任务的状态锁, 避免读取状态和接管状态写入之间状态发生变化
+            with task._status_lock:
+                self._tasks[task.task_id] = task
+                self._by_uid.setdefault(task.uid, {})[task.task_id] = task
+                self._by_status[task._status][task.task_id] = task
+                task._manager = self
+        task.add_done_listener(self._on_done)
+        return True
+
+    def _set_status(self, task: Task, value: TaskStatus) -> TaskStatus:
+        """在锁内写入任务状态并移动状态索引, 返回原来的状态; 监听者由Task在释放锁之后通知"""
+        with self._lock:
+            old = task._status
+            task._status = value
+            if old != value and self._tasks.get(task.task_id) is task:
+                self._by_status[old].pop(task.task_id, None)
+                self._by_status[value][task.task_id] = task
+            return old
+
+    def _on_done(self, task: Task):
+        with self._lock:
+            if self.auto_remove and self._tasks.get(task.task_id) is task:
+                logger.debug(
+                    f"移除已完成{task.task_type}任务,task_id={task.task_id}, uid={task.uid}, status={task.status}"
+                )
+                self._remove(task)
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback(task)
+            except Exception as e:
+                logger.error(f"任务 {task.task_id} 完成回调出错: {e}")
+
+    def add_done_callback(self, callback: Callable[[Task], None]):
+        """注册任务线程结束时的回调, 在任务线程中调用"""
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def remove_done_callback(self, callback: Callable[[Task], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
 
     def get_task(self, task_id: str) -> Optional[Task]:
-        for task in self.tasks:
-            if task.task_id == task_id:
-                return task
-        return None
+        with self._lock:
+            return self._tasks.get(task_id)
+
+    def _remove(self, task: Task):
+        if self._tasks.get(task.task_id) is not task:
+            return
+        del self._tasks[task.task_id]
+        uid_tasks = self._by_uid.get(task.uid)
+        if uid_tasks is not None:
+            uid_tasks.pop(task.task_id, None)
+            if not uid_tasks:
+                del self._by_uid[task.uid]
+        for bucket in self._by_status.values():
+            bucket.pop(task.task_id, None)
 
     def remove_task(self, task: Task):
-        self.tasks.remove(task)
+        with self._lock:
+            self._remove(task)
 
     def find_task_by_uid(self, uid: str) -> Optional[Task]:
-        for task in self.tasks:
-            if task.uid == uid:
-                return task
-        return None
+        with self._lock:
+            uid_tasks = self._by_uid.get(uid)
+            return next(iter(uid_tasks.values())) if uid_tasks else None
+
+    def find_tasks_by_uid(self, uid: str) -> list[Task]:
+        with self._lock:
+            return list(self._by_uid.get(uid, {}).values())
 
     def is_task_running(self, task: Task) -> bool:
         return task and (task.status == TaskStatus.RUNNING or task.status == TaskStatus.QUEUED)
 
     def clear_completed_tasks(self):
-        to_remove_tasks = []
-        for task in self.tasks:
-            if task.status != TaskStatus.RUNNING and task.status != TaskStatus.QUEUED:
-                to_remove_tasks.append(task)
-        for task in to_remove_tasks:
-            logger.debug(
-                f"移除已完成{task.task_type}任务,task_id={task.task_id}, uid={task.uid}, status={task.status}"
-            )
-            self.remove_task(task)
-
+        with self._lock:
+            to_remove_tasks = [
+                task
+                for status, bucket in self._by_status.items()
+                if status not in (TaskStatus.RUNNING, TaskStatus.QUEUED)
+                for task in bucket.values()
+            ]
+            for task in to_remove_tasks:
+                logger.debug(
+                    f"移除已完成{task.task_type}任务,task_id={task.task_id}, uid={task.uid}, status={task.status}"
+                )
+                self._remove(task)
 
     def get_all_tasks(self) -> list[Task]:
-        return self.tasks
+        with self._lock:
+            return list(self._tasks.values())
+
+    def _get_tasks_by_status(self, status: TaskStatus) -> list[Task]:
+        with self._lock:
+            return list(self._by_status[status].values())
 
     def get_running_tasks(self) -> list[Task]:
-        return [task for task in self.tasks if task.status == TaskStatus.RUNNING]
+        return self._get_tasks_by_status(TaskStatus.RUNNING)
 
     def get_completed_tasks(self) -> list[Task]:
-        return [task for task in self.tasks if task.status == TaskStatus.COMPLETED]
+        return self._get_tasks_by_status(TaskStatus.COMPLETED)
 
     def get_failed_tasks(self) -> list[Task]:
-        return [task for task in self.tasks if task.status == TaskStatus.FAILED]
+        return self._get_tasks_by_status(TaskStatus.FAILED)
 
     def get_queued_tasks(self) -> list[Task]:
-        return [task for task in self.tasks if task.status == TaskStatus.QUEUED]
+        return self._get_tasks_by_status(TaskStatus.QUEUED)
 
     def get_shutdown_tasks(self) -> list[Task]:
-        return [task for task in self.tasks if task.status == TaskStatus.SHUTDOWN]
+        return self._get_tasks_by_status(TaskStatus.SHUTDOWN)
+
+    def count_by_status(self) -> dict[TaskStatus, int]:
+        with self._lock:
+            return {status: len(bucket) for status, bucket in self._by_status.items()}
 
     def get_task_status(self, task_id: str) -> Optional[TaskStatus]:
         task = self.get_task(task_id)
         return task.status if task else None
 
 
-process_task_manager = TaskManager()
-recode_task_manager = TaskManager()
+process_task_manager = TaskManager(auto_remove=True)
+recode_task_manager = TaskManager(auto_remove=True)
@@ -3,15 +3,75 @@ Twitch录制器工具模块
 """
 
 import re
+import threading
 
+from twitch_recoder.common.proxy_pool import ProxyPool
 from twitch_recoder.config.my_config import config
 
+_proxy_pool: ProxyPool | None = None
+_proxy_pool_lock = threading.Lock()
+
+
+def get_proxy_pool() -> ProxyPool | None:
+    """配置了proxies时返回全局代理池, 首次调用时创建"""
+    global _proxy_pool
+    if _proxy_pool is None and config.proxies:
+        with _proxy_pool_lock:
+            if _proxy_pool is None:
+                _proxy_pool = ProxyPool(
+                    config.proxies, config.proxy_check_url, config.proxy_check_interval, config.proxy_max_failures
+                )
+    return _proxy_pool
+
+
+def reload_proxy_pool():
+    """proxies配置变化后更新代理池, 清空proxies时回退到proxy配置"""
+    global _proxy_pool
+    with _proxy_pool_lock:
+        pool = _proxy_pool
+        if pool is not None and not config.proxies:
+            pool.stop()
+            _proxy_pool = None
+            return
+        if pool is not None:
+            pool.update(config.proxies, config.proxy_check_url, config.proxy_check_interval, config.proxy_max_failures)
+    pool = get_proxy_pool()
+    if pool is not None:
+        pool.start()
+
+
+def acquire_proxy(owner: str) -> str:
+    """为录制任务选择代理: 使用代理池时按负载和延迟租用, 否则使用proxy配置"""
+    pool = get_proxy_pool()
+    if pool is not None:
+        return pool.acquire(owner)
+    return config.proxy or ""
+
+
+def release_proxy(owner: str):
+    pool = get_proxy_pool()
+    if pool is not None:
+        pool.release(owner)
+
+
+def reassign_proxy(owner: str, current: str) -> str:
+    """当前代理已被移出轮换时为录制任务换一个代理"""
+    pool = get_proxy_pool()
+    if pool is None or not current or pool.is_healthy(current):
+        return current
+    return pool.reassign(owner)
+
+
 def get_proxies() -> dict | None:
     """获取代理配置
 
     Returns:
         dict | None: 代理配置字典,如果没有配置代理则返回None
     """
+    pool = get_proxy_pool()
+    if pool is not None:
+        proxy_url = pool.select()
+        return {'http': proxy_url, 'https': proxy_url} if proxy_url else None
     if config.proxy and config.proxy.strip():
         proxy_url = config.proxy.strip()
         return {'http': proxy_url, 'https': proxy_url}
@@ -38,6 +98,25 @@ def extract_resolution_width(resolution_str: str) -> int:
         return 0
 
 
+def extract_resolution_height(resolution_str: str) -> int:
+    """
+    从分辨率字符串中提取高度值
+
+    Args:
+        resolution_str (str): 分辨率字符串，如 "1920x1080"
+
+    Returns:
+        int: 高度值，如果解析失败则返回0
+    """
+    if not resolution_str:
+        return 0
+
+    try:
+        return int(resolution_str.split("x")[1])
+    except (ValueError, IndexError):
+        return 0
+
+
 def format_bandwidth(bandwidth: int) -> str:
     """
     格式化带宽显示
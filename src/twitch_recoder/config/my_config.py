@@ -4,6 +4,9 @@ Twitch录制器配置模块
 
 # Twitch API配置
 import json
+import os
+import threading
+from typing import Callable
 
 from loguru import logger
 
@@ -73,6 +76,9 @@ PLAYBACK_ACCESS_TOKEN_QUERY = """query PlaybackAccessToken_Template($login: Stri
     }
 }"""
 
+# ChannelShell持久化查询的哈希
+CHANNEL_SHELL_QUERY_HASH = "580ab410bcd0c1ad194224957ae2241e5d252b2c5173d8e0cce9d32d5bb14efe"
+
 # 默认变量
 DEFAULT_VARIABLES = {
     "isLive": True,
@@ -95,22 +101,183 @@ AUTHED_HEADERS = {
 DEFAULT_CONFIG = {
     "uids": [],
     "data_path": "data",
+    "shutdown_timeout": 10,
     "max_time_limit": 3600,
     "proxy": "",
+    "poll_engine": "async",
+    "max_concurrency": 32,
+    "poll_interval": 10,
+    "liveness_batch_size": 30,
+    "http_pool_connections": 10,
+    "http_pool_maxsize": 32,
+    "dns_cache_ttl": 300,
+    "max_poll_interval": 600,
+    "poll_backoff_factor": 1.5,
+    "poll_hot_window": 1800,
+    "max_polls_per_second": 20,
+    "schedule_state_path": "",
+    "recorder_backend": "ffmpeg",
+    "native_remux": False,
+    "adaptive_variant": False,
+    "rotate_recording": False,
+    "rotate_size_limit": 0,
+    "output_format": "mp4",
+    "postprocess": "none",
+    "postprocess_workers": 2,
+    "postprocess_max_retries": 3,
+    "postprocess_retry_delay": 60,
+    "postprocess_queue_path": "",
+    "progress_log_interval": 60,
+    "metrics_host": "127.0.0.1",
+    "metrics_port": 0,
+    "check_workers": 8,
+    "check_queue_size": 64,
+    "rate_limit_global": 20,
+    "rate_limit_gql": 10,
+    "rate_limit_usher": 10,
+    "rate_limit_per_proxy": 0,
+    "rate_limit_max_retries": 3,
+    "rate_limit_backoff": 1.0,
+    "proxies": [],
+    "proxy_check_url": "https://www.twitch.tv/",
+    "proxy_check_interval": 60,
+    "proxy_max_failures": 3,
+    "min_free_space": 5368709120,
+    "disk_reserve_horizon": 3600,
+    "archive_path": "",
+    "archive_bandwidth": 52428800,
+    "archive_queue_path": "",
+    "config_reload_interval": 5,
+    "removed_channel_policy": "finish",
+    "control_socket": "",
+    "gql_url": TWITCH_GQL_URL,
+    "usher_url": TWITCH_USHER_URL,
+    "quality_policy": {},
+    "channel_quality_policies": {},
 }
 
 class Config:
-    def __init__(self, uids: str, data_path: str, max_time_limit: int, proxy: str = ""):
-        self.uids = uids
-        self.data_path = data_path
-        self.max_time_limit = max_time_limit
-        self.proxy = proxy
+    def __init__(self, *args, **kwargs):
+        self.reload(*args, **kwargs)
 
-    def reload(self, uids: str, data_path: str, max_time_limit: int, proxy: str = ""):
+    def reload(
+        self,
+        uids: str,
+        data_path: str | list[str],
+        max_time_limit: int,
+        proxy: str = "",
+        poll_engine: str = "async",
+        max_concurrency: int = 32,
+        poll_interval: int = 10,
+        liveness_batch_size: int = 30,
+        http_pool_connections: int = 10,
+        http_pool_maxsize: int = 32,
+        dns_cache_ttl: int = 300,
+        max_poll_interval: int = 600,
+        poll_backoff_factor: float = 1.5,
+        poll_hot_window: int = 1800,
+        max_polls_per_second: float = 20,
+        schedule_state_path: str = "",
+        recorder_backend: str = "ffmpeg",
+        native_remux: bool = False,
+        adaptive_variant: bool = False,
+        rotate_recording: bool = False,
+        rotate_size_limit: int = 0,
+        output_format: str = "mp4",
+        postprocess: str = "none",
+        postprocess_workers: int = 2,
+        postprocess_max_retries: int = 3,
+        postprocess_retry_delay: int = 60,
+        postprocess_queue_path: str = "",
+        progress_log_interval: int = 60,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: int = 0,
+        check_workers: int = 8,
+        check_queue_size: int = 64,
+        rate_limit_global: float = 20,
+        rate_limit_gql: float = 10,
+        rate_limit_usher: float = 10,
+        rate_limit_per_proxy: float = 0,
+        rate_limit_max_retries: int = 3,
+        rate_limit_backoff: float = 1.0,
+        proxies: list[str] | None = None,
+        proxy_check_url: str = "https://www.twitch.tv/",
+        proxy_check_interval: int = 60,
+        proxy_max_failures: int = 3,
+        min_free_space: int = 5 * 1024**3,
+        disk_reserve_horizon: int = 3600,
+        archive_path: str = "",
+        archive_bandwidth: int = 50 * 1024**2,
+        archive_queue_path: str = "",
+        config_reload_interval: int = 5,
+        removed_channel_policy: str = "finish",
+        shutdown_timeout: int = 10,
+        control_socket: str = "",
+        gql_url: str = TWITCH_GQL_URL,
+        usher_url: str = TWITCH_USHER_URL,
+        quality_policy: dict | None = None,
+        channel_quality_policies: dict[str, dict] | None = None,
+    ):
         self.uids = uids
         self.data_path = data_path
         self.max_time_limit = max_time_limit
         self.proxy = proxy
+        self.poll_engine = poll_engine
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self.liveness_batch_size = liveness_batch_size
+        self.http_pool_connections = http_pool_connections
+        self.http_pool_maxsize = http_pool_maxsize
+        self.dns_cache_ttl = dns_cache_ttl
+        self.max_poll_interval = max_poll_interval
+        self.poll_backoff_factor = poll_backoff_factor
+        self.poll_hot_window = poll_hot_window
+        self.max_polls_per_second = max_polls_per_second
+        self.schedule_state_path = schedule_state_path
+        self.recorder_backend = recorder_backend
+        self.native_remux = native_remux
+        self.adaptive_variant = adaptive_variant
+        self.rotate_recording = rotate_recording
+        self.rotate_size_limit = rotate_size_limit
+        self.output_format = output_format
+        self.postprocess = postprocess
+        self.postprocess_workers = postprocess_workers
+        self.postprocess_max_retries = postprocess_max_retries
+        self.postprocess_retry_delay = postprocess_retry_delay
+        self.postprocess_queue_path = postprocess_queue_path
+        self.progress_log_interval = progress_log_interval
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.check_workers = check_workers
+        self.check_queue_size = check_queue_size
+        self.rate_limit_global = rate_limit_global
+        self.rate_limit_gql = rate_limit_gql
+        self.rate_limit_usher = rate_limit_usher
+        self.rate_limit_per_proxy = rate_limit_per_proxy
+        self.rate_limit_max_retries = rate_limit_max_retries
+        self.rate_limit_backoff = rate_limit_backoff
+        self.proxies = proxies or []
+        self.proxy_check_url = proxy_check_url
+        self.proxy_check_interval = proxy_check_interval
+        self.proxy_max_failures = proxy_max_failures
+        self.min_free_space = min_free_space
+        self.disk_reserve_horizon = disk_reserve_horizon
+        self.archive_path = archive_path
+        self.archive_bandwidth = archive_bandwidth
+        self.archive_queue_path = archive_queue_path
+        self.config_reload_interval = config_reload_interval
+        self.removed_channel_policy = removed_channel_policy
+        self.shutdown_timeout = shutdown_timeout
+        self.control_socket = control_socket
+        self.gql_url = gql_url
+        self.usher_url = usher_url
+        self.quality_policy = quality_policy or {}
+        self.channel_quality_policies = channel_quality_policies or {}
+
+    @property
+    def data_paths(self) -> list[str]:
+        """data_path可以是单个目录, 也可以是多个卷的目录列表"""
+        return [self.data_path] if isinstance(self.data_path, str) else list(self.data_path)
 
 # 全局配置实例
 config: Config = Config(**DEFAULT_CONFIG)
@@ -119,9 +286,18 @@ config: Config = Config(**DEFAULT_CONFIG)
 class ConfigReader:
     def __init__(self, config_path: str):
         self.config_path = config_path
+        # 上次加载时配置文件的修改时间
+        self.mtime: int | None = None
+
+    def _stat_mtime(self) -> int | None:
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
 
     def load_config(self):
         global config
+        self.mtime = self._stat_mtime()
         with open(self.config_path, "r") as f:
             try:
                 config_dict = json.load(f)
@@ -133,3 +309,72 @@ class ConfigReader:
                 logger.error(f"配置文件读取失败: {e}")
                 raise ValueError(f"配置文件({self.config_path})读取失败")
         return True
+
+    def reload_if_changed(self) -> dict[str, tuple] | None:
+        """
+        配置文件修改后重新加载
+
+        先解析为新的Config再整体替换全局配置的属性, 文件格式错误时保留当前配置
+
+        Returns:
+            dict[str, tuple] | None: 变化的配置项 {key: (旧值, 新值)}, 文件未修改或读取失败时返回None
+        """
+        mtime = self._stat_mtime()
+        if mtime is None or mtime == self.mtime:
+            return None
+        self.mtime = mtime
+        try:
+            with open(self.config_path, "r") as f:
+                new_config = Config(**json.load(f))
+        except Exception as e:
+            logger.error(f"重新加载配置文件失败, 保留当前配置: {e}")
+            return None
+
+        old_values = vars(config).copy()
+        new_values = vars(new_config)
+        changes = {key: (old_values.get(key), value) for key, value in new_values.items() if old_values.get(key) != value}
+        if changes:
+            vars(config).update(new_values)
+            logger.info(f"配置文件已重新加载, 变化的配置项: {', '.join(changes)}")
+        return changes
+
+
+class ConfigWatcher:
+    """后台线程按修改时间检查配置文件, 变化时重新加载并通知监听者"""
+
+    def __init__(self, reader: ConfigReader, interval: float = 5):
+        self.reader = reader
+        self.interval = interval
+        self._listeners: list[Callable[[dict[str, tuple]], None]] = []
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def add_listener(self, listener: Callable[[dict[str, tuple]], None]):
+        """注册配置变化的回调, 参数为 {key: (旧值, 新值)}"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def check(self):
+        changes = self.reader.reload_if_changed()
+        if not changes:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"应用配置变化失败: {e}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ConfigWatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"已开启配置热加载, 检查间隔: {self.interval}s")
+
+    def stop(self):
+        self._stop_event.set()
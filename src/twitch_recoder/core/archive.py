@@ -0,0 +1,391 @@
+"""
+录制文件归档模块
+
+录制写入data_path(高速的暂存盘), 录制和后处理完成的文件由后台线程逐个迁移到
+archive_path(机械盘或NAS)。迁移按archive_bandwidth限速, 避免和正在进行的录制争抢I/O;
+先写入目标目录下的.part文件, 重新读取归档文件校验SHA-256一致后才删除暂存文件。
+队列持久化到文件, 重启后从.part文件已写入的位置继续复制。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from loguru import logger
+
+from twitch_recoder.common.taskManager import TaskStatus
+from twitch_recoder.core.postprocess import PostProcessJob
+
+
+# 每次读写的块大小
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class ArchiveInterrupted(Exception):
+    """停止归档时中断正在复制的文件, 已复制的部分保留用于续传"""
+
+
+class ArchiveJob:
+    """单个文件的迁移任务, 状态沿用TaskStatus"""
+
+    def __init__(
+        self,
+        job_id: str,
+        uid: str,
+        source: str,
+        target: str,
+        create_time: float | None = None,
+        attempts: int = 0,
+        status: str = TaskStatus.QUEUED.value,
+        checksum: str | None = None,
+        error_message: str | None = None,
+    ):
+        self.job_id = job_id
+        self.uid = uid
+        self.source = source
+        self.target = target
+        self.create_time = create_time or time.time()
+        self.attempts = attempts
+        self.status = TaskStatus(status)
+        self.checksum = checksum
+        self.error_message = error_message
+
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        # 重试前的等待截止时间, 不持久化
+        self.not_before = 0.0
+
+    @property
+    def part_path(self) -> str:
+        return f"{self.target}.part"
+
+    def get_duration(self) -> Optional[float]:
+        if self.start_time and self.end_time:
+            return self.end_time - self.start_time
+        elif self.start_time:
+            return time.time() - self.start_time
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "uid": self.uid,
+            "source": self.source,
+            "target": self.target,
+            "create_time": self.create_time,
+            "attempts": self.attempts,
+            "status": self.status.value,
+            "checksum": self.checksum,
+            "error_message": self.error_message,
+        }
+
+    def __str__(self):
+        return f"ArchiveJob(job_id={self.job_id}, source={self.source}, status={self.status}, attempts={self.attempts})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ArchiveMover:
+    """持久化的归档队列
+
+    只有一个迁移线程, 按提交顺序逐个复制, 慢速磁盘上不会同时出现多个顺序写入。
+    失败的任务按retry_delay * 已尝试次数延迟后重试, 超过max_retries后标记为FAILED并保留暂存文件。
+    """
+
+    def __init__(
+        self,
+        archive_path: str = "",
+        bandwidth: float = 0,
+        max_retries: int = 3,
+        retry_delay: float = 60,
+        state_path: str = "",
+    ):
+        self.archive_path = archive_path
+        self.bandwidth = bandwidth
+        self.max_retries = max(1, max_retries)
+        self.retry_delay = retry_delay
+        self.state_path = state_path
+
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._jobs: dict[str, ArchiveJob] = {}
+        self._counter = 0
+        self._thread: threading.Thread | None = None
+        self.bytes_copied = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.archive_path)
+
+    def configure(self, archive_path: str, bandwidth: float, max_retries: int, retry_delay: float, state_path: str):
+        """启动前按配置调整参数"""
+        self.archive_path = archive_path
+        self.bandwidth = bandwidth
+        self.max_retries = max(1, max_retries)
+        self.retry_delay = retry_delay
+        self.state_path = state_path
+
+    def start(self):
+        """加载持久化队列并启动迁移线程"""
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self.load()
+        limit = f"{self.bandwidth / 1024 / 1024:.1f}MB/s" if self.bandwidth > 0 else "不限速"
+        logger.info(f"归档已启动: {self.archive_path}, {limit}, 待迁移文件: {len(self.get_queued_jobs())}")
+        self._thread = threading.Thread(target=self._run, name="ArchiveMover", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """停止迁移, 正在复制的文件保留.part并在下次启动时续传"""
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+    def submit(self, uid: str, source: str) -> ArchiveJob | None:
+        """
+        提交迁移任务
+
+        Args:
+            uid (str): 频道UID
+            source (str): 暂存目录中已完成的文件
+
+        Returns:
+            ArchiveJob | None: 新建的任务, 未启用归档或同一文件已在队列中时返回None
+        """
+        if not self.enabled or not os.path.isfile(source):
+            return None
+        target = os.path.join(self.archive_path, os.path.basename(source))
+        with self._cond:
+            for job in self._jobs.values():
+                if job.source == source and job.status in (TaskStatus.QUEUED, TaskStatus.RUNNING):
+                    return None
+            self._counter += 1
+            job = ArchiveJob(f"archive_{uid}_{int(time.time() * 1000)}_{self._counter}", uid, source, target)
+            self._jobs[job.job_id] = job
+            self._cond.notify_all()
+        self.save()
+        logger.info(f"已提交归档任务: {source} -> {target}")
+        return job
+
+    def _next_job(self) -> tuple[ArchiveJob | None, float | None]:
+        """取出最早提交且可以执行的任务, 同时返回最近一个等待重试任务的剩余时间"""
+        now = time.time()
+        job = None
+        wait = None
+        for candidate in self._jobs.values():
+            if candidate.status != TaskStatus.QUEUED:
+                continue
+            if candidate.not_before > now:
+                remaining = candidate.not_before - now
+                wait = remaining if wait is None else min(wait, remaining)
+                continue
+            if job is None or candidate.create_time < job.create_time:
+                job = candidate
+        return job, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._stop_event.is_set():
+                    job, wait = self._next_job()
+                    if job:
+                        break
+                    self._cond.wait(timeout=wait)
+                if self._stop_event.is_set():
+                    return
+                job.status = TaskStatus.RUNNING
+                job.start_time = time.time()
+                job.end_time = None
+                job.attempts += 1
+
+            try:
+                self._move(job)
+                self._finish(job, None)
+            except ArchiveInterrupted:
+                with self._cond:
+                    job.status = TaskStatus.QUEUED
+                    job.attempts -= 1
+                return
+            except Exception as e:
+                self._finish(job, str(e))
+
+    def _throttle(self, start: float, copied: int):
+        """按bandwidth限速, 复制速度超出时等待"""
+        if self.bandwidth <= 0:
+            return
+        delay = copied / self.bandwidth - (time.monotonic() - start)
+        if delay > 0 and self._stop_event.wait(delay):
+            raise ArchiveInterrupted()
+
+    def _hash_file(self, path: str, throttled: bool = False) -> str:
+        digest = hashlib.sha256()
+        start = time.monotonic()
+        read = 0
+        with open(path, "rb") as f:
+            _drop_cache(f)
+            while chunk := f.read(CHUNK_SIZE):
+                if self._stop_event.is_set():
+                    raise ArchiveInterrupted()
+                digest.update(chunk)
+                read += len(chunk)
+                if throttled:
+                    self._throttle(start, read)
+        return digest.hexdigest()
+
+    def _move(self, job: ArchiveJob):
+        if not os.path.exists(job.source):
+            # 上次退出时已替换为归档文件但还没来得及删除暂存文件
+            if os.path.isfile(job.target):
+                return
+            raise FileNotFoundError(f"暂存文件不存在: {job.source}")
+
+        os.makedirs(os.path.dirname(os.path.abspath(job.target)), exist_ok=True)
+        size = os.path.getsize(job.source)
+        offset = os.path.getsize(job.part_path) if os.path.isfile(job.part_path) else 0
+        if offset > size:
+            offset = 0
+        if offset:
+            logger.info(f"继续归档 {job.source}, 已复制 {offset / 1024 / 1024:.1f}MB / {size / 1024 / 1024:.1f}MB")
+
+        digest = hashlib.sha256()
+        with open(job.source, "rb") as src, open(job.part_path, "r+b" if offset else "wb") as dst:
+            # 续传时已复制部分的校验和从暂存盘上的源文件计算, 不需要再读慢速磁盘
+            remaining = offset
+            while remaining > 0:
+                chunk = src.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            dst.truncate(offset)
+            dst.seek(offset)
+
+            start = time.monotonic()
+            copied = 0
+            while chunk := src.read(CHUNK_SIZE):
+                if self._stop_event.is_set():
+                    raise ArchiveInterrupted()
+                dst.write(chunk)
+                digest.update(chunk)
+                copied += len(chunk)
+                self.bytes_copied += len(chunk)
+                self._throttle(start, copied)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        # 重新读取归档文件校验, 读取同样计入限速
+        checksum = digest.hexdigest()
+        if self._hash_file(job.part_path, throttled=True) != checksum:
+            os.remove(job.part_path)
+            raise IOError(f"归档文件校验失败: {job.part_path}")
+        os.replace(job.part_path, job.target)
+        job.checksum = checksum
+        os.remove(job.source)
+
+    def _finish(self, job: ArchiveJob, error: str | None):
+        with self._cond:
+            job.end_time = time.time()
+            job.error_message = error
+            if error is None:
+                job.status = TaskStatus.COMPLETED
+                # 已完成的任务不再保存, 从内存中移除
+                if self._jobs.get(job.job_id) is job:
+                    del self._jobs[job.job_id]
+            elif job.attempts < self.max_retries and not self._stop_event.is_set():
+                job.status = TaskStatus.QUEUED
+                job.not_before = time.time() + self.retry_delay * job.attempts
+            else:
+                job.status = TaskStatus.FAILED
+
+        if error is None:
+            logger.info(f"归档完成: {job.target}, 耗时: {job.get_duration():.1f}s")
+        elif job.status == TaskStatus.FAILED:
+            logger.error(f"归档失败, 保留暂存文件: {job.source}, 错误: {error}")
+        else:
+            logger.warning(f"归档失败, 稍后重试: {job.source}, 错误: {error}")
+        self.save()
+
+    def save(self):
+        """保存未完成的任务, 重启后继续迁移"""
+        if not self.state_path:
+            return
+        with self._cond:
+            data = [job.to_dict() for job in self._jobs.values() if job.status != TaskStatus.COMPLETED]
+        try:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"保存归档队列失败: {e}")
+
+    def load(self):
+        if not self.state_path or not os.path.isfile(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r") as f:
+                data = json.load(f)
+            with self._cond:
+                for item in data:
+                    job = ArchiveJob(**item)
+                    # 上次退出时正在复制的任务重新排队, 从.part继续
+                    if job.status in (TaskStatus.RUNNING, TaskStatus.SHUTDOWN):
+                        job.status = TaskStatus.QUEUED
+                    self._jobs.setdefault(job.job_id, job)
+            logger.info(f"已加载 {len(data)} 个归档任务")
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"读取归档队列失败: {e}")
+
+    def clear_completed_jobs(self):
+        with self._cond:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.status == TaskStatus.COMPLETED]:
+                del self._jobs[job_id]
+
+    def get_all_jobs(self) -> list[ArchiveJob]:
+        with self._cond:
+            return list(self._jobs.values())
+
+    def get_queued_jobs(self) -> list[ArchiveJob]:
+        return [job for job in self.get_all_jobs() if job.status == TaskStatus.QUEUED]
+
+    def get_running_jobs(self) -> list[ArchiveJob]:
+        return [job for job in self.get_all_jobs() if job.status == TaskStatus.RUNNING]
+
+    def get_failed_jobs(self) -> list[ArchiveJob]:
+        return [job for job in self.get_all_jobs() if job.status == TaskStatus.FAILED]
+
+
+def _drop_cache(f):
+    """丢弃文件的页缓存, 校验时从磁盘读取而不是读到刚写入的缓存"""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+
+archive_mover = ArchiveMover()
+
+
+def submit_archive(uid: str, paths: list[str]) -> list[ArchiveJob]:
+    """把已完成的文件交给归档队列, 未启用归档时不做任何事"""
+    jobs = [archive_mover.submit(uid, path) for path in paths]
+    return [job for job in jobs if job is not None]
+
+
+def archive_postprocess_output(job: PostProcessJob):
+    """后处理结束后归档输出文件, 最终失败时归档保留下来的源文件"""
+    if job.status == TaskStatus.COMPLETED:
+        submit_archive(job.uid, [job.target])
+    elif job.status == TaskStatus.FAILED:
+        submit_archive(job.uid, job.sources)
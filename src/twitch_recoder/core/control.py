@@ -0,0 +1,186 @@
+"""
+守护进程的控制套接字服务
+
+替代需要root和终端的Ctrl+P快捷键: 通过Unix域套接字查询状态、列出录制、
+停止某个频道的录制以及立即检测频道。协议见common/control.py。
+"""
+
+import os
+import socket
+import socketserver
+import threading
+import time
+from typing import Callable
+
+from loguru import logger
+
+from twitch_recoder.common.control import COMMANDS, decode_message, encode_message
+from twitch_recoder.common.taskManager import TaskStatus, process_task_manager, recode_task_manager
+from twitch_recoder.config.my_config import config
+from twitch_recoder.core.archive import archive_mover
+from twitch_recoder.core.postprocess import postprocess_manager
+from twitch_recoder.core.progress import recording_stats
+
+
+def _count_by_status(jobs) -> dict[str, int]:
+    counts = {status.value: 0 for status in TaskStatus}
+    for job in jobs:
+        counts[job.status.value] += 1
+    return counts
+
+
+class ControlServer:
+    """在后台线程中监听控制套接字
+
+    poll_handler由轮询引擎提供: 接收频道列表(空列表表示全部), 返回安排检测的频道数。
+    suppress_handler同样由轮询引擎提供: stop命令停止录制之前调用, 避免仍在直播的频道很快又被重新录制。
+    record_path不为空时, 启动后把监听路径写入该文件(见common/control.py), 热加载修改data_path或
+    control_socket后命令行客户端仍能找到正在监听的套接字; 修改后的路径在重启后生效。
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        poll_handler: Callable[[list[str]], int] | None = None,
+        suppress_handler: Callable[[str], None] | None = None,
+        record_path: str = "",
+    ):
+        self.socket_path = os.path.abspath(socket_path) if socket_path else socket_path
+        self.record_path = record_path
+        self.poll_handler = poll_handler
+        self.suppress_handler = suppress_handler
+        self.start_time = time.time()
+        self._server: socketserver.BaseServer | None = None
+        self._thread: threading.Thread | None = None
+
+    def handle(self, request: dict) -> dict:
+        command = request.get("command")
+        if command not in COMMANDS:
+            raise ValueError(f"不支持的命令: {command}, 可选: {', '.join(COMMANDS)}")
+        return getattr(self, f"do_{command}")(request)
+
+    def do_status(self, request: dict) -> dict:
+        return {
+            "pid": os.getpid(),
+            "uptime": time.time() - self.start_time,
+            "channels": len(config.uids),
+            "poll_engine": config.poll_engine,
+            "recordings": len(recode_task_manager.get_running_tasks()),
+            "process_tasks": {status.value: count for status, count in process_task_manager.count_by_status().items()},
+            "postprocess": _count_by_status(postprocess_manager.get_all_jobs()),
+            "archive": _count_by_status(archive_mover.get_all_jobs()),
+        }
+
+    def do_list(self, request: dict) -> dict:
+        tasks = [
+            {
+                "task_id": task.task_id,
+                "uid": task.uid,
+                "status": task.status.value,
+                "duration": task.get_duration(),
+            }
+            for task in recode_task_manager.get_all_tasks()
+        ]
+        return {"tasks": tasks, "recordings": [stats.to_dict() for stats in recording_stats.get_all()]}
+
+    def do_stop(self, request: dict) -> dict:
+        uid = request.get("uid")
+        if not uid:
+            raise ValueError("stop命令需要uid")
+        # 先标记频道, 录制结束的回调重新调度时就不会再次开始录制
+        if self.suppress_handler is not None:
+            self.suppress_handler(uid)
+        tasks = recode_task_manager.find_tasks_by_uid(uid)
+        for task in tasks:
+            logger.info(f"收到控制命令, 停止录制任务 {task.task_id}")
+            task.stop()
+        return {"stopped": [task.task_id for task in tasks]}
+
+    def do_poll(self, request: dict) -> dict:
+        if self.poll_handler is None:
+            raise ValueError("轮询引擎尚未启动")
+        uids = request.get("uids") or []
+        unknown = [uid for uid in uids if uid not in config.uids]
+        if unknown:
+            raise ValueError(f"频道不在配置中: {', '.join(unknown)}")
+        return {"scheduled": self.poll_handler(list(uids))}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                try:
+                    response = {"ok": True, "data": server.handle(decode_message(line))}
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                self.wfile.write(encode_message(response))
+
+        return Handler
+
+    def _remove_stale_socket(self):
+        """上次异常退出留下的套接字文件没有进程监听时删除, 仍有进程监听时报错"""
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                os.remove(self.socket_path)
+                return
+        raise RuntimeError(f"{self.socket_path} 已有其它进程在监听")
+
+    def start(self) -> bool:
+        if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+            logger.warning("当前平台不支持Unix域套接字, 控制命令不可用")
+            return False
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+            self._remove_stale_socket()
+            self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, self._make_handler())
+            os.chmod(self.socket_path, 0o600)
+        except (OSError, RuntimeError) as e:
+            logger.error(f"启动控制套接字失败: {e}")
+            return False
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ControlServer", daemon=True)
+        self._thread.start()
+        self._write_record()
+        logger.info(f"控制套接字已启动: {self.socket_path}")
+        return True
+
+    def _write_record(self):
+        if not self.record_path:
+            return
+        try:
+            tmp_path = f"{self.record_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.socket_path)
+            os.replace(tmp_path, self.record_path)
+        except OSError as e:
+            logger.warning(f"记录控制套接字路径失败, 修改data_path后命令行可能找不到套接字: {e}")
+
+    def _remove_record(self):
+        """只删除仍指向本进程套接字的记录"""
+        if not self.record_path:
+            return
+        try:
+            with open(self.record_path, "r") as f:
+                if f.read().strip() == self.socket_path:
+                    os.remove(self.record_path)
+        except OSError:
+            pass
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._remove_record()
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
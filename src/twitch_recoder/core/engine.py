@@ -0,0 +1,223 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+from twitch_recoder.api.http_session import get_connection_stats
+from twitch_recoder.api.twitch_api import get_rooms_info, playback_token_cache, process_twitch_stream_async
+from twitch_recoder.common.metrics import channel_checks
+from twitch_recoder.common.taskManager import Task, recode_task_manager
+from twitch_recoder.config.my_config import config
+from twitch_recoder.core.process import submit_recode_task
+from twitch_recoder.core.scheduler import PollScheduler
+from twitch_recoder.types.errors import NetWorkErr, OfflineErr
+
+
+class PollEngine:
+    """基于asyncio的频道轮询引擎
+
+    所有频道的开播检测都在一个事件循环里以协程方式进行, 阻塞的HTTP请求交给
+    固定大小的线程池执行, 并发数由max_concurrency限制。只有确认开播的频道
+    才会交给录制线程, 不再为每个空闲频道创建一个线程。
+
+    每轮先把频道按batch_size打包成批量ChannelShell请求检测开播状态,
+    只有开播的频道才会继续获取访问令牌和usher播放列表。
+
+    检测时机由PollScheduler决定, 每个频道按自己的历史调整检测间隔。
+    """
+
+    # 两次调度之间的最短间隔, 避免速率受限时空转
+    MIN_TICK = 0.1
+    # 保存调度历史的间隔(秒)
+    SAVE_INTERVAL = 300
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        poll_interval: float = 10,
+        batch_size: int = 30,
+        scheduler: PollScheduler | None = None,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.poll_interval = poll_interval
+        self.batch_size = max(1, batch_size)
+        self.scheduler = scheduler if scheduler is not None else PollScheduler(min_interval=poll_interval)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="poll")
+        self._semaphore: asyncio.Semaphore | None = None
+        self._stop_event: asyncio.Event | None = None
+        # 控制命令要求立即检测时唤醒等待中的调度循环
+        self._wake_event: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def check_liveness(self, uids: list[str]) -> dict[str, tuple[str, bool]]:
+        """分批并发检测频道开播状态
+
+        Returns:
+            dict[str, tuple[str, bool]]: uid -> (nickname, status), 检测失败的频道不在结果中
+        """
+        loop = asyncio.get_running_loop()
+
+        async def check_batch(batch: list[str]) -> dict[str, tuple[str, bool]]:
+            async with self._semaphore:
+                try:
+                    return await loop.run_in_executor(self._executor, get_rooms_info, batch)
+                except Exception as e:
+                    logger.error(f"批量检测开播状态异常: {e}")
+                    return {}
+
+        batches = [uids[index : index + self.batch_size] for index in range(0, len(uids), self.batch_size)]
+        rooms = {}
+        for result in await asyncio.gather(*(check_batch(batch) for batch in batches)):
+            rooms.update(result)
+        return rooms
+
+    async def check_uid(self, uid: str, nickname: str | None = None) -> bool:
+        """检测单个频道, 开播时提交录制任务
+
+        Args:
+            uid (str): Twitch频道用户名
+            nickname (str | None): 批量检测已确认开播时传入昵称, 跳过房间信息查询
+
+        Returns:
+            bool: 是否提交了录制任务
+        """
+        async with self._semaphore:
+            try:
+                best_stream = await process_twitch_stream_async(uid, self._executor, nickname)
+            except OfflineErr:
+                logger.debug(f"频道 {uid} 未开播")
+                return False
+            except NetWorkErr as e:
+                logger.error(f"{uid} 获取流媒体信息失败: {e}")
+                return False
+            except Exception as e:
+                logger.error(f"{uid} 检测开播状态时发生错误: {e}")
+                return False
+
+        # 录制任务仍在单独线程中运行, 这里只做交接
+        return submit_recode_task(uid, best_stream)
+
+    async def poll_uids(self, uids: list[str]) -> int:
+        """检测指定频道, 并把结果反馈给调度器
+
+        Returns:
+            int: 提交的录制任务数量
+        """
+        rooms = await self.check_liveness(uids)
+        live_rooms = {}
+        for uid in uids:
+            room = rooms.get(uid)
+            if room is None:
+                channel_checks.inc(uid=uid, result="error")
+                self.scheduler.record_error(uid)
+            elif room[1]:
+                channel_checks.inc(uid=uid, result="live")
+                # 频道从配置中删除后又加回时, 之前的录制可能仍在进行
+                if recode_task_manager.find_task_by_uid(uid):
+                    self.scheduler.park(uid)
+                    continue
+                # 录制已被控制命令停止, 继续按最短间隔检测, 下播后才恢复自动录制
+                if self.scheduler.is_suppressed(uid):
+                    self.scheduler.release(uid)
+                    continue
+                live_rooms[uid] = room[0]
+            else:
+                channel_checks.inc(uid=uid, result="offline")
+                self.scheduler.record_offline(uid)
+        logger.debug(f"批量检测完成, 开播: {len(live_rooms)}, 未开播: {len(rooms) - len(live_rooms)}")
+
+        live_uids = list(live_rooms)
+        results = await asyncio.gather(*(self.check_uid(uid, live_rooms[uid]) for uid in live_uids))
+        for uid, result in zip(live_uids, results):
+            if result:
+                self.scheduler.record_live(uid)
+                # 录制可能在record_live之前就已结束, 此时完成回调已经错过
+                if not recode_task_manager.find_task_by_uid(uid):
+                    self.scheduler.release(uid)
+            else:
+                self.scheduler.record_error(uid)
+        return sum(1 for result in results if result)
+
+    def _on_recode_done(self, task: Task):
+        """录制结束后频道重新加入调度, 在录制线程中调用"""
+        self.scheduler.release(task.uid)
+
+    async def tick(self) -> int:
+        """执行一次调度: 只检测已到检测时间的频道
+
+        Returns:
+            int: 提交的录制任务数量
+        """
+        playback_token_cache.prune(config.uids)
+        self.scheduler.sync(config.uids)
+
+        due = self.scheduler.pop_due()
+        if not due:
+            return 0
+        started = await self.poll_uids(due)
+        if started:
+            logger.info(f"检测 {len(due)} 个频道, 新增录制任务: {started}")
+        return started
+
+    async def run(self):
+        """持续轮询, 直到调用stop()"""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._stop_event = asyncio.Event()
+        self._wake_event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if not config.uids:
+            logger.error("配置中没有UID")
+        last_save = time.monotonic()
+        recode_task_manager.add_done_callback(self._on_recode_done)
+        try:
+            while not self._stop_event.is_set():
+                await self.tick()
+
+                if time.monotonic() - last_save >= self.SAVE_INTERVAL:
+                    self.scheduler.save()
+                    logger.debug(f"HTTP连接复用统计: {get_connection_stats()}")
+                    last_save = time.monotonic()
+
+                delay = self.scheduler.next_due_in()
+                delay = self.poll_interval if delay is None else min(delay, self.poll_interval)
+                try:
+                    await asyncio.wait_for(self._wake_event.wait(), timeout=max(self.MIN_TICK, delay))
+                except asyncio.TimeoutError:
+                    pass
+                self._wake_event.clear()
+        finally:
+            recode_task_manager.remove_done_callback(self._on_recode_done)
+            self.scheduler.save()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _wake(self):
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake_event.set)
+
+    def request_poll(self, uids: list[str]) -> int:
+        """立即检测指定频道(为空时检测全部未在录制的频道), 可以在其它线程中调用
+
+        明确指定的频道同时恢复被stop命令停止的自动录制。
+
+        Returns:
+            int: 安排检测的频道数
+        """
+        self.scheduler.resume(uids)
+        count = self.scheduler.poll_now(uids or config.uids)
+        self._wake()
+        return count
+
+    def suppress(self, uid: str):
+        """控制命令停止录制前调用, 录制结束后不再立即重新录制该频道, 可以在其它线程中调用"""
+        self.scheduler.suppress(uid)
+
+    def stop(self):
+        """停止轮询, 可以在其它线程中调用"""
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        self._wake()
+
+    def shutdown(self):
+        """停止轮询并等待正在执行的检测请求结束, 关闭程序时在停止录制之前调用"""
+        self.stop()
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,400 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urljoin
+
+from loguru import logger
+from twitch_recoder.api.http_session import get_session
+from twitch_recoder.common.m3u8_parser import parse_media_playlist
+from twitch_recoder.common.utils import reassign_proxy
+from twitch_recoder.core.progress import RecordingStats, recording_stats
+from twitch_recoder.types.typeinfo import MediaPlaylist, MediaSegment, StreamInfo
+
+
+class HLSRecorder:
+    """进程内的HLS录制器
+
+    轮询媒体播放列表, 按EXT-X-MEDIA-SEQUENCE顺序下载新分片, 直接把MPEG-TS数据追加写入文件,
+    不需要为每个频道启动ffmpeg进程。
+
+    开启adaptive后会比较分片下载耗时与分片时长: 下载持续跟不上实时速率时切换到sort_streams中的
+    下一个较低质量, 余量恢复后再切回较高质量。每次切换都记录在会话元数据(.json)中。
+
+    开启rotate后max_time_limit和rotate_size表示单个文件的时长和大小上限: 在分片边界切换到
+    下一个_partNNN文件, 下载会话不中断, 直到直播结束。
+    """
+
+    USER_AGENT = (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/139.0.0.0 Safari/537.36"
+    )
+    # 连续失败达到该次数后结束录制
+    MAX_FAILURES = 10
+    REQUEST_TIMEOUT = 10
+
+    # 下载耗时/分片时长的指数平均系数
+    THROUGHPUT_ALPHA = 0.3
+    # 平均耗时比超过该值视为跟不上实时速率
+    DOWNSHIFT_RATIO = 0.8
+    # 换算到较高质量后的耗时比低于该值才切回
+    UPSHIFT_RATIO = 0.5
+    # 连续多少个分片满足条件才切换
+    DOWNSHIFT_PATIENCE = 3
+    UPSHIFT_PATIENCE = 15
+
+    def __init__(
+        self,
+        url: str,
+        proxy: str = "",
+        save_file_path: str = "",
+        max_time_limit: int = 3600,
+        variants: list[StreamInfo] | None = None,
+        adaptive: bool = False,
+        rotate: bool = False,
+        rotate_size: int = 0,
+        stop_event: threading.Event | None = None,
+    ):
+        self.url = url
+        self.proxy = proxy
+        self.save_file_path = save_file_path
+        self.max_time_limit = max_time_limit
+        self.rotate = rotate
+        self.rotate_size = rotate_size
+        # 置位后在当前分片写完后结束录制
+        self.stop_event = stop_event or threading.Event()
+
+        self.parts: list[dict] = []
+        self._file = None
+
+        self.last_sequence: int | None = None
+        self.bytes_written = 0
+        self.segments_written = 0
+        self.segments_missed = 0
+        self.start_time: float | None = None
+        self.stats = RecordingStats(os.path.basename(save_file_path), save_file_path)
+
+        self.variants = variants or []
+        self.variant_index = next((i for i, v in enumerate(self.variants) if v.url == url), 0)
+        self.adaptive = adaptive and len(self.variants) > 1
+        self._ratio: float | None = None
+        self._slow_count = 0
+        self._fast_count = 0
+
+        self.metadata_path = os.path.splitext(save_file_path)[0] + ".json"
+        self.metadata = {
+            "url": url,
+            "variant": self._describe_variant(self.variant_index),
+            "adaptive": self.adaptive,
+            "switches": [],
+            "parts": self.parts,
+        }
+
+    @property
+    def proxies(self) -> dict | None:
+        if self.proxy and self.proxy.strip():
+            return {"http": self.proxy.strip(), "https": self.proxy.strip()}
+        return None
+
+    def check_proxy(self):
+        """当前代理已被移出代理池轮换时换一个代理继续录制"""
+        proxy = reassign_proxy(self.save_file_path, self.proxy)
+        if proxy != self.proxy:
+            logger.warning(f"录制 {self.save_file_path} 的代理 {self.proxy} 已失效, 切换到 {proxy}")
+            self.proxy = proxy
+
+    def fetch_playlist(self) -> MediaPlaylist:
+        response = get_session(self.proxies).get(
+            self.url,
+            headers={"User-Agent": self.USER_AGENT},
+            timeout=self.REQUEST_TIMEOUT,
+            proxies=self.proxies,
+        )
+        response.raise_for_status()
+        return parse_media_playlist(response.text, self.url)
+
+    def download_segment(self, segment: MediaSegment) -> bytes:
+        response = get_session(self.proxies).get(
+            urljoin(self.url, segment.url),
+            headers={"User-Agent": self.USER_AGENT},
+            timeout=self.REQUEST_TIMEOUT,
+            proxies=self.proxies,
+        )
+        response.raise_for_status()
+        return response.content
+
+    def new_segments(self, playlist: MediaPlaylist) -> list[MediaSegment]:
+        """过滤出尚未写入的分片, 并记录因播放列表滚动而错过的分片数"""
+        segments = [
+            segment
+            for segment in playlist.segments
+            if self.last_sequence is None or segment.sequence > self.last_sequence
+        ]
+        if segments and self.last_sequence is not None and segments[0].sequence > self.last_sequence + 1:
+            missed = segments[0].sequence - self.last_sequence - 1
+            self.segments_missed += missed
+            logger.warning(f"录制 {self.save_file_path} 跳过了 {missed} 个分片, 播放列表刷新不及时")
+        return segments
+
+    def _describe_variant(self, index: int) -> dict | None:
+        if not self.variants:
+            return None
+        variant = self.variants[index]
+        return {
+            "resolution": variant.resolution,
+            "frame_rate": variant.frame_rate,
+            "bandwidth": variant.bandwidth,
+            "codecs": variant.codecs,
+        }
+
+    def observe_throughput(self, segment: MediaSegment, elapsed: float) -> bool:
+        """记录一个分片的下载耗时, 必要时切换质量
+
+        Returns:
+            bool: 是否切换了质量
+        """
+        if not self.adaptive or not segment.duration:
+            return False
+
+        ratio = elapsed / segment.duration
+        self._ratio = ratio if self._ratio is None else self._ratio + self.THROUGHPUT_ALPHA * (ratio - self._ratio)
+
+        lower = self._lower_variant() if self._ratio > self.DOWNSHIFT_RATIO else None
+        if lower is not None:
+            self._slow_count += 1
+            self._fast_count = 0
+            if self._slow_count >= self.DOWNSHIFT_PATIENCE:
+                self.switch_variant(lower, "downshift", segment.sequence)
+                return True
+            return False
+        self._slow_count = 0
+
+        if self.variant_index > 0:
+            current = self.variants[self.variant_index].bandwidth
+            higher = self.variants[self.variant_index - 1].bandwidth
+            # 按码率换算切回较高质量后的耗时比
+            projected = self._ratio * (higher / current) if current and higher else self._ratio
+            if projected < self.UPSHIFT_RATIO:
+                self._fast_count += 1
+                if self._fast_count >= self.UPSHIFT_PATIENCE:
+                    self.switch_variant(self.variant_index - 1, "upshift", segment.sequence)
+                    return True
+            else:
+                self._fast_count = 0
+        return False
+
+    def _lower_variant(self) -> int | None:
+        """当前质量之后第一个码率更低的流, 跳过码率相同或更高的流; 码率未知时取下一个"""
+        current = self.variants[self.variant_index].bandwidth
+        for index in range(self.variant_index + 1, len(self.variants)):
+            bandwidth = self.variants[index].bandwidth
+            if not current or not bandwidth or bandwidth < current:
+                return index
+        return None
+
+    def switch_variant(self, index: int, reason: str, sequence: int):
+        """切换到另一个质量, 之后的分片从新的媒体播放列表继续下载"""
+        previous = self.variant_index
+        self.variant_index = index
+        self.url = self.variants[index].url
+        self.metadata["switches"].append(
+            {
+                "time": time.time(),
+                "sequence": sequence,
+                "reason": reason,
+                "ratio": round(self._ratio or 0.0, 3),
+                "from": self._describe_variant(previous),
+                "to": self._describe_variant(index),
+            }
+        )
+        logger.info(
+            f"录制 {self.save_file_path} {reason}: {self.variants[previous].resolution} -> "
+            f"{self.variants[index].resolution}, 下载耗时比: {self._ratio:.2f}"
+        )
+        self._ratio = None
+        self._slow_count = 0
+        self._fast_count = 0
+        self.write_metadata()
+
+    def write_metadata(self):
+        """把会话信息写入与录制文件同名的.json文件"""
+        self.metadata.update(
+            {
+                "start_time": self.start_time,
+                "end_time": None if self.start_time is None else time.time(),
+                "bytes_written": self.bytes_written,
+                "segments_written": self.segments_written,
+                "segments_missed": self.segments_missed,
+            }
+        )
+        try:
+            with open(self.metadata_path, "w") as f:
+                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logger.error(f"写入会话元数据失败: {e}")
+
+    def time_limit_reached(self) -> bool:
+        # 轮转模式下时长限制只作用于单个文件
+        return (not self.rotate and bool(self.max_time_limit and self.max_time_limit > 0)) and (
+            time.time() - self.start_time >= self.max_time_limit
+        )
+
+    def part_path(self, index: int) -> str:
+        if not self.rotate:
+            return self.save_file_path
+        root, ext = os.path.splitext(self.save_file_path)
+        return f"{root}_part{index:03d}{ext}"
+
+    def should_rotate(self) -> bool:
+        """当前文件是否已达到时长或大小上限"""
+        if not self.rotate or not self.parts:
+            return False
+        part = self.parts[-1]
+        if self.max_time_limit and self.max_time_limit > 0 and part["duration"] >= self.max_time_limit:
+            return True
+        return bool(self.rotate_size and self.rotate_size > 0 and part["bytes"] >= self.rotate_size)
+
+    def open_part(self, sequence: int):
+        """关闭当前文件并开始下一个文件"""
+        self.close_part()
+        path = self.part_path(len(self.parts) + 1)
+        self._file = open(path, "ab")
+        self.parts.append({"path": path, "start_sequence": sequence, "end_sequence": sequence, "bytes": 0, "duration": 0.0})
+        if len(self.parts) > 1:
+            logger.info(f"录制文件轮转: {path}")
+            self.write_metadata()
+
+    def close_part(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def write_segment(self, segment: MediaSegment, data: bytes):
+        """在分片边界按需轮转后写入分片数据"""
+        if self._file is None or self.should_rotate():
+            self.open_part(segment.sequence)
+        self._file.write(data)
+        self._file.flush()
+
+        part = self.parts[-1]
+        part["end_sequence"] = segment.sequence
+        part["bytes"] += len(data)
+        part["duration"] += segment.duration
+        self.bytes_written += len(data)
+        self.segments_written += 1
+        self.stats.add_media(len(data), segment.duration)
+
+    def run(self) -> bool:
+        """
+        录制直到直播结束、达到时长限制或连续失败
+
+        Returns:
+            bool: 是否写入了数据
+        """
+        self.start_time = time.time()
+        failures = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.save_file_path)), exist_ok=True)
+        logger.info(f"开始录制流媒体到: {self.part_path(1)}")
+        recording_stats.register(self.stats)
+        try:
+            while not self.time_limit_reached() and not self.stop_event.is_set():
+                try:
+                    playlist = self.fetch_playlist()
+                except Exception as e:
+                    failures += 1
+                    logger.warning(f"获取媒体播放列表失败({failures}/{self.MAX_FAILURES}): {e}")
+                    if failures >= self.MAX_FAILURES:
+                        break
+                    self.check_proxy()
+                    self.stop_event.wait(1)
+                    continue
+
+                segments = self.new_segments(playlist)
+                for segment in segments:
+                    if self.stop_event.is_set():
+                        break
+                    if segment.is_ad:
+                        self.last_sequence = segment.sequence
+                        continue
+                    try:
+                        download_start = time.monotonic()
+                        data = self.download_segment(segment)
+                        download_time = time.monotonic() - download_start
+                    except Exception as e:
+                        # 分片很快会从播放列表中滚出, 失败时跳过而不是阻塞后续分片
+                        failures += 1
+                        self.segments_missed += 1
+                        logger.warning(f"下载分片 {segment.sequence} 失败({failures}/{self.MAX_FAILURES}): {e}")
+                        self.last_sequence = segment.sequence
+                        if failures >= self.MAX_FAILURES:
+                            break
+                        continue
+                    self.write_segment(segment, data)
+                    failures = 0
+                    self.last_sequence = segment.sequence
+                    if self.observe_throughput(segment, download_time):
+                        # 剩余分片从新质量的播放列表中获取
+                        break
+
+                if failures >= self.MAX_FAILURES or self.stop_event.is_set():
+                    break
+                if playlist.ended:
+                    logger.info(f"直播已结束: {self.save_file_path}")
+                    break
+
+                # 播放列表有更新时等待一个目标时长, 没有更新时等待一半 (RFC 8216 6.3.4)
+                target_duration = playlist.target_duration or 2
+                self.stop_event.wait(target_duration if segments else target_duration / 2)
+        finally:
+            self.close_part()
+            recording_stats.unregister(self.stats)
+
+        self.write_metadata()
+        logger.info(
+            f"录制结束: {self.save_file_path}, 文件: {len(self.parts)}, 分片: {self.segments_written}, 丢失: {self.segments_missed}, "
+            f"大小: {self.bytes_written} bytes, 时长: {int(time.time() - self.start_time)}s"
+        )
+        return self.bytes_written > 0
+
+
+def recode_native(
+    url: str,
+    proxy: str = "",
+    save_file_path: str = "",
+    nick_name: str = "",
+    max_time_limit: int = 3600,
+    variants: list[StreamInfo] | None = None,
+    adaptive: bool = False,
+    rotate: bool = False,
+    rotate_size: int = 0,
+    stop_event: threading.Event | None = None,
+    stop_timeout: float = 10,
+):
+    """
+    不启动ffmpeg直接录制Twitch流媒体, 参数与recode一致
+
+    Args:
+        url (str): 媒体播放列表URL
+        proxy (str): 代理设置
+        save_file_path (str): 保存文件路径(.ts)
+        nick_name (str): 昵称
+        max_time_limit (int): 最大录制时长(秒), 轮转模式下为单个文件的时长
+        variants (list[StreamInfo] | None): 最佳流及码率依次降低的可切换流(select_stream)
+        adaptive (bool): 下载速度跟不上时是否自动切换质量
+        rotate (bool): 是否按时长/大小轮转文件并持续录制到直播结束
+        rotate_size (int): 轮转模式下单个文件的大小上限(字节), 0表示不限制
+        stop_event (threading.Event | None): 置位后写完当前分片并关闭文件
+        stop_timeout (float): 与recode一致, 原生录制器写完当前分片即结束, 不需要等待
+
+    Returns:
+        bool: 录制是否成功
+    """
+    if not save_file_path:
+        save_file_path = f"./{nick_name}.ts" if nick_name else "./twitch_stream.ts"
+
+    recorder = HLSRecorder(url, proxy, save_file_path, max_time_limit, variants, adaptive, rotate, rotate_size, stop_event)
+    try:
+        return recorder.run()
+    except Exception as e:
+        logger.error(f"录制过程中发生错误: {e}")
+        return False
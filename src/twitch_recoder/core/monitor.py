@@ -0,0 +1,124 @@
+"""
+运行状态指标采集
+
+在每次抓取/metrics时读取任务管理器、录制统计和后处理队列的当前状态
+"""
+
+from twitch_recoder.common.metrics import MetricsServer, Sample, registry
+from twitch_recoder.common.utils import get_proxy_pool
+from twitch_recoder.common.taskManager import TaskStatus, process_task_manager, recode_task_manager
+from twitch_recoder.core.archive import archive_mover
+from twitch_recoder.core.postprocess import postprocess_manager
+from twitch_recoder.core.process import get_check_executor_stats
+from twitch_recoder.core.progress import recording_stats
+from twitch_recoder.core.storage import get_storage_manager
+
+
+TASK_MANAGERS = {"process": process_task_manager, "recode": recode_task_manager}
+
+
+def collect_tasks() -> list[Sample]:
+    queue_sizes = []
+    durations = []
+    for name, manager in TASK_MANAGERS.items():
+        for status, count in manager.count_by_status().items():
+            queue_sizes.append(({"manager": name, "status": status.value}, count))
+        for task in manager.get_all_tasks():
+            duration = task.get_duration()
+            if duration is not None:
+                durations.append(({"manager": name, "uid": task.uid, "task_id": task.task_id}, duration))
+
+    jobs = postprocess_manager.get_all_jobs()
+    for status in TaskStatus:
+        count = sum(1 for job in jobs if job.status == status)
+        queue_sizes.append(({"manager": "postprocess", "status": status.value}, count))
+    for job in jobs:
+        duration = job.get_duration()
+        if duration is not None:
+            durations.append(({"manager": "postprocess", "uid": job.uid, "task_id": job.job_id}, duration))
+
+    archive_jobs = archive_mover.get_all_jobs()
+    for status in TaskStatus:
+        count = sum(1 for job in archive_jobs if job.status == status)
+        queue_sizes.append(({"manager": "archive", "status": status.value}, count))
+
+    active = len(recode_task_manager.get_running_tasks())
+    return [
+        ("twitch_tasks", "gauge", "各任务管理器中按状态统计的任务数", queue_sizes),
+        ("twitch_task_duration_seconds", "gauge", "任务已运行或运行的总时长", durations),
+        ("twitch_active_recordings", "gauge", "正在运行的录制任务数", [({}, active)]),
+        ("twitch_archive_bytes_copied_total", "counter", "归档迁移已复制的字节数", [({}, archive_mover.bytes_copied)]),
+    ]
+
+
+def collect_recordings() -> list[Sample]:
+    bitrate = []
+    written = []
+    speed = []
+    for stats in recording_stats.get_all():
+        labels = {"name": stats.name, "path": stats.save_file_path}
+        bitrate.append((labels, stats.bitrate_kbps * 1000))
+        written.append((labels, stats.total_size))
+        speed.append((labels, stats.speed))
+    return [
+        ("twitch_recording_bitrate_bits_per_second", "gauge", "录制的输入码率", bitrate),
+        ("twitch_recording_bytes_written", "gauge", "录制已写入的字节数", written),
+        ("twitch_recording_speed_ratio", "gauge", "录制速度相对实时的倍数", speed),
+    ]
+
+
+def collect_check_executor() -> list[Sample]:
+    stats = get_check_executor_stats()
+    if stats is None:
+        return []
+    return [
+        ("twitch_check_queue_depth", "gauge", "检测线程池中排队的任务数", [({}, stats["queued"])]),
+        ("twitch_check_running", "gauge", "检测线程池中正在执行的任务数", [({}, stats["running"])]),
+        ("twitch_check_rejected_total", "counter", "检测队列已满被拒绝的任务数", [({}, stats["rejected"])]),
+        ("twitch_check_wait_seconds_avg", "gauge", "检测任务的平均排队时间", [({}, stats["avg_wait"])]),
+        ("twitch_check_wait_seconds_max", "gauge", "检测任务的最长排队时间", [({}, stats["max_wait"])]),
+    ]
+
+
+def collect_proxies() -> list[Sample]:
+    pool = get_proxy_pool()
+    if pool is None:
+        return []
+    healthy, latency, active = [], [], []
+    for state in pool.snapshot():
+        labels = {"proxy": state["url"]}
+        healthy.append((labels, 1 if state["healthy"] else 0))
+        active.append((labels, state["active"]))
+        if state["latency"] is not None:
+            latency.append((labels, state["latency"]))
+    return [
+        ("twitch_proxy_healthy", "gauge", "代理是否在轮换中", healthy),
+        ("twitch_proxy_latency_seconds", "gauge", "代理探测延迟的加权平均", latency),
+        ("twitch_proxy_active_recordings", "gauge", "使用该代理的录制任务数", active),
+    ]
+
+
+def collect_volumes() -> list[Sample]:
+    free, reserved, writers = [], [], []
+    for volume in get_storage_manager().snapshot():
+        labels = {"volume": volume["volume"]}
+        free.append((labels, volume["free"]))
+        reserved.append((labels, volume["reserved"]))
+        writers.append((labels, volume["writers"]))
+    return [
+        ("twitch_volume_free_bytes", "gauge", "录制目录所在卷的剩余空间", free),
+        ("twitch_volume_reserved_bytes", "gauge", "为进行中的录制预留的空间", reserved),
+        ("twitch_volume_active_recordings", "gauge", "写入该目录的录制任务数", writers),
+    ]
+
+
+def start_metrics_server(host: str, port: int) -> MetricsServer:
+    """注册采集函数并启动指标服务"""
+    registry.add_collector(collect_tasks)
+    registry.add_collector(collect_recordings)
+    registry.add_collector(collect_check_executor)
+    registry.add_collector(collect_proxies)
+    registry.add_collector(collect_volumes)
+    server = MetricsServer(host, port)
+    server.start()
+    return server
@@ -0,0 +1,471 @@
+"""
+录制文件后处理模块
+
+录制结束后把转封装(TS/fMP4 -> faststart mp4)和合并轮转文件的任务放入持久化队列,
+由固定大小的进程池按优先级和提交时间依次执行, 不阻塞录制线程, 也不会在大量直播
+同时结束时一次启动几十个ffmpeg。输出文件校验通过后才删除源文件。
+"""
+
+import glob
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from loguru import logger
+
+from twitch_recoder.common.taskManager import TaskStatus, TaskType
+from twitch_recoder.core.recoder import concat_files, remux_file, verify_media_file
+
+
+POSTPROCESS_MODES = ("none", "remux", "merge")
+
+
+def _init_worker():
+    """工作进程单独成为进程组, 关闭超时时连同其中的ffmpeg一起终止; 也不再收到终端的Ctrl+C"""
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+
+def _terminate_worker(pid: int):
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+
+def _run_job(kind: str, sources: list[str], output_path: str) -> bool:
+    """在工作进程中执行转封装或合并, 并校验输出文件"""
+    if kind == "merge":
+        success = concat_files(sources, output_path)
+    else:
+        success = remux_file(sources[0], output_path)
+    return success and verify_media_file(output_path)
+
+
+class PostProcessJob:
+    """单个后处理任务, 状态沿用TaskStatus"""
+
+    def __init__(
+        self,
+        job_id: str,
+        uid: str,
+        kind: str,
+        sources: list[str],
+        target: str,
+        priority: int = 0,
+        create_time: float | None = None,
+        attempts: int = 0,
+        status: str = TaskStatus.QUEUED.value,
+        error_message: str | None = None,
+    ):
+        self.job_id = job_id
+        self.uid = uid
+        self.task_type = TaskType.POSTPROCESS
+        self.kind = kind
+        self.sources = sources
+        self.target = target
+        self.priority = priority
+        self.create_time = create_time or time.time()
+        self.attempts = attempts
+        self.status = TaskStatus(status)
+        self.error_message = error_message
+
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        # 重试前的等待截止时间, 不持久化
+        self.not_before = 0.0
+
+    @property
+    def temp_path(self) -> str:
+        """输出先写入临时文件, 校验通过后再替换为目标文件, 目标可以与源文件同名"""
+        root, ext = os.path.splitext(self.target)
+        return f"{root}.postprocess{ext}"
+
+    def sort_key(self) -> tuple:
+        return (-self.priority, self.create_time)
+
+    def get_duration(self) -> Optional[float]:
+        if self.start_time and self.end_time:
+            return self.end_time - self.start_time
+        elif self.start_time:
+            return time.time() - self.start_time
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "uid": self.uid,
+            "kind": self.kind,
+            "sources": self.sources,
+            "target": self.target,
+            "priority": self.priority,
+            "create_time": self.create_time,
+            "attempts": self.attempts,
+            "status": self.status.value,
+            "error_message": self.error_message,
+        }
+
+    def __str__(self):
+        return f"PostProcessJob(job_id={self.job_id}, uid={self.uid}, kind={self.kind}, status={self.status}, attempts={self.attempts})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class PostProcessManager:
+    """持久化的后处理队列
+
+    与TaskManager一样按状态查询任务。调度线程从堆中取出优先级最高、提交最早的任务,
+    交给max_workers个工作进程执行; 失败的任务按retry_delay * 已尝试次数延迟后重试,
+    超过max_retries后标记为FAILED并保留源文件。
+    """
+
+    def __init__(self, max_workers: int = 2, max_retries: int = 3, retry_delay: float = 60, state_path: str = ""):
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max(1, max_retries)
+        self.retry_delay = retry_delay
+        self.state_path = state_path
+
+        self._cond = threading.Condition()
+        self._jobs: dict[str, PostProcessJob] = {}
+        self._heap: list[tuple[int, float, int, str]] = []
+        self._counter = itertools.count()
+        self._running = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._dispatcher: threading.Thread | None = None
+        self._stopping = False
+        self._callbacks: list[Callable[[PostProcessJob], None]] = []
+
+    def configure(self, max_workers: int, max_retries: int, retry_delay: float, state_path: str):
+        """启动前按配置调整参数"""
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max(1, max_retries)
+        self.retry_delay = retry_delay
+        self.state_path = state_path
+
+    def add_done_callback(self, callback: Callable[[PostProcessJob], None]):
+        """注册任务完成或最终失败时的回调, 在工作进程的结果回调线程中调用"""
+        with self._cond:
+            if callback not in self._callbacks:
+                self._callbacks.append(callback)
+
+    def remove_done_callback(self, callback: Callable[[PostProcessJob], None]):
+        with self._cond:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def start(self):
+        """加载持久化队列并启动调度线程"""
+        with self._cond:
+            if self._dispatcher and self._dispatcher.is_alive():
+                return
+            self._stopping = False
+        self.load()
+        self._executor = self._create_executor()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="PostProcessDispatcher", daemon=True)
+        self._dispatcher.start()
+        logger.info(f"后处理队列已启动, 工作进程: {self.max_workers}, 待处理任务: {len(self.get_queued_jobs())}")
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # 录制线程仍在运行, 使用spawn避免fork时复制线程持有的锁
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+        )
+
+    def stop_dispatch(self):
+        """停止调度新任务, 之后提交的任务只排队并保存, 下次启动时执行"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._dispatcher:
+            self._dispatcher.join()
+            self._dispatcher = None
+
+    def shutdown(self, timeout: float | None = None):
+        """
+        停止调度并等待正在执行的任务, 未执行的任务保留在队列文件中
+
+        Args:
+            timeout (float | None): 等待正在执行的任务的最长时间(秒), 超时后终止工作进程,
+                被终止的任务下次启动时重新执行; None表示一直等待
+        """
+        self.stop_dispatch()
+        executor = self._executor
+        if executor:
+            with self._cond:
+                finished = self._cond.wait_for(lambda: self._running == 0, timeout)
+            if not finished:
+                logger.warning(f"{self._running} 个后处理任务未能在 {timeout}s 内完成, 下次启动时重新执行")
+                for pid in list(executor._processes or {}):
+                    _terminate_worker(pid)
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            # 工作进程被终止后, 结果回调会很快把任务标记为SHUTDOWN
+            with self._cond:
+                self._cond.wait_for(lambda: self._running == 0, 5)
+        self.save()
+
+    def submit(self, uid: str, kind: str, sources: list[str], target: str, priority: int = 0) -> PostProcessJob:
+        """提交后处理任务
+
+        Args:
+            uid (str): 频道UID
+            kind (str): remux(单个文件转封装) 或 merge(按顺序合并多个文件)
+            sources (list[str]): 源文件路径
+            target (str): 输出文件路径
+            priority (int): 优先级, 数值越大越先执行
+
+        Returns:
+            PostProcessJob: 新建的任务
+        """
+        job = PostProcessJob(f"postprocess_{uid}_{int(time.time() * 1000)}_{next(self._counter)}", uid, kind, sources, target, priority)
+        with self._cond:
+            self._jobs[job.job_id] = job
+            self._push(job)
+            self._cond.notify_all()
+        self.save()
+        logger.info(f"已提交后处理任务: {job.kind} {len(job.sources)} 个文件 -> {job.target}")
+        return job
+
+    def _push(self, job: PostProcessJob):
+        heapq.heappush(self._heap, (*job.sort_key(), next(self._counter), job.job_id))
+
+    def _pop_ready(self) -> tuple[PostProcessJob | None, float | None]:
+        """取出可以执行的任务, 同时返回最近一个等待重试任务的剩余时间"""
+        now = time.time()
+        deferred = []
+        job = None
+        wait = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            candidate = self._jobs.get(entry[-1])
+            if candidate is None or candidate.status != TaskStatus.QUEUED:
+                continue
+            if candidate.not_before > now:
+                deferred.append(entry)
+                remaining = candidate.not_before - now
+                wait = remaining if wait is None else min(wait, remaining)
+                continue
+            job = candidate
+            break
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+        return job, wait
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._stopping:
+                    if self._running < self.max_workers:
+                        job, wait = self._pop_ready()
+                        if job:
+                            break
+                    else:
+                        wait = None
+                    self._cond.wait(timeout=wait)
+                if self._stopping:
+                    return
+                job.status = TaskStatus.RUNNING
+                job.start_time = time.time()
+                job.end_time = None
+                job.attempts += 1
+                self._running += 1
+
+            logger.info(f"开始后处理: {job.kind} -> {job.target}, 第 {job.attempts} 次")
+            executor = self._executor
+            try:
+                future = executor.submit(_run_job, job.kind, job.sources, job.temp_path)
+            except RuntimeError as e:
+                self._finish(job, False, str(e))
+                continue
+            future.add_done_callback(lambda f, job=job, executor=executor: self._on_done(job, f, executor))
+
+    def _on_done(self, job: PostProcessJob, future: Future, executor: ProcessPoolExecutor):
+        try:
+            success = future.result()
+            error = None if success else "输出文件校验失败"
+        except BrokenProcessPool as e:
+            # 工作进程异常退出后进程池不可再用, 重建后由重试继续处理
+            success, error = False, str(e)
+            with self._cond:
+                if self._executor is executor and not self._stopping:
+                    self._executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = self._create_executor()
+                    logger.warning("后处理工作进程异常退出, 已重建进程池")
+        except Exception as e:
+            success, error = False, str(e)
+        self._finish(job, success, error)
+
+    def _finish(self, job: PostProcessJob, success: bool, error: str | None):
+        if success:
+            # 先替换输出文件再删除源文件, remux的.mp4源文件与输出同名, 不能删除
+            try:
+                os.replace(job.temp_path, job.target)
+            except OSError as e:
+                success, error = False, f"替换输出文件失败: {e}"
+            else:
+                target = os.path.abspath(job.target)
+                for source in job.sources:
+                    if os.path.abspath(source) == target:
+                        continue
+                    try:
+                        os.remove(source)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        logger.warning(f"删除后处理源文件失败: {source}, 错误: {e}")
+
+        with self._cond:
+            self._running -= 1
+            job.end_time = time.time()
+            if success:
+                job.status = TaskStatus.COMPLETED
+                job.error_message = None
+            else:
+                job.error_message = error
+                if job.attempts >= self.max_retries:
+                    job.status = TaskStatus.FAILED
+                elif self._stopping:
+                    # 关闭时被终止或失败的任务下次启动时重新排队
+                    job.status = TaskStatus.SHUTDOWN
+                else:
+                    job.status = TaskStatus.QUEUED
+                    job.not_before = time.time() + self.retry_delay * job.attempts
+                    self._push(job)
+            self._cond.notify_all()
+
+        if success:
+            logger.info(f"后处理完成: {job.target}, 耗时: {job.get_duration():.1f}s")
+        else:
+            if os.path.exists(job.temp_path):
+                os.remove(job.temp_path)
+            if job.status == TaskStatus.FAILED:
+                logger.error(f"后处理失败, 保留源文件: {job.sources}, 错误: {error}")
+            elif job.status == TaskStatus.SHUTDOWN:
+                logger.warning(f"后处理已中断, 下次启动时重新执行: {job.target}")
+            else:
+                logger.warning(f"后处理失败, 稍后重试: {job.target}, 错误: {error}")
+        self.save()
+
+        if job.status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+            with self._cond:
+                callbacks = list(self._callbacks)
+            for callback in callbacks:
+                try:
+                    callback(job)
+                except Exception as e:
+                    logger.error(f"后处理回调执行失败: {e}")
+
+        # 已完成的任务不再保存, 回调执行后从内存中移除; 失败的任务保留在队列文件中供排查
+        if job.status == TaskStatus.COMPLETED:
+            with self._cond:
+                if self._jobs.get(job.job_id) is job:
+                    del self._jobs[job.job_id]
+
+    def save(self):
+        """保存未完成的任务, 重启后继续处理"""
+        if not self.state_path:
+            return
+        with self._cond:
+            data = [job.to_dict() for job in self._jobs.values() if job.status != TaskStatus.COMPLETED]
+        try:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"保存后处理队列失败: {e}")
+
+    def load(self):
+        if not self.state_path or not os.path.isfile(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r") as f:
+                data = json.load(f)
+            with self._cond:
+                for item in data:
+                    job = PostProcessJob(**item)
+                    # 上次退出时正在执行的任务重新排队
+                    if job.status in (TaskStatus.RUNNING, TaskStatus.SHUTDOWN):
+                        job.status = TaskStatus.QUEUED
+                    if job.job_id in self._jobs:
+                        continue
+                    self._jobs[job.job_id] = job
+                    if job.status == TaskStatus.QUEUED:
+                        self._push(job)
+            logger.info(f"已加载 {len(data)} 个后处理任务")
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"读取后处理队列失败: {e}")
+
+    def clear_completed_jobs(self):
+        with self._cond:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.status == TaskStatus.COMPLETED]:
+                del self._jobs[job_id]
+
+    def get_all_jobs(self) -> list[PostProcessJob]:
+        with self._cond:
+            return list(self._jobs.values())
+
+    def get_queued_jobs(self) -> list[PostProcessJob]:
+        return [job for job in self.get_all_jobs() if job.status == TaskStatus.QUEUED]
+
+    def get_running_jobs(self) -> list[PostProcessJob]:
+        return [job for job in self.get_all_jobs() if job.status == TaskStatus.RUNNING]
+
+    def get_completed_jobs(self) -> list[PostProcessJob]:
+        return [job for job in self.get_all_jobs() if job.status == TaskStatus.COMPLETED]
+
+    def get_failed_jobs(self) -> list[PostProcessJob]:
+        return [job for job in self.get_all_jobs() if job.status == TaskStatus.FAILED]
+
+
+postprocess_manager = PostProcessManager()
+
+
+def collect_output_files(save_file_path: str) -> list[str]:
+    """找出一次录制产生的文件: 轮转模式下为按序号排列的_partNNN文件, 否则为save_file_path本身"""
+    root, ext = os.path.splitext(save_file_path)
+    parts = sorted(glob.glob(f"{glob.escape(root)}_part[0-9][0-9][0-9]{ext}"))
+    if parts:
+        return parts
+    return [save_file_path] if os.path.isfile(save_file_path) and os.path.getsize(save_file_path) > 0 else []
+
+
+def submit_postprocess(uid: str, save_file_path: str, mode: str, priority: int = 0) -> list[PostProcessJob]:
+    """
+    按后处理模式为一次录制提交任务
+
+    Args:
+        uid (str): 频道UID
+        save_file_path (str): 录制时使用的保存路径
+        mode (str): none / remux(每个文件转封装为同名mp4) / merge(轮转文件合并为一个mp4)
+        priority (int): 优先级
+
+    Returns:
+        list[PostProcessJob]: 提交的任务
+    """
+    if mode not in POSTPROCESS_MODES:
+        logger.error(f"不支持的后处理模式: {mode}, 可选: {', '.join(POSTPROCESS_MODES)}")
+        return []
+    files = collect_output_files(save_file_path)
+    if mode == "none" or not files:
+        return []
+
+    if mode == "merge" and len(files) > 1:
+        target = os.path.splitext(save_file_path)[0] + ".mp4"
+        return [postprocess_manager.submit(uid, "merge", files, target, priority)]
+    return [
+        postprocess_manager.submit(uid, "remux", [path], os.path.splitext(path)[0] + ".mp4", priority) for path in files
+    ]
@@ -1,19 +1,28 @@
 from datetime import datetime
 import time
 import os
+from typing import Callable
 from loguru import logger
-from twitch_recoder.api.twitch_api import process_twitch_stream
-from twitch_recoder.core.recoder import recode
+from twitch_recoder.api.twitch_api import check_liveness, playback_token_cache, process_twitch_stream
+from twitch_recoder.core.hls_recorder import recode_native
+from twitch_recoder.core.archive import submit_archive
+from twitch_recoder.core.postprocess import collect_output_files, submit_postprocess
+from twitch_recoder.core.recoder import get_output_format, recode
+from twitch_recoder.core.storage import get_storage_manager
 from twitch_recoder.config.my_config import config
+from twitch_recoder.common.executor import BoundedExecutor
+from twitch_recoder.common.metrics import channel_checks
+from twitch_recoder.common.utils import acquire_proxy, release_proxy
 from twitch_recoder.common.taskManager import TaskType, Task, process_task_manager, recode_task_manager
 from twitch_recoder.types.errors import NetWorkErr, OfflineErr
+from twitch_recoder.types.typeinfo import StreamInfo
 
 
-def process_single_uid(uid: str) -> bool:
+def process_single_uid(uid: str, nickname: str | None = None) -> bool:
     """处理单个UID的录制任务"""
 
     try:
-        best_stream = process_twitch_stream(uid)
+        best_stream = process_twitch_stream(uid, nickname)
     except OfflineErr:
         logger.error(f"频道 {uid} 未开播")
         return False
@@ -21,62 +30,238 @@ def process_single_uid(uid: str) -> bool:
         logger.error(f"{uid} 获取流媒体信息失败: {e}")
         return False
 
+    return submit_recode_task(uid, best_stream)
+
+
+def get_postprocess_mode() -> str:
+    """后处理模式, 兼容旧的native_remux配置"""
+    if config.postprocess == "none" and config.native_remux and config.recorder_backend == "native":
+        return "remux"
+    return config.postprocess
+
+
+def run_recode_task(uid: str, func: Callable, *args, **kwargs) -> bool:
+    """执行录制, 结束后把产生的文件交给后处理和归档队列, 录制线程不等待转封装和迁移"""
+    save_file_path = args[2]
+    try:
+        return func(*args, **kwargs)
+    finally:
+        release_proxy(save_file_path)
+        get_storage_manager().release(os.path.basename(save_file_path))
+        # 需要后处理的文件在后处理完成后归档, 否则直接归档
+        if not submit_postprocess(uid, save_file_path, get_postprocess_mode()):
+            submit_archive(uid, collect_output_files(save_file_path))
+
+
+def submit_recode_task(uid: str, best_stream: StreamInfo | None) -> bool:
+    """为已开播的频道创建并启动录制任务"""
+
     if not best_stream or not best_stream.url:
         logger.error(f"{uid} 获取流媒体信息失败: {best_stream}")
         return False
 
     # 确保nickname是字符串类型
     nickname = str(best_stream.nickname) if best_stream.nickname else str(best_stream.uid)
-    resolution = str(best_stream.resolution) if best_stream.resolution else "unknown"
-    frame_rate = str(best_stream.frame_rate) if best_stream.frame_rate else "unknown"
 
     # 生成录制任务ID
     recode_task_id = f"recode_{uid}_{int(time.time())}"
 
-    os.makedirs(config.data_path, exist_ok=True)
     streamer_name = nickname
-    save_file_name = f"{streamer_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
-    save_file_path = os.path.join(config.data_path, save_file_name)
-
-    task = Task(
-        task_id=recode_task_id,
-        uid=uid,
-        task_type=TaskType.RECODE,
-        func=recode,
-        args=(best_stream.url, config.proxy, save_file_path, nickname, config.max_time_limit),
-    )
-    recode_task_manager.add_task(task)
+    # 原生录制器直接写入MPEG-TS分片
+    if config.recorder_backend == "native":
+        extension = "ts"
+    else:
+        extension = get_output_format(config.output_format)["extension"]
+    save_file_name = f"{streamer_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+    # 选择存储卷并按码率预留空间, 空间不足时降低画质或放弃本次录制
+    variants = best_stream.variants or [best_stream]
+    candidates = variants[variants.index(best_stream) :] if best_stream in variants else [best_stream]
+    # 不分段且有时长上限时, 只需要为时长上限内的写入预留空间
+    horizon = config.max_time_limit if config.max_time_limit > 0 and not config.rotate_recording else None
+    admitted = get_storage_manager().reserve(save_file_name, candidates, horizon)
+    if admitted is None:
+        return False
+    stream, volume = admitted
+    resolution = str(stream.resolution) if stream.resolution else "unknown"
+    frame_rate = str(stream.frame_rate) if stream.frame_rate else "unknown"
+    save_file_path = os.path.join(volume, save_file_name)
+
+    # 使用代理池时每个录制任务租用一个代理, 录制结束后在run_recode_task中归还
+    proxy = acquire_proxy(save_file_path)
+    args = (stream.url, proxy, save_file_path, nickname, config.max_time_limit)
+    if config.recorder_backend == "native":
+        task = Task(
+            task_id=recode_task_id,
+            uid=uid,
+            task_type=TaskType.RECODE,
+            func=run_recode_task,
+            args=(uid, recode_native, *args),
+            variants=best_stream.variants,
+            adaptive=config.adaptive_variant,
+            rotate=config.rotate_recording,
+            rotate_size=config.rotate_size_limit,
+        )
+    else:
+        task = Task(
+            task_id=recode_task_id,
+            uid=uid,
+            task_type=TaskType.RECODE,
+            func=run_recode_task,
+            args=(uid, recode, *args),
+            rotate=config.rotate_recording,
+            output_format=config.output_format,
+            progress_interval=config.progress_log_interval,
+        )
+    # 停止任务(关闭程序或按removed_channel_policy移除频道)时让录制器正常结束并写完文件
+    task.kwargs["stop_event"] = task.stop_event
+    task.kwargs["stop_timeout"] = config.shutdown_timeout
+    if not recode_task_manager.add_task(task):
+        # 程序正在关闭
+        release_proxy(save_file_path)
+        get_storage_manager().release(save_file_name)
+        return False
     task.start()
 
     logger.info(f"已提交录制任务, UID:{uid}, {resolution}:{frame_rate}, save_path: {save_file_path}")
     return True
 
 
-def process():
-    """主处理函数 - 为每个UID创建处理任务"""
-    if not config.uids:
-        logger.error("配置中没有UID")
-        return False
-    logger.info("清除已完成任务")
-    process_task_manager.clear_completed_tasks()
-    recode_task_manager.clear_completed_tasks()
+_check_executor: BoundedExecutor | None = None
+# 通过控制命令停止录制的频道, 检测到下播或收到指定该频道的poll命令之前不再自动录制
+_suppressed_uids: set[str] = set()
+# 队列已满时下一轮从第一个被跳过的频道开始, 避免列表靠后的频道一直排不上
+_check_cursor = 0
+
+
+def get_check_executor() -> BoundedExecutor:
+    """thread轮询引擎使用的检测线程池, 首次调用时按配置创建"""
+    global _check_executor
+    if _check_executor is None:
+        _check_executor = BoundedExecutor(config.check_workers, config.check_queue_size, "check")
+    return _check_executor
+
+
+def shutdown_check_executor():
+    """取消排队中的检测并等待正在执行的检测结束, 关闭程序时在停止录制之前调用"""
+    if _check_executor is not None:
+        _check_executor.shutdown(wait=True)
+
+
+def get_check_executor_stats() -> dict | None:
+    """检测线程池的统计, 未创建时返回None"""
+    return _check_executor.stats() if _check_executor else None
+
+
+def run_process_task(task: Task):
+    """在检测线程池中执行process任务, 排队期间被停止的任务直接移除"""
+    if task.is_stopped():
+        process_task_manager.remove_task(task)
+        return
+    task.run()
+
+
+def check_batch(uids: list[str]):
+    """批量检测开播状态, 为开播的频道提交process任务"""
+    rooms = check_liveness(uids, config.liveness_batch_size)
+    for uid in uids:
+        if uid not in rooms:
+            channel_checks.inc(uid=uid, result="error")
+
     this_time_process_uids = []
-    for uid in config.uids:
-        # 检查是否存在process任务
-        process_task = process_task_manager.find_task_by_uid(uid)
-        recode_task = recode_task_manager.find_task_by_uid(uid)
-        if process_task or recode_task:
+    for uid, (nickname, status) in rooms.items():
+        channel_checks.inc(uid=uid, result="live" if status else "offline")
+        if not status:
+            _suppressed_uids.discard(uid)
+            continue
+        if uid in _suppressed_uids:
             continue
-        # 如果没有/已经完成对应uid的process任务，则创建process任务
+        # process任务同样交给线程池执行, 排队期间仍可通过process_task_manager按uid查到
         task = Task(
             task_id=f"process_{uid}",
             uid=uid,
             task_type=TaskType.PROCESS,
             func=process_single_uid,
-            args=(uid,),
+            args=(uid, nickname),
         )
-        process_task_manager.add_task(task)
-        task.start()
+        if not process_task_manager.add_task(task):
+            continue
+        # 开播的频道数量有限, 不受排队上限限制, 避免被后面的批量检测挤掉
+        if get_check_executor().submit(run_process_task, task, keys=[task.task_id], force=True) is None:
+            process_task_manager.remove_task(task)
+            continue
         this_time_process_uids.append(uid)
 
-    logger.info(f"没有正在运行的{this_time_process_uids}任务, 已创建")
\ No newline at end of file
+    if this_time_process_uids:
+        logger.info(f"没有正在运行的{this_time_process_uids}任务, 已创建")
+
+
+def suppress_uid(uid: str):
+    """thread模式下控制命令停止录制前调用, 录制结束后不再立即重新录制该频道"""
+    _suppressed_uids.add(uid)
+
+
+def request_poll(uids: list[str]) -> int:
+    """thread模式下立即检测指定频道(为空时检测全部空闲频道)
+
+    明确指定的频道同时恢复被stop命令停止的自动录制。
+
+    Returns:
+        int: 提交检测的频道数
+    """
+    _suppressed_uids.difference_update(uids)
+    executor = get_check_executor()
+    uids = [
+        uid
+        for uid in (uids or config.uids)
+        if not process_task_manager.find_task_by_uid(uid)
+        and not recode_task_manager.find_task_by_uid(uid)
+        and not executor.is_pending(uid)
+    ]
+    batch_size = max(1, config.liveness_batch_size)
+    submitted = 0
+    for index in range(0, len(uids), batch_size):
+        batch = uids[index : index + batch_size]
+        if executor.submit(check_batch, batch, keys=batch, force=True) is not None:
+            submitted += len(batch)
+    return submitted
+
+
+def process():
+    """主处理函数 - 把空闲频道分批交给有界的检测线程池
+
+    线程数和排队数都有上限; 已在队列中等待的频道本轮跳过, 队列已满时剩余频道留到下一轮。
+    """
+    if not config.uids:
+        logger.error("配置中没有UID")
+        return False
+    # 任务结束时已由TaskManager自动移除, 这里只需按uid查询
+    global _check_cursor
+    playback_token_cache.prune(config.uids)
+    executor = get_check_executor()
+    start = _check_cursor % len(config.uids)
+    idle_uids = []
+    for uid in config.uids[start:] + config.uids[:start]:
+        # 检查是否存在process/recode任务, 或者仍在检测队列中
+        process_task = process_task_manager.find_task_by_uid(uid)
+        recode_task = recode_task_manager.find_task_by_uid(uid)
+        if process_task or recode_task or executor.is_pending(uid):
+            continue
+        idle_uids.append(uid)
+
+    batch_size = max(1, config.liveness_batch_size)
+    submitted = skipped = 0
+    for index in range(0, len(idle_uids), batch_size):
+        batch = idle_uids[index : index + batch_size]
+        if executor.submit(check_batch, batch, keys=batch) is None:
+            if not skipped:
+                _check_cursor = config.uids.index(batch[0])
+            skipped += len(batch)
+        else:
+            submitted += len(batch)
+
+    stats = executor.stats()
+    logger.info(
+        f"提交检测 {submitted} 个频道, 队列已满跳过 {skipped} 个; 排队: {stats['queued']}/{stats['max_queue']}, "
+        f"执行中: {stats['running']}/{stats['max_workers']}, 平均等待: {stats['avg_wait']:.2f}s, 最大等待: {stats['max_wait']:.2f}s"
+    )
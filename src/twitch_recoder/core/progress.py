@@ -0,0 +1,167 @@
+"""
+录制进度统计模块
+
+解析ffmpeg -progress输出的key=value块, 为每个录制任务维护实时统计,
+并按固定间隔输出一行摘要日志, 不再逐行转发ffmpeg输出
+"""
+
+import threading
+import time
+
+from loguru import logger
+
+
+class RecordingStats:
+    """单个录制任务的实时统计"""
+
+    def __init__(self, name: str, save_file_path: str):
+        self.name = name
+        self.save_file_path = save_file_path
+        self.start_time = time.time()
+        self.update_time: float | None = None
+
+        self.frame = 0
+        self.fps = 0.0
+        self.bitrate_kbps = 0.0
+        self.total_size = 0
+        self.out_time = 0.0
+        self.dup_frames = 0
+        self.drop_frames = 0
+        self.speed = 0.0
+        self.finished = False
+
+        # 当前正在接收的progress块, 遇到progress=行时整体生效
+        self._pending: dict[str, str] = {}
+
+    def feed(self, line: str) -> bool:
+        """
+        输入一行ffmpeg输出
+
+        Args:
+            line (str): 去掉换行符的输出行
+
+        Returns:
+            bool: 是否为progress的key=value行; 其它行(ffmpeg日志)返回False
+        """
+        key, sep, value = line.partition("=")
+        if not sep or not key or " " in key:
+            return False
+        if key == "progress":
+            self._apply(self._pending)
+            self._pending = {}
+            self.finished = value == "end"
+        else:
+            self._pending[key] = value.strip()
+        return True
+
+    def _apply(self, values: dict[str, str]):
+        self.frame = _to_int(values.get("frame"), self.frame)
+        self.fps = _to_float(values.get("fps"), self.fps)
+        self.total_size = _to_int(values.get("total_size"), self.total_size)
+        self.dup_frames = _to_int(values.get("dup_frames"), self.dup_frames)
+        self.drop_frames = _to_int(values.get("drop_frames"), self.drop_frames)
+        bitrate = values.get("bitrate", "")
+        self.bitrate_kbps = _to_float(bitrate.removesuffix("kbits/s"), self.bitrate_kbps)
+        self.speed = _to_float(values.get("speed", "").removesuffix("x"), self.speed)
+        out_time_us = values.get("out_time_us") or values.get("out_time_ms")
+        if out_time_us:
+            # 旧版ffmpeg的out_time_ms实际单位也是微秒
+            self.out_time = _to_int(out_time_us, 0) / 1_000_000 or self.out_time
+        self.update_time = time.time()
+
+    def add_media(self, size: int, duration: float):
+        """不经过ffmpeg的录制直接累加写入的数据量和媒体时长"""
+        self.total_size += size
+        self.out_time += duration
+        now = time.time()
+        if self.out_time > 0:
+            self.bitrate_kbps = self.total_size * 8 / 1000 / self.out_time
+        if now > self.start_time:
+            self.speed = self.out_time / (now - self.start_time)
+        self.update_time = now
+
+    def summary(self) -> str:
+        return (
+            f"{self.name} 已录制: {_format_duration(self.out_time)}, 大小: {self.total_size / 1024 / 1024:.1f}MB, "
+            f"码率: {self.bitrate_kbps:.0f}kbps, 速度: {self.speed:.2f}x, 丢帧: {self.drop_frames}, 重复帧: {self.dup_frames}"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "save_file_path": self.save_file_path,
+            "start_time": self.start_time,
+            "update_time": self.update_time,
+            "frame": self.frame,
+            "fps": self.fps,
+            "bitrate_kbps": self.bitrate_kbps,
+            "total_size": self.total_size,
+            "out_time": self.out_time,
+            "dup_frames": self.dup_frames,
+            "drop_frames": self.drop_frames,
+            "speed": self.speed,
+        }
+
+    def __str__(self):
+        return f"RecordingStats(name={self.name}, out_time={self.out_time:.1f}, total_size={self.total_size}, speed={self.speed})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ProgressLogger:
+    """按间隔输出统计摘要, 两次摘要之间的更新只更新统计不写日志"""
+
+    def __init__(self, stats: RecordingStats, interval: float = 60):
+        self.stats = stats
+        self.interval = interval
+        self._last_log = time.monotonic()
+
+    def maybe_log(self):
+        now = time.monotonic()
+        if self.interval > 0 and now - self._last_log >= self.interval:
+            self._last_log = now
+            logger.info(self.stats.summary())
+
+
+class RecordingStatsRegistry:
+    """正在进行的录制统计, 以保存路径为键"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, RecordingStats] = {}
+
+    def register(self, stats: RecordingStats):
+        with self._lock:
+            self._stats[stats.save_file_path] = stats
+
+    def unregister(self, stats: RecordingStats):
+        with self._lock:
+            if self._stats.get(stats.save_file_path) is stats:
+                del self._stats[stats.save_file_path]
+
+    def get_all(self) -> list[RecordingStats]:
+        with self._lock:
+            return list(self._stats.values())
+
+
+recording_stats = RecordingStatsRegistry()
+
+
+def _to_int(value: str | None, default: int) -> int:
+    try:
+        return int(value) if value not in (None, "", "N/A") else default
+    except ValueError:
+        return default
+
+
+def _to_float(value: str | None, default: float) -> float:
+    try:
+        return float(value) if value not in (None, "", "N/A") else default
+    except ValueError:
+        return default
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
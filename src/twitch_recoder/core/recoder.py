@@ -1,9 +1,74 @@
+import os
+import shutil
 import subprocess
-import time
+import threading
+from collections import deque
 from loguru import logger
+from twitch_recoder.common.utils import get_proxy_pool
+from twitch_recoder.core.progress import ProgressLogger, RecordingStats, recording_stats
 
 
-def recode(url: str, proxy: str = "", save_file_path: str = "", nick_name: str = "", max_time_limit: int = 3600):
+# 录制时的输出封装格式
+# mp4: 普通mp4, moov在结束时写入, 进程被杀死后文件不可播放
+# ts: MPEG-TS, 边写边可读, 进程被杀死后已写入部分仍可播放
+# fmp4: 分片mp4(frag_keyframe+empty_moov), 同样可以边写边读且不需要在结束时重写文件
+OUTPUT_FORMATS = {
+    "mp4": {"extension": "mp4", "muxer": "mp4", "options": []},
+    "ts": {"extension": "ts", "muxer": "mpegts", "options": []},
+    "fmp4": {
+        "extension": "mp4",
+        "muxer": "mp4",
+        "options": ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"],
+    },
+}
+
+
+def get_output_format(output_format: str) -> dict:
+    """获取输出格式的扩展名、封装器和额外参数, 未知格式按mp4处理"""
+    if output_format not in OUTPUT_FORMATS:
+        logger.warning(f"未知的输出格式: {output_format}, 使用mp4")
+        output_format = "mp4"
+    return OUTPUT_FORMATS[output_format]
+
+
+def _watch_stop(process: subprocess.Popen, stop_event: threading.Event, stop_timeout: float, finished: threading.Event):
+    """收到停止信号时向ffmpeg发送q, 让它写完文件尾后退出; 超时后再terminate/kill"""
+    while not stop_event.wait(1):
+        if finished.is_set():
+            return
+    if finished.is_set() or process.poll() is not None:
+        return
+    logger.info(f"停止录制, 通知FFmpeg结束: {process.pid}")
+    try:
+        process.stdin.write("q\n")
+        process.stdin.flush()
+    except (OSError, ValueError):
+        pass
+    try:
+        process.wait(stop_timeout)
+        return
+    except subprocess.TimeoutExpired:
+        pass
+    logger.warning(f"FFmpeg {process.pid} 未在 {stop_timeout}s 内结束, 强制终止")
+    process.terminate()
+    try:
+        process.wait(2)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def recode(
+    url: str,
+    proxy: str = "",
+    save_file_path: str = "",
+    nick_name: str = "",
+    max_time_limit: int = 3600,
+    rotate: bool = False,
+    output_format: str = "mp4",
+    progress_interval: float = 60,
+    stop_event: threading.Event | None = None,
+    stop_timeout: float = 10,
+):
     """
     录制Twitch流媒体
 
@@ -12,6 +77,12 @@ def recode(url: str, proxy: str = "", save_file_path: str = "", nick_name: str =
         proxy (str): 代理设置
         save_file_path (str): 保存文件路径
         nick_name (str): 昵称
+        max_time_limit (int): 最大录制时长(秒), 轮转模式下为单个文件的时长
+        rotate (bool): 是否使用segment输出按时长轮转文件, 同一个ffmpeg进程持续录制到直播结束
+        output_format (str): 输出格式, mp4 / ts / fmp4, 见OUTPUT_FORMATS
+        progress_interval (float): 输出录制进度摘要的间隔(秒), 0表示不输出
+        stop_event (threading.Event | None): 置位后让ffmpeg正常结束录制
+        stop_timeout (float): 停止时等待ffmpeg写完文件的时长(秒), 超时后强制终止
 
     Returns:
         bool: 录制是否成功
@@ -36,6 +107,7 @@ def recode(url: str, proxy: str = "", save_file_path: str = "", nick_name: str =
             "-rw_timeout", rw_timeout,
             # "-loglevel", "error",
             "-hide_banner",
+            "-nostats", "-progress", "pipe:1",  # 进度以key=value块写到stdout, 不再输出统计行
             "-user_agent", user_agent,
             "-protocol_whitelist", "rtmp,crypto,file,http,https,tcp,tls,udp,rtp,httpproxy",
             "-thread_queue_size", "1024",
@@ -61,7 +133,8 @@ def recode(url: str, proxy: str = "", save_file_path: str = "", nick_name: str =
         if proxy:
             ffmpeg_command.extend(["-http_proxy", proxy])
 
-        if max_time_limit and max_time_limit >= 0:
+        rotate = rotate and bool(max_time_limit and max_time_limit > 0)
+        if max_time_limit and max_time_limit >= 0 and not rotate:
             ffmpeg_command.extend(["-t", str(max_time_limit)])
 
         if not save_file_path:
@@ -70,7 +143,25 @@ def recode(url: str, proxy: str = "", save_file_path: str = "", nick_name: str =
             else:
                 save_file_path = "./twitch_stream.mp4"
 
-        ffmpeg_command.extend(["-f", "mp4", save_file_path])
+        output = get_output_format(output_format)
+        if rotate:
+            # 在关键帧处切分为多个文件, 输入连接不中断
+            root, ext = os.path.splitext(save_file_path)
+            save_file_path = f"{root}_part%03d{ext}"
+            ffmpeg_command.extend([
+                "-f", "segment",
+                "-segment_time", str(max_time_limit),
+                "-segment_start_number", "1",
+                "-reset_timestamps", "1",
+                "-segment_format", output["muxer"],
+            ])
+            if output["options"]:
+                # segment封装器通过segment_format_options把参数传给每个文件的封装器
+                ffmpeg_command.extend(["-segment_format_options", f"movflags={output['options'][1]}"])
+            ffmpeg_command.append(save_file_path)
+        else:
+            ffmpeg_command.extend(output["options"])
+            ffmpeg_command.extend(["-f", output["muxer"], save_file_path])
 
         # 输出命令行参数
         str_command = [str(item) for item in ffmpeg_command]
@@ -96,18 +187,33 @@ def recode(url: str, proxy: str = "", save_file_path: str = "", nick_name: str =
         logger.info(f"开始录制流媒体到: {save_file_path}")
         logger.info(f"FFmpeg进程ID: {process.pid}")
 
-        # 实时输出日志
-        while process.poll() is None and recording_active:
-            try:
-                if process.stdout:
-                    line = process.stdout.readline()
-                    if line:
-                        line = line.strip()
-                        if line:
-                            logger.debug(line)
-            except Exception as e:
-                logger.error(f"读取FFmpeg输出时出错: {e}")
-                break
+        # 解析进度输出, 其它输出只在TRACE级别记录, 保留最后几行用于错误提示
+        stats = RecordingStats(nick_name or os.path.basename(save_file_path), save_file_path)
+        progress_logger = ProgressLogger(stats, progress_interval)
+        recent_lines = deque(maxlen=20)
+        recording_stats.register(stats)
+        finished = threading.Event()
+        if stop_event is not None:
+            threading.Thread(
+                target=_watch_stop, args=(process, stop_event, stop_timeout, finished), name="FFmpegStop", daemon=True
+            ).start()
+        try:
+            for line in process.stdout:
+                line = line.strip()
+                if not line:
+                    continue
+                if stats.feed(line):
+                    if line.startswith("progress="):
+                        progress_logger.maybe_log()
+                else:
+                    recent_lines.append(line)
+                    logger.trace(line)
+        except Exception as e:
+            logger.error(f"读取FFmpeg输出时出错: {e}")
+        finally:
+            recording_stats.unregister(stats)
+        process.wait()
+        logger.info(stats.summary())
 
         # 检查录制结果
         if not recording_active:
@@ -117,7 +223,10 @@ def recode(url: str, proxy: str = "", save_file_path: str = "", nick_name: str =
             logger.info(f"流媒体录制成功,保存路径: {save_file_path}")
             return True
         else:
-            logger.error(f"流媒体录制失败 f{save_file_path},错误码: {process.returncode}")
+            logger.error(f"流媒体录制失败 {save_file_path},错误码: {process.returncode}, 输出: {' | '.join(recent_lines)}")
+            # 一点数据都没有写入时多半是代理不可用, 计入代理池的失败次数
+            if proxy and stats.total_size == 0 and (pool := get_proxy_pool()) is not None:
+                pool.report_failure(proxy)
             return False
 
     except Exception as e:
@@ -130,12 +239,130 @@ def recode(url: str, proxy: str = "", save_file_path: str = "", nick_name: str =
             process.kill()
         return False
     finally:
+        if "finished" in locals():
+            finished.set()
         # 确保进程被终止
         if "process" in locals() and process.poll() is None:
             try:
                 process.terminate()
-                time.sleep(1)
-                if process.poll() is None:
-                    process.kill()
+                process.wait(1)
+            except subprocess.TimeoutExpired:
+                process.kill()
             except Exception:
                 pass
+
+
+def remux_file(src_path: str, dst_path: str, timeout: int | None = None) -> bool:
+    """
+    使用ffmpeg将录制文件无损转封装为faststart的mp4
+
+    Args:
+        src_path (str): 源文件路径
+        dst_path (str): 目标文件路径
+        timeout (int | None): 超时时间(秒)
+
+    Returns:
+        bool: 转封装是否成功
+    """
+    # fmt: off
+    ffmpeg_command = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-i", src_path,
+        "-map", "0",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        "-f", "mp4", dst_path,
+    ]
+    # fmt: on
+    logger.debug(f"执行命令: {' '.join(ffmpeg_command)}")
+    try:
+        result = subprocess.run(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout)
+    except Exception as e:
+        logger.error(f"转封装 {src_path} 时发生错误: {e}")
+        return False
+
+    if result.returncode != 0 or not os.path.isfile(dst_path) or os.path.getsize(dst_path) == 0:
+        logger.error(f"转封装 {src_path} 失败, 错误码: {result.returncode}, 输出: {result.stdout.strip()}")
+        return False
+
+    logger.info(f"转封装完成: {dst_path}")
+    return True
+
+
+def concat_files(src_paths: list[str], dst_path: str, timeout: int | None = None) -> bool:
+    """
+    使用ffmpeg concat将多个轮转文件无损合并为一个faststart的mp4
+
+    Args:
+        src_paths (list[str]): 按顺序排列的源文件路径
+        dst_path (str): 目标文件路径
+        timeout (int | None): 超时时间(秒)
+
+    Returns:
+        bool: 合并是否成功
+    """
+    list_path = f"{dst_path}.concat.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for src_path in src_paths:
+            escaped = os.path.abspath(src_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    # fmt: off
+    ffmpeg_command = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0",
+        "-i", list_path,
+        "-map", "0",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        "-f", "mp4", dst_path,
+    ]
+    # fmt: on
+    logger.debug(f"执行命令: {' '.join(ffmpeg_command)}")
+    try:
+        result = subprocess.run(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout)
+    except Exception as e:
+        logger.error(f"合并 {len(src_paths)} 个文件时发生错误: {e}")
+        return False
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+
+    if result.returncode != 0 or not os.path.isfile(dst_path) or os.path.getsize(dst_path) == 0:
+        logger.error(f"合并到 {dst_path} 失败, 错误码: {result.returncode}, 输出: {result.stdout.strip()}")
+        return False
+
+    logger.info(f"合并完成: {dst_path}")
+    return True
+
+
+def verify_media_file(path: str, timeout: int = 60) -> bool:
+    """
+    检查输出文件是否可用: 文件非空, 且ffprobe能读出时长(未安装ffprobe时只检查大小)
+
+    Args:
+        path (str): 文件路径
+        timeout (int): ffprobe超时时间(秒)
+
+    Returns:
+        bool: 文件是否可用
+    """
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return False
+    if not shutil.which("ffprobe"):
+        return True
+
+    # fmt: off
+    ffprobe_command = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        path,
+    ]
+    # fmt: on
+    try:
+        result = subprocess.run(ffprobe_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout)
+        return result.returncode == 0 and float(result.stdout.strip() or 0) > 0
+    except (subprocess.SubprocessError, ValueError, OSError) as e:
+        logger.error(f"校验 {path} 失败: {e}")
+        return False
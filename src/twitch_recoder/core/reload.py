@@ -0,0 +1,103 @@
+"""
+配置热加载后的处理
+
+uids的增删由轮询引擎在下一次调度时同步(thread模式每轮直接读取config.uids),
+这里负责已删除频道的录制、需要重建状态的组件, 以及提示只在重启后生效的配置项。
+proxy、max_time_limit等在创建录制任务时读取的配置对之后的新录制直接生效。
+"""
+
+from loguru import logger
+
+from twitch_recoder.common.taskManager import recode_task_manager
+from twitch_recoder.common.utils import reload_proxy_pool
+from twitch_recoder.config.my_config import config
+from twitch_recoder.core.archive import archive_mover
+from twitch_recoder.core.storage import get_storage_manager
+
+
+REMOVED_CHANNEL_POLICIES = ("finish", "stop")
+
+# 在启动时创建线程池、服务或读取状态文件的配置项, 修改后需要重启
+RESTART_REQUIRED = (
+    "poll_engine",
+    "poll_interval",
+    "max_poll_interval",
+    "poll_backoff_factor",
+    "poll_hot_window",
+    "max_polls_per_second",
+    "liveness_batch_size",
+    "max_concurrency",
+    "http_pool_connections",
+    "http_pool_maxsize",
+    "dns_cache_ttl",
+    "schedule_state_path",
+    "postprocess_workers",
+    "postprocess_max_retries",
+    "postprocess_retry_delay",
+    "postprocess_queue_path",
+    "metrics_host",
+    "metrics_port",
+    "check_workers",
+    "check_queue_size",
+    "rate_limit_global",
+    "rate_limit_gql",
+    "rate_limit_usher",
+    "rate_limit_per_proxy",
+    "rate_limit_max_retries",
+    "rate_limit_backoff",
+    "archive_queue_path",
+    "config_reload_interval",
+    "control_socket",
+    "gql_url",
+    "usher_url",
+)
+
+
+def apply_uid_changes(old_uids: list[str], new_uids: list[str]):
+    """按removed_channel_policy处理已删除频道正在进行的录制"""
+    added = [uid for uid in new_uids if uid not in old_uids]
+    removed = [uid for uid in old_uids if uid not in new_uids]
+    if added:
+        logger.info(f"新增频道: {', '.join(added)}")
+    if not removed:
+        return
+    logger.info(f"移除频道: {', '.join(removed)}")
+
+    policy = config.removed_channel_policy
+    if policy not in REMOVED_CHANNEL_POLICIES:
+        logger.error(f"不支持的removed_channel_policy: {policy}, 可选: {', '.join(REMOVED_CHANNEL_POLICIES)}")
+        policy = "finish"
+    for uid in removed:
+        for task in recode_task_manager.find_tasks_by_uid(uid):
+            if policy == "stop":
+                logger.info(f"频道 {uid} 已从配置中移除, 停止录制任务 {task.task_id}")
+                task.stop()
+            else:
+                logger.info(f"频道 {uid} 已从配置中移除, 录制任务 {task.task_id} 将在直播结束后退出")
+
+
+def apply_config_changes(changes: dict[str, tuple]):
+    """ConfigWatcher的监听函数"""
+    if "uids" in changes:
+        old_uids, new_uids = changes["uids"]
+        apply_uid_changes(old_uids or [], new_uids or [])
+
+    if {"data_path", "min_free_space", "disk_reserve_horizon"} & changes.keys():
+        get_storage_manager().configure(config.data_paths, config.min_free_space, config.disk_reserve_horizon)
+        logger.info(f"录制目录已更新: {config.data_paths}")
+
+    if {"proxies", "proxy_check_url", "proxy_check_interval", "proxy_max_failures"} & changes.keys():
+        reload_proxy_pool()
+
+    if "archive_bandwidth" in changes:
+        archive_mover.bandwidth = config.archive_bandwidth
+    if "archive_path" in changes:
+        if archive_mover.enabled and config.archive_path:
+            # 已在队列中的文件仍迁移到原来的目录
+            archive_mover.archive_path = config.archive_path
+        else:
+            logger.warning("开启或关闭归档需要重启后生效")
+
+    restart = [key for key in RESTART_REQUIRED if key in changes]
+    if restart:
+        logger.warning(f"以下配置项需要重启后生效: {', '.join(restart)}")
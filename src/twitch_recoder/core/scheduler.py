@@ -0,0 +1,269 @@
+"""
+自适应频道轮询调度模块
+
+按每个频道的历史决定下一次检测时间: 持续未开播时指数退避, 接近其常见开播时间时加快检测,
+并对全局检测速率设置上限
+"""
+
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Iterable
+
+from loguru import logger
+
+
+SECONDS_PER_DAY = 24 * 3600
+SECONDS_PER_WEEK = 7 * SECONDS_PER_DAY
+
+
+def _circular_distance(a: float, b: float, period: float) -> float:
+    diff = abs(a - b) % period
+    return min(diff, period - diff)
+
+
+class ChannelHistory:
+    """单个频道的开播历史"""
+
+    # 只保留最近的开播时间点
+    MAX_LIVE_STARTS = 32
+
+    def __init__(self, offline_streak: int = 0, live_starts: list[float] | None = None):
+        self.offline_streak = offline_streak
+        self.live_starts: list[float] = live_starts or []
+
+    def record_live(self, timestamp: float):
+        self.offline_streak = 0
+        self.live_starts.append(timestamp)
+        del self.live_starts[: -self.MAX_LIVE_STARTS]
+
+    def is_hot(self, timestamp: float, window: float) -> bool:
+        """当前时间是否接近该频道常见的开播时间
+
+        同一周内同一时刻开播过一次, 或每天同一时刻开播过两次以上, 都视为常见开播时间。
+        """
+        if not self.live_starts or window <= 0:
+            return False
+        daily_hits = 0
+        for start in self.live_starts:
+            if _circular_distance(start % SECONDS_PER_WEEK, timestamp % SECONDS_PER_WEEK, SECONDS_PER_WEEK) <= window:
+                return True
+            if _circular_distance(start % SECONDS_PER_DAY, timestamp % SECONDS_PER_DAY, SECONDS_PER_DAY) <= window:
+                daily_hits += 1
+        return daily_hits >= 2
+
+    def to_dict(self) -> dict:
+        return {"offline_streak": self.offline_streak, "live_starts": self.live_starts}
+
+
+class PollScheduler:
+    """基于优先队列的频道检测调度器
+
+    堆中保存(下次检测时间, 序号, uid), 重新调度时采用惰性删除: 只有与_next_time一致的条目才有效。
+    正在录制的频道不在堆中, 录制结束后通过release()重新加入。
+    通过控制命令停止录制的频道被suppress()标记, 仍按正常间隔检测但不再录制, 直到检测到下播或resume()。
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 10,
+        max_interval: float = 600,
+        backoff_factor: float = 1.5,
+        hot_window: float = 1800,
+        max_polls_per_second: float = 20,
+        state_path: str = "",
+    ):
+        self.min_interval = max(1, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.backoff_factor = max(1.0, backoff_factor)
+        self.hot_window = hot_window
+        self.max_polls_per_second = max_polls_per_second
+        self.state_path = state_path
+
+        self._lock = threading.Lock()
+        self._heap: list[tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._next_time: dict[str, float] = {}
+        self._parked: set[str] = set()
+        self._suppressed: set[str] = set()
+        self._history: dict[str, ChannelHistory] = {}
+
+        # 全局速率限制使用令牌桶, 容量为一秒的配额
+        self._allowance = float(self._burst)
+        self._last_refill = time.monotonic()
+
+        if self.state_path:
+            self.load()
+
+    @property
+    def _burst(self) -> float:
+        return max(1.0, self.max_polls_per_second)
+
+    def _schedule(self, uid: str, when: float):
+        self._parked.discard(uid)
+        self._next_time[uid] = when
+        heapq.heappush(self._heap, (when, next(self._counter), uid))
+
+    def sync(self, uids: Iterable[str]):
+        """与配置中的UID列表同步: 新频道立即检测, 已删除的频道停止调度"""
+        uids = set(uids)
+        now = time.time()
+        with self._lock:
+            for uid in uids:
+                if uid not in self._next_time and uid not in self._parked:
+                    self._history.setdefault(uid, ChannelHistory())
+                    self._schedule(uid, now)
+            for uid in [uid for uid in self._next_time if uid not in uids]:
+                del self._next_time[uid]
+            self._parked &= uids
+            self._suppressed &= uids
+
+    def pop_due(self, now: float | None = None) -> list[str]:
+        """取出已到检测时间的频道, 数量受全局速率限制"""
+        now = now or time.time()
+        with self._lock:
+            if self.max_polls_per_second > 0:
+                mono = time.monotonic()
+                self._allowance = min(
+                    self._burst, self._allowance + (mono - self._last_refill) * self.max_polls_per_second
+                )
+                self._last_refill = mono
+                budget = int(self._allowance)
+            else:
+                budget = len(self._heap)
+
+            due = []
+            while self._heap and len(due) < budget and self._heap[0][0] <= now:
+                when, _, uid = heapq.heappop(self._heap)
+                if self._next_time.get(uid) != when:
+                    continue
+                del self._next_time[uid]
+                self._parked.add(uid)
+                due.append(uid)
+
+            if self.max_polls_per_second > 0:
+                self._allowance -= len(due)
+            return due
+
+    def next_due_in(self, now: float | None = None) -> float | None:
+        """距下一个有效检测时间的秒数, 没有待检测频道时返回None"""
+        now = now or time.time()
+        with self._lock:
+            while self._heap and self._next_time.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - now)
+
+    def next_interval(self, uid: str, now: float | None = None) -> float:
+        """根据频道历史计算下一次检测间隔"""
+        now = now or time.time()
+        history = self._history.setdefault(uid, ChannelHistory())
+        if history.is_hot(now, self.hot_window):
+            return self.min_interval
+        interval = self.min_interval * (self.backoff_factor**history.offline_streak)
+        return min(self.max_interval, interval)
+
+    def record_offline(self, uid: str):
+        """频道未开播: 增加退避并重新调度"""
+        now = time.time()
+        with self._lock:
+            history = self._history.setdefault(uid, ChannelHistory())
+            history.offline_streak += 1
+            self._suppressed.discard(uid)
+            if uid in self._parked:
+                self._schedule(uid, now + self.next_interval(uid, now))
+
+    def record_error(self, uid: str):
+        """检测失败: 不改变退避, 按最短间隔重试"""
+        with self._lock:
+            if uid in self._parked:
+                self._schedule(uid, time.time() + self.min_interval)
+
+    def record_live(self, uid: str):
+        """频道开播并已交给录制: 记录开播时间, 录制期间不再检测"""
+        with self._lock:
+            self._history.setdefault(uid, ChannelHistory()).record_live(time.time())
+            self._parked.add(uid)
+            self._next_time.pop(uid, None)
+
+    def poll_now(self, uids: Iterable[str]) -> int:
+        """立即检测指定频道, 正在录制的频道除外
+
+        Returns:
+            int: 安排检测的频道数
+        """
+        now = time.time()
+        count = 0
+        with self._lock:
+            for uid in uids:
+                if uid in self._parked or (uid not in self._next_time and uid not in self._history):
+                    continue
+                self._schedule(uid, now)
+                count += 1
+        return count
+
+    def park(self, uid: str):
+        """已在录制的频道暂停调度, 录制结束后由release重新加入"""
+        with self._lock:
+            self._parked.add(uid)
+            self._next_time.pop(uid, None)
+
+    def release(self, uid: str):
+        """录制结束后重新加入调度, 主播可能很快重新开播"""
+        with self._lock:
+            if uid in self._parked:
+                self._schedule(uid, time.time() + self.min_interval)
+
+    def suppress(self, uid: str):
+        """手动停止录制后不再自动录制该频道, 直到检测到下播或resume()"""
+        with self._lock:
+            self._suppressed.add(uid)
+
+    def resume(self, uids: Iterable[str]):
+        """取消suppress(), 之后检测到开播时正常录制"""
+        with self._lock:
+            self._suppressed.difference_update(uids)
+
+    def is_suppressed(self, uid: str) -> bool:
+        with self._lock:
+            return uid in self._suppressed
+
+    def parked_uids(self) -> list[str]:
+        """正在检测或录制、暂不在队列中的频道"""
+        with self._lock:
+            return list(self._parked)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._next_time)
+
+    def save(self):
+        """保存频道历史, 重启后继续使用"""
+        if not self.state_path:
+            return
+        with self._lock:
+            data = {uid: history.to_dict() for uid, history in self._history.items()}
+        try:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"保存调度历史失败: {e}")
+
+    def load(self):
+        if not self.state_path or not os.path.isfile(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r") as f:
+                data = json.load(f)
+            with self._lock:
+                for uid, item in data.items():
+                    self._history[uid] = ChannelHistory(**item)
+            logger.info(f"已加载 {len(data)} 个频道的调度历史")
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"读取调度历史失败: {e}")
@@ -0,0 +1,153 @@
+"""
+录制存储卷管理模块
+
+data_path可以配置多个卷。新的录制按"剩余空间 - 已预留空间"最多、写入任务最少的卷分配,
+并按流的码率(StreamInfo.bandwidth)为接下来reserve_horizon秒的写入预留空间;
+所有卷都放不下时先尝试更低的画质, 仍然放不下则拒绝本次录制, 而不是等磁盘写满后所有ffmpeg一起失败。
+"""
+
+import os
+import shutil
+import threading
+import time
+
+from loguru import logger
+
+from twitch_recoder.config.my_config import config
+from twitch_recoder.types.typeinfo import StreamInfo
+
+
+# 播放列表没有BANDWIDTH时按8Mbps估算
+DEFAULT_BANDWIDTH = 8_000_000
+
+
+class Reservation:
+    def __init__(self, owner: str, volume: str, rate: float, horizon: float):
+        self.owner = owner
+        self.volume = volume
+        # 写入速率(字节/秒)
+        self.rate = rate
+        self.horizon = horizon
+        self.start_time = time.monotonic()
+
+    def remaining(self) -> float:
+        """尚未写入的预留字节数, 已写入的部分已经反映在磁盘剩余空间里"""
+        elapsed = time.monotonic() - self.start_time
+        return self.rate * max(0.0, self.horizon - elapsed)
+
+
+class StorageManager:
+    """多卷空间分配和预留"""
+
+    def __init__(self, volumes: list[str], min_free_space: int = 5 * 1024**3, reserve_horizon: float = 3600):
+        self.volumes = list(dict.fromkeys(volumes))
+        self.min_free_space = min_free_space
+        self.reserve_horizon = reserve_horizon
+        self._lock = threading.Lock()
+        self._reservations: dict[str, Reservation] = {}
+
+    def configure(self, volumes: list[str], min_free_space: int, reserve_horizon: float):
+        """配置变化时更新卷列表, 已有的预留保留到对应录制结束"""
+        with self._lock:
+            self.volumes = list(dict.fromkeys(volumes))
+            self.min_free_space = min_free_space
+            self.reserve_horizon = reserve_horizon
+
+    def free_space(self, volume: str) -> int:
+        try:
+            os.makedirs(volume, exist_ok=True)
+            return shutil.disk_usage(volume).free
+        except OSError as e:
+            logger.error(f"读取 {volume} 剩余空间失败: {e}")
+            return 0
+
+    def _device(self, volume: str) -> int | str:
+        try:
+            return os.stat(volume).st_dev
+        except OSError:
+            return volume
+
+    def _reserved(self, volume: str) -> tuple[float, int]:
+        """返回(卷所在文件系统上的预留字节数, 写入该目录的任务数)
+
+        多个目录位于同一文件系统时共享剩余空间, 预留也要合并计算
+        """
+        device = self._device(volume)
+        reserved = 0.0
+        writers = 0
+        for item in self._reservations.values():
+            if item.volume == volume:
+                writers += 1
+            if item.volume == volume or self._device(item.volume) == device:
+                reserved += item.remaining()
+        return reserved, writers
+
+    def _pick_volume(self, need: float) -> str | None:
+        """选出能容纳need字节的卷中可用空间最多的, 可用空间相近时选写入任务少的"""
+        best = None
+        best_key = None
+        for volume in self.volumes:
+            reserved, writers = self._reserved(volume)
+            available = self.free_space(volume) - reserved - self.min_free_space
+            if available < need:
+                continue
+            # 以1GB为粒度比较可用空间, 相差不大时优先写入任务少的卷
+            key = (int(available // 1024**3), -writers)
+            if best_key is None or key > best_key:
+                best, best_key = volume, key
+        return best
+
+    def reserve(
+        self, owner: str, streams: list[StreamInfo], horizon: float | None = None
+    ) -> tuple[StreamInfo, str] | None:
+        """
+        为新录制选择卷并预留空间
+
+        Args:
+            owner (str): 预留的标识, 释放时使用
+            streams (list[StreamInfo]): 最佳流及码率依次降低的候选流, 放不下时依次降级
+            horizon (float | None): 预计录制时长(秒), 默认reserve_horizon
+
+        Returns:
+            tuple[StreamInfo, str] | None: (实际录制的流, 卷目录), 所有卷都放不下时返回None
+        """
+        horizon = horizon or self.reserve_horizon
+        with self._lock:
+            for stream in streams:
+                rate = (stream.bandwidth or DEFAULT_BANDWIDTH) / 8
+                volume = self._pick_volume(rate * horizon)
+                if volume is None:
+                    continue
+                self._reservations[owner] = Reservation(owner, volume, rate, horizon)
+                if stream is not streams[0]:
+                    logger.warning(f"存储空间不足, {owner} 降级为 {stream.name or stream.resolution} 录制")
+                return stream, volume
+        logger.error(f"所有存储卷空间不足, 拒绝录制 {owner}")
+        return None
+
+    def release(self, owner: str):
+        with self._lock:
+            self._reservations.pop(owner, None)
+
+    def snapshot(self) -> list[dict]:
+        """各卷的剩余空间、预留空间和写入任务数"""
+        with self._lock:
+            result = []
+            for volume in self.volumes:
+                reserved, writers = self._reserved(volume)
+                result.append({"volume": volume, "free": self.free_space(volume), "reserved": reserved, "writers": writers})
+            return result
+
+
+_storage_manager: StorageManager | None = None
+_storage_manager_lock = threading.Lock()
+
+
+def get_storage_manager() -> StorageManager:
+    """获取全局存储卷管理器, 首次调用时按配置创建"""
+    global _storage_manager
+    if _storage_manager is None:
+        with _storage_manager_lock:
+            if _storage_manager is None:
+                _storage_manager = StorageManager(config.data_paths, config.min_free_space, config.disk_reserve_horizon)
+    return _storage_manager
@@ -1,14 +1,21 @@
+import asyncio
 import json
 import os
 import time
-import click
 import signal
 import sys
-import keyboard
 from loguru import logger
+from twitch_recoder.common.control import resolve_socket_path, socket_record_path
+from twitch_recoder.common.utils import get_proxy_pool
+from twitch_recoder.core.archive import archive_mover, archive_postprocess_output
+from twitch_recoder.core.control import ControlServer
 from twitch_recoder.common.taskManager import process_task_manager, recode_task_manager
 from twitch_recoder.config.my_config import DEFAULT_CONFIG
-from twitch_recoder.core.process import process
+from twitch_recoder.core.engine import PollEngine
+from twitch_recoder.core.postprocess import postprocess_manager
+from twitch_recoder.core.process import process, request_poll, shutdown_check_executor, suppress_uid
+from twitch_recoder.core.reload import apply_config_changes
+from twitch_recoder.core.scheduler import PollScheduler
 
 
 def main(config_path: str, verbose: bool, quiet: bool, data_path: str = "data"):
@@ -30,7 +37,7 @@ def main(config_path: str, verbose: bool, quiet: bool, data_path: str = "data"):
         with open("config/config.json", "w") as f:
             json.dump(DEFAULT_CONFIG, f, indent=4)
         return
-    from twitch_recoder.config.my_config import ConfigReader, config
+    from twitch_recoder.config.my_config import ConfigReader, ConfigWatcher, config
 
     config_reader = ConfigReader(config_path)
     config_reader.load_config()
@@ -41,11 +48,16 @@ def main(config_path: str, verbose: bool, quiet: bool, data_path: str = "data"):
     logger.info(f"开始处理Twitch频道: {config_path}")
 
     # 设置信号处理器
+    shutting_down = False
+
     def signal_handler(signum, frame):
-        """处理中断信号"""
+        """处理中断信号, 由下面的finally统一停止任务; 关闭过程中再次收到信号时立即退出"""
+        nonlocal shutting_down
+        if shutting_down:
+            logger.warning(f"再次收到信号 {signum}，立即退出")
+            os._exit(1)
+        shutting_down = True
         logger.info(f"收到信号 {signum}，正在优雅关闭...")
-        process_task_manager.shutdown()
-        recode_task_manager.shutdown()
         sys.exit(0)
 
     # 注册信号处理器
@@ -57,15 +69,75 @@ def main(config_path: str, verbose: bool, quiet: bool, data_path: str = "data"):
         """当按下Ctrl+P时显示任务状态"""
         logger.info(f"所有的process任务: {process_task_manager.get_all_tasks()}")
         logger.info(f"所有的recode任务: {recode_task_manager.get_all_tasks()}")
+        logger.info(f"所有的后处理任务: {postprocess_manager.get_all_jobs()}")
+        logger.info(f"所有的归档任务: {archive_mover.get_all_jobs()}")
+
+    # 注册快捷键, keyboard是可选依赖, 在Linux上还需要root权限; 不可用时使用 twitch-recoder status
+    try:
+        import keyboard
+
+        keyboard.add_hotkey('ctrl+p', on_ctrl_p)
+    except Exception as e:
+        logger.debug(f"Ctrl+P快捷键不可用: {e}")
+
+    postprocess_manager.configure(
+        config.postprocess_workers,
+        config.postprocess_max_retries,
+        config.postprocess_retry_delay,
+        config.postprocess_queue_path or os.path.join(config.data_paths[0], "postprocess_queue.json"),
+    )
+    archive_mover.configure(
+        config.archive_path,
+        config.archive_bandwidth,
+        config.postprocess_max_retries,
+        config.postprocess_retry_delay,
+        config.archive_queue_path or os.path.join(config.data_paths[0], "archive_queue.json"),
+    )
+    postprocess_manager.add_done_callback(archive_postprocess_output)
 
-    # 注册快捷键
-    keyboard.add_hotkey('ctrl+p', on_ctrl_p)
+    config_watcher = ConfigWatcher(config_reader, config.config_reload_interval)
+    config_watcher.add_listener(apply_config_changes)
+    # 套接字路径在启动时确定并记录, 不随热加载的data_path/control_socket变化
+    control_server = ControlServer(
+        resolve_socket_path(config.control_socket, config.data_path),
+        request_poll,
+        suppress_uid,
+        record_path=socket_record_path(config_path),
+    )
 
+    engine = None
     try:
+        for data_path in config.data_paths:
+            os.makedirs(data_path, exist_ok=True)
+        postprocess_manager.start()
+        archive_mover.start()
+        config_watcher.start()
+        control_server.start()
+        proxy_pool = get_proxy_pool()
+        if proxy_pool is not None:
+            proxy_pool.start()
+        if config.metrics_port:
+            from twitch_recoder.core.monitor import start_metrics_server
+
+            start_metrics_server(config.metrics_host, config.metrics_port)
         logger.info("启动所有任务...")
-        while True:
-            process()
-            time.sleep(10)
+        if config.poll_engine == "thread":
+            while True:
+                process()
+                time.sleep(config.poll_interval)
+        else:
+            scheduler = PollScheduler(
+                min_interval=config.poll_interval,
+                max_interval=config.max_poll_interval,
+                backoff_factor=config.poll_backoff_factor,
+                hot_window=config.poll_hot_window,
+                max_polls_per_second=config.max_polls_per_second,
+                state_path=config.schedule_state_path,
+            )
+            engine = PollEngine(config.max_concurrency, config.poll_interval, config.liveness_batch_size, scheduler)
+            control_server.poll_handler = engine.request_poll
+            control_server.suppress_handler = engine.suppress
+            asyncio.run(engine.run())
 
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
@@ -75,16 +147,25 @@ def main(config_path: str, verbose: bool, quiet: bool, data_path: str = "data"):
         logger.error(f"发生未预期的错误: {e}")
         sys.exit(1)
     finally:
+        config_watcher.stop()
+        control_server.stop()
         process_task_manager.shutdown()
-        recode_task_manager.shutdown()
-
-
-@click.command()
-@click.option("--config", "-c", type=click.Path(exists=True), help="配置文件路径")
-@click.option("--verbose", "-v", is_flag=True, help="显示详细日志")
-@click.option("--quiet", "-q", is_flag=True, help="只显示错误信息")
-def cli(config: str, verbose: bool, quiet: bool):
-    main(config, verbose, quiet)
+        # 先停止开播检测并等待进行中的检测结束, 避免停止录制的同时又有新的录制开始
+        shutdown_check_executor()
+        if engine is not None:
+            engine.shutdown()
+        # 停止录制时产生的后处理任务只排队保存, 不再启动新的ffmpeg, 下次启动时执行
+        postprocess_manager.stop_dispatch()
+        # 同时通知所有录制结束并并行等待; 每个ffmpeg在shutdown_timeout后自行强制终止, 这里多留几秒
+        recording_count = len(recode_task_manager.get_running_tasks())
+        start = time.monotonic()
+        unfinished = recode_task_manager.shutdown(config.shutdown_timeout + 5)
+        if recording_count:
+            logger.info(f"已停止 {recording_count - len(unfinished)}/{recording_count} 个录制, 耗时 {time.monotonic() - start:.1f}s")
+        if unfinished:
+            logger.warning(f"以下录制未能在超时前结束: {[task.task_id for task in unfinished]}")
+        postprocess_manager.shutdown(config.shutdown_timeout)
+        archive_mover.shutdown()
 
 
 if __name__ == "__main__":
@@ -6,6 +6,9 @@ class StreamInfo:
     codecs: str
     uid: str
     nickname: str
+    group_id: str
+    name: str
+    variants: list["StreamInfo"]
 
     def __init__(
         self,
@@ -24,9 +27,63 @@ class StreamInfo:
         self.bandwidth = bandwidth
         self.frame_rate = frame_rate
         self.codecs = codecs
+        # 对应#EXT-X-MEDIA的GROUP-ID和NAME, 如 chunked / 1080p60 (source)
+        self.group_id = ""
+        self.name = ""
+        # 最佳流及同一播放列表中码率更低的流(按带宽从高到低), 用于录制中途切换和降级
+        self.variants = []
 
     def __str__(self) -> str:
-        return f"StreamInfo(uid={self.uid}, nickname={self.nickname}, resolution={self.resolution}, bandwidth={self.bandwidth}, frame_rate={self.frame_rate}, codecs={self.codecs})"
+        return f"StreamInfo(uid={self.uid}, nickname={self.nickname}, name={self.name}, resolution={self.resolution}, bandwidth={self.bandwidth}, frame_rate={self.frame_rate}, codecs={self.codecs})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class MediaSegment:
+    sequence: int
+    url: str
+    duration: float
+    title: str
+
+    def __init__(self, sequence: int, url: str, duration: float, title: str = ""):
+        self.sequence = sequence
+        self.url = url
+        self.duration = duration
+        self.title = title
+
+    @property
+    def is_ad(self) -> bool:
+        """Twitch插入的广告分片标题以Amazon开头"""
+        return self.title.startswith("Amazon")
+
+    def __str__(self) -> str:
+        return f"MediaSegment(sequence={self.sequence}, duration={self.duration}, title={self.title})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+class MediaPlaylist:
+    media_sequence: int
+    target_duration: float
+    segments: list[MediaSegment]
+    ended: bool
+
+    def __init__(
+        self,
+        media_sequence: int = 0,
+        target_duration: float = 0.0,
+        segments: list[MediaSegment] | None = None,
+        ended: bool = False,
+    ):
+        self.media_sequence = media_sequence
+        self.target_duration = target_duration
+        self.segments = segments or []
+        self.ended = ended
+
+    def __str__(self) -> str:
+        return f"MediaPlaylist(media_sequence={self.media_sequence}, target_duration={self.target_duration}, segments={len(self.segments)}, ended={self.ended})"
 
     def __repr__(self) -> str:
         return self.__str__()
@@ -0,0 +1,29 @@
+"""不存在的频道按未开播处理, 调度器照常退避"""
+
+import time
+
+from twitch_recoder.api.twitch_api import _parse_channel_shell
+from twitch_recoder.core.scheduler import PollScheduler
+
+
+MISSING = {
+    "data": {"userOrError": {"userDoesNotExist": "ghost", "reason": "UNKNOWN", "__typename": "UserDoesNotExist"}}
+}
+
+
+def test_missing_user_is_offline():
+    assert _parse_channel_shell(MISSING, "ghost") == ("ghost", False)
+    assert _parse_channel_shell({"errors": [{"message": "service timeout"}]}, "ghost") is None
+
+
+def test_missing_user_backs_off_to_max_interval():
+    scheduler = PollScheduler(min_interval=10, max_interval=60, backoff_factor=2, max_polls_per_second=0)
+    scheduler.sync(["ghost"])
+    now = time.time()
+    intervals = []
+    for _ in range(5):
+        assert scheduler.pop_due(now + 10_000) == ["ghost"]
+        assert _parse_channel_shell(MISSING, "ghost")[1] is False
+        scheduler.record_offline("ghost")
+        intervals.append(scheduler.next_interval("ghost", now))
+    assert intervals == [20, 40, 60, 60, 60]
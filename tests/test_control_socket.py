@@ -0,0 +1,23 @@
+"""热加载修改data_path后, 命令行客户端仍然连接守护进程启动时的套接字"""
+
+import json
+
+from twitch_recoder.common.control import resolve_socket_path, send_command, socket_path_from_config, socket_record_path
+from twitch_recoder.core.control import ControlServer
+
+
+def test_client_finds_pinned_socket_after_data_path_change(tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"data_path": str(tmp_path / "old")}))
+    record_path = socket_record_path(str(config_path))
+    server = ControlServer(resolve_socket_path("", str(tmp_path / "old")), record_path=record_path)
+    assert server.start()
+    try:
+        config_path.write_text(json.dumps({"data_path": str(tmp_path / "new")}))
+        socket_path = socket_path_from_config(str(config_path))
+        assert socket_path == str(tmp_path / "old" / "control.sock")
+        assert send_command(socket_path, "list")["tasks"] == []
+    finally:
+        server.stop()
+    # 守护进程退出后回退到按配置文件计算的路径
+    assert socket_path_from_config(str(config_path)) == str(tmp_path / "new" / "control.sock")
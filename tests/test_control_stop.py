@@ -0,0 +1,127 @@
+"""stop命令停止录制后, 仍在直播的频道不应被立即重新录制"""
+
+import asyncio
+import time
+
+import pytest
+
+from twitch_recoder.common.taskManager import Task, TaskType, recode_task_manager
+from twitch_recoder.core import engine as engine_module
+from twitch_recoder.core import process as process_module
+from twitch_recoder.core.control import ControlServer
+from twitch_recoder.core.engine import PollEngine
+from twitch_recoder.core.scheduler import PollScheduler
+
+
+UID = "streamer"
+
+
+def _wait_for_stop(stop_event):
+    stop_event.wait(5)
+    return True
+
+
+@pytest.fixture
+def recordings(monkeypatch):
+    """替换submit_recode_task, 每次提交启动一个在stop()之前一直运行的录制任务"""
+    submitted: list[Task] = []
+
+    def fake_submit(uid, best_stream):
+        task = Task(f"recode_{uid}_{len(submitted)}", uid, TaskType.RECODE, _wait_for_stop)
+        task.args = (task.stop_event,)
+        recode_task_manager.add_task(task)
+        task.start()
+        submitted.append(task)
+        return True
+
+    async def fake_stream(uid, executor, nickname=None):
+        return object()
+
+    monkeypatch.setattr(engine_module, "submit_recode_task", fake_submit)
+    monkeypatch.setattr(engine_module, "process_twitch_stream_async", fake_stream)
+    yield submitted
+    for task in submitted:
+        task.stop()
+        task.join(5)
+
+
+def _stop(server: ControlServer, recordings: list[Task]):
+    server.handle({"command": "stop", "uid": UID})
+    for task in recordings:
+        task.join(5)
+    assert not recode_task_manager.find_task_by_uid(UID)
+
+
+def test_async_engine_does_not_rerecord_after_stop(monkeypatch, recordings):
+    live = {UID: True}
+
+    async def fake_check_liveness(self, uids):
+        return {uid: (uid, live[uid]) for uid in uids}
+
+    monkeypatch.setattr(PollEngine, "check_liveness", fake_check_liveness)
+    engine = PollEngine(poll_interval=1, scheduler=PollScheduler(min_interval=1, max_polls_per_second=0))
+    server = ControlServer("", suppress_handler=engine.suppress)
+    recode_task_manager.add_done_callback(engine._on_recode_done)
+
+    async def poll_due() -> int:
+        # 录制结束后release()把频道排在min_interval之后, 直接取出该时间点到期的频道
+        due = engine.scheduler.pop_due(time.time() + 2)
+        return await engine.poll_uids(due) if due else 0
+
+    async def scenario():
+        engine._semaphore = asyncio.Semaphore(4)
+        engine.scheduler.sync([UID])
+        assert await poll_due() == 1
+
+        _stop(server, recordings)
+        # 仍在直播: 继续检测但不再录制
+        assert await poll_due() == 0
+        assert await poll_due() == 0
+        assert len(recordings) == 1
+
+        # 下播后恢复, 再次开播时正常录制
+        live[UID] = False
+        assert await poll_due() == 0
+        live[UID] = True
+        assert await poll_due() == 1
+
+        # 指定频道的poll命令同样恢复自动录制
+        _stop(server, recordings)
+        assert await poll_due() == 0
+        assert engine.request_poll([UID]) == 1
+        assert await poll_due() == 1
+        assert len(recordings) == 3
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        recode_task_manager.remove_done_callback(engine._on_recode_done)
+        engine._executor.shutdown(wait=False)
+
+
+def test_thread_engine_does_not_rerecord_after_stop(monkeypatch):
+    live = {UID: True}
+    submitted = []
+
+    class FakeExecutor:
+        def submit(self, func, task, keys=None, force=False):
+            submitted.append(task)
+            process_module.process_task_manager.remove_task(task)
+            return object()
+
+    monkeypatch.setattr(process_module, "_suppressed_uids", set())
+    monkeypatch.setattr(
+        process_module, "check_liveness", lambda uids, batch_size: {uid: (uid, live[uid]) for uid in uids}
+    )
+    monkeypatch.setattr(process_module, "get_check_executor", FakeExecutor)
+    server = ControlServer("", suppress_handler=process_module.suppress_uid)
+
+    server.handle({"command": "stop", "uid": UID})
+    process_module.check_batch([UID])
+    assert submitted == []
+
+    live[UID] = False
+    process_module.check_batch([UID])
+    live[UID] = True
+    process_module.check_batch([UID])
+    assert [task.uid for task in submitted] == [UID]
@@ -0,0 +1,72 @@
+"""任务状态与TaskManager状态索引保持一致"""
+
+import sys
+import threading
+
+from twitch_recoder.common.taskManager import Task, TaskManager, TaskStatus, TaskType
+
+
+def _buckets(manager: TaskManager, task: Task) -> list[TaskStatus]:
+    with manager._lock:
+        return [status for status, bucket in manager._by_status.items() if task.task_id in bucket]
+
+
+def test_concurrent_stop_keeps_one_status_bucket():
+    manager = TaskManager()
+    tasks = [Task(f"task_{index}", f"uid_{index}", TaskType.RECODE, lambda: True) for index in range(2000)]
+    for task in tasks:
+        manager.add_task(task)
+
+    barrier = threading.Barrier(2)
+
+    def run_all():
+        barrier.wait()
+        for task in tasks:
+            task.run()
+
+    def stop_all():
+        barrier.wait()
+        for task in tasks:
+            task.stop()
+
+    # 频繁切换线程, 让run()和stop()的状态写入尽量交错
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=run_all), threading.Thread(target=stop_all)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    for task in tasks:
+        assert _buckets(manager, task) == [task.status]
+    assert sum(manager.count_by_status().values()) == len(tasks)
+
+
+def test_status_listener_runs_outside_manager_lock():
+    manager = TaskManager()
+    task = Task("task", "uid", TaskType.RECODE, lambda: True)
+    manager.add_task(task)
+    seen = []
+
+    def listener(task, old, new):
+        # 其它线程能在监听者执行期间获取管理器的锁
+        acquired = []
+
+        def try_lock():
+            if manager._lock.acquire(timeout=1):
+                manager._lock.release()
+                acquired.append(True)
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        seen.append((old, new, bool(acquired)))
+
+    task.add_status_listener(listener)
+    task.stop()
+    assert seen == [(TaskStatus.QUEUED, TaskStatus.SHUTDOWN, True)]
+    assert manager.get_shutdown_tasks() == [task]